@@ -0,0 +1,271 @@
+import argparse
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+
+# SUPPORTED INDEX VARIANTS
+#   flat     : EXACT INNER PRODUCT (WHAT THE NOTEBOOK BUILDS)
+#   ivf_flat : INVERTED FILE , FULL VECTORS IN EACH LIST          (TUNE WITH nprobe)
+#   hnsw     : HIERARCHICAL NAVIGABLE SMALL WORLD GRAPH            (TUNE WITH ef_search)
+#   ivf_pq   : INVERTED FILE + PRODUCT QUANTIZED CODES (SMALLEST)  (TUNE WITH nprobe)
+#   sq_fp16  : EXHAUSTIVE SCAN OF FLOAT16 CODES                    (2 BYTES PER DIMENSION)
+#   sq_int8  : EXHAUSTIVE SCAN OF INT8 SCALAR-QUANTIZED CODES      (1 BYTE PER DIMENSION)
+#   pq       : EXHAUSTIVE SCAN OF PRODUCT QUANTIZED CODES          (pq_m * pq_bits / 8 BYTES PER VECTOR)
+INDEX_KINDS = ("flat", "ivf_flat", "hnsw", "ivf_pq", "sq_fp16", "sq_int8", "pq")
+
+# KINDS WHOSE SCORES ARE APPROXIMATE (WORTH RESCORING WITH THE EXACT VECTORS , SEE ArticleCatalog.rescore)
+LOSSY_KINDS = ("ivf_pq", "sq_fp16", "sq_int8", "pq")
+
+
+# DEFAULT NUMBER OF INVERTED LISTS (~4 * SQRT(N) , FAISS GUIDELINE)
+def default_nlist(n_vectors):
+    return int(max(1, min(65536, 4 * math.sqrt(n_vectors))))
+
+
+# BUILD AND FILL AN INDEX OF THE GIVEN KIND
+def build_index(embeddings : np.ndarray, kind : str = "flat", nlist : int | None = None, hnsw_m : int = 32,
+                ef_construction : int = 200, pq_m : int = 16, pq_bits : int = 8, train_size : int | None = None, seed : int = 0):
+
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"unknown index kind {kind!r}, expected one of {INDEX_KINDS}")
+
+    embeddings = np.ascontiguousarray(embeddings, dtype = np.float32)
+    n, d = embeddings.shape
+
+    if kind == "flat":
+        index = faiss.IndexFlatIP(d)
+
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(d, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+
+    elif kind in ("sq_fp16", "sq_int8"):
+        qtype = faiss.ScalarQuantizer.QT_fp16 if kind == "sq_fp16" else faiss.ScalarQuantizer.QT_8bit
+        index = faiss.IndexScalarQuantizer(d, qtype, faiss.METRIC_INNER_PRODUCT)
+
+    elif kind == "pq":
+        index = faiss.IndexPQ(d, pq_m, pq_bits, faiss.METRIC_INNER_PRODUCT)
+
+    else:
+        nlist = nlist or default_nlist(n)
+        quantizer = faiss.IndexFlatIP(d)
+
+        if kind == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, pq_m, pq_bits, faiss.METRIC_INNER_PRODUCT)
+
+        train_size = train_size or 256 * nlist
+
+    # TRAIN ON A RANDOM SAMPLE (IVF : 256 POINTS PER LIST IS PLENTY , PQ / SQ : 256 PER CENTROID , AT LEAST 64K)
+    if not index.is_trained:
+        train_size = min(n, train_size or max(256 * 2 ** pq_bits, 65536))
+        sample = embeddings if train_size >= n else embeddings[np.random.default_rng(seed).choice(n, train_size, replace = False)]
+        index.train(sample)
+
+    index.add(embeddings)
+    return index
+
+
+# THE INDEX UNDER AN IndexIDMap (A COMPACTED INDEX , SEE compact_index) , ELSE THE INDEX ITSELF
+def unwrap(index):
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+
+
+# KIND OF A LOADED INDEX
+def index_kind(index):
+
+    index = unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq_fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq_int8"
+    if isinstance(index, faiss.IndexPQ):
+        return "pq"
+    return "flat"
+
+
+# PER-QUERY SEARCH PARAMETERS (NONE = USE WHAT IS STORED IN THE INDEX)
+#   selector : OPTIONAL faiss.IDSelector , ONLY THE IDS IT ACCEPTS CAN BE RETURNED (FILTERED SEARCH)
+def search_params(index, nprobe : int | None = None, ef_search : int | None = None, selector = None):
+
+    extra = {} if selector is None else {"sel": selector}
+    index = unwrap(index)      # AN IndexIDMap PASSES THE PARAMETERS DOWN (AND TRANSLATES THE SELECTOR TO ITS LABELS)
+
+    if isinstance(index, faiss.IndexIVF) and (nprobe is not None or selector is not None):
+        return faiss.SearchParametersIVF(nprobe = int(nprobe or index.nprobe), **extra)
+
+    if isinstance(index, faiss.IndexHNSW) and (ef_search is not None or selector is not None):
+        return faiss.SearchParametersHNSW(efSearch = int(ef_search or index.hnsw.efSearch), **extra)
+
+    if selector is not None:
+        return faiss.SearchParameters(**extra)
+
+    return None
+
+
+# nprobe / ef_search FOR A FILTERED SEARCH THAT KEEPS A FRACTION `selectivity` OF THE INDEX
+#   A PROBED LIST / VISITED NODE ONLY YIELDS ~selectivity IN-FILTER CANDIDATES , SO LOOK AT 1 / selectivity TIMES MORE
+def filtered_search_params(index, selectivity : float, nprobe : int | None = None, ef_search : int | None = None, max_ef_search : int = 4096):
+
+    scale = 1.0 / max(selectivity, 1e-6)
+    index = unwrap(index)
+
+    if isinstance(index, faiss.IndexIVF):
+        nprobe = min(index.nlist, math.ceil((nprobe or index.nprobe) * scale))
+
+    if isinstance(index, faiss.IndexHNSW):
+        ef_search = min(max_ef_search, math.ceil((ef_search or index.hnsw.efSearch) * scale))
+
+    return nprobe, ef_search
+
+
+# EXACT SCORES OF INDEX HITS (ONE GATHER FROM THE , POSSIBLY MEMORY-MAPPED , EXACT EMBEDDINGS) , BEST k KEPT
+def rescore(embeddings : np.ndarray, queries : np.ndarray, found : np.ndarray, k : int):
+
+    valid = found >= 0
+    vectors = embeddings[np.where(valid, found, 0)]
+
+    scores = np.einsum("nd,nkd->nk", np.asarray(queries, dtype = np.float32), vectors)
+    scores[~valid] = -np.inf
+
+    order = np.argsort(-scores, axis = 1, kind = "stable")[:, :k]
+    return np.take_along_axis(scores, order, axis = 1), np.take_along_axis(found, order, axis = 1)
+
+
+# BEST k OF SEVERAL (scores , ids) HIT LISTS FOR THE SAME QUERIES (e.g. BASE INDEX + DELTA SEGMENT) , PADDED LIKE faiss (-1 , -inf)
+def merge_hits(k : int, *hits):
+
+    scores = np.concatenate([np.where(found >= 0, scores, -np.inf).astype(np.float32) for scores, found in hits], axis = 1)
+    found = np.concatenate([found for _, found in hits], axis = 1)
+
+    order = np.argsort(-scores, axis = 1, kind = "stable")[:, :k]
+    scores, found = np.take_along_axis(scores, order, axis = 1), np.take_along_axis(found, order, axis = 1)
+
+    if found.shape[1] < k:
+        pad = k - found.shape[1]
+        scores = np.pad(scores, ((0, 0), (0, pad)), constant_values = -np.inf)
+        found = np.pad(found, ((0, 0), (0, pad)), constant_values = -1)
+
+    return scores, found
+
+
+# SAME KIND OF INDEX OVER `rows` OF `embeddings` ONLY , LABELLED WITH THOSE ROWS (AN IndexIDMap , SEARCHES RETURN ROWS)
+#   TRAINED QUANTIZERS (IVF CENTROIDS , PQ / SQ CODEBOOKS) AND SEARCH SETTINGS ARE KEPT , NOTHING IS RETRAINED
+def compact_index(index, embeddings, rows, chunk_size : int = 65536):
+
+    inner = unwrap(index)
+
+    if isinstance(inner, faiss.IndexHNSW):
+        fresh = faiss.IndexHNSWFlat(inner.d, inner.hnsw.nb_neighbors(1), inner.metric_type)
+        fresh.hnsw.efConstruction, fresh.hnsw.efSearch = inner.hnsw.efConstruction, inner.hnsw.efSearch
+    elif index_kind(inner) == "flat":
+        fresh = faiss.IndexFlat(inner.d, inner.metric_type)
+    else:
+        fresh = faiss.clone_index(inner)
+        fresh.reset()
+
+    compacted = faiss.IndexIDMap(fresh)
+    rows = np.asarray(rows, dtype = np.int64)
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        compacted.add_with_ids(np.ascontiguousarray(embeddings[chunk], dtype = np.float32), chunk)
+
+    return compacted
+
+
+# ADD VECTORS OF CATALOG ROWS `rows` (AN IndexIDMap LABELS THEM , ANY OTHER INDEX NUMBERS THEM IN ORDER : rows MUST BE ITS TAIL)
+def add_rows(index, vectors : np.ndarray, rows : np.ndarray):
+
+    if isinstance(index, faiss.IndexIDMap):
+        index.add_with_ids(vectors, np.asarray(rows, dtype = np.int64))
+    else:
+        index.add(vectors)
+
+
+# SELECTOR ACCEPTING THE ROWS WHERE `mask` IS TRUE , RETURNED WITH ITS PACKED BITMAP (KEEP IT REFERENCED UNTIL THE SEARCH RETURNS)
+def mask_selector(mask : np.ndarray):
+
+    bitmap = np.packbits(np.asarray(mask, dtype = bool), bitorder = "little")
+    return faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap)), bitmap
+
+
+# SEARCH WITH OPTIONAL PER-REQUEST TUNING
+def search(index, queries : np.ndarray, k : int, nprobe : int | None = None, ef_search : int | None = None, selector = None):
+
+    params = search_params(index, nprobe = nprobe, ef_search = ef_search, selector = selector)
+
+    if params is None:
+        return index.search(queries, k)
+
+    return index.search(queries, k, params = params)
+
+
+# LOAD AN INDEX FILE AND APPLY DEFAULT RUNTIME PARAMETERS
+def load_index(path, nprobe : int | None = None, ef_search : int | None = None, io_flags : int = 0):
+
+    index = faiss.read_index(str(path), io_flags)
+
+    if nprobe is not None and isinstance(index, faiss.IndexIVF):
+        index.nprobe = int(nprobe)
+
+    if ef_search is not None and isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = int(ef_search)
+
+    return index
+
+
+# DEFAULT TUNING OF ONE ENDPOINT , OVERRIDABLE FROM ENVIRONMENT (e.g. PERSONALIZATION_NPROBE=32)
+def endpoint_search_params(endpoint : str, nprobe : int = 16, ef_search : int = 64, horizon_days : int | None = None):
+
+    prefix = endpoint.upper()
+    horizon_days = os.getenv(f"{prefix}_HORIZON_DAYS", horizon_days)
+
+    return {"nprobe": int(os.getenv(f"{prefix}_NPROBE", nprobe)),
+            "ef_search": int(os.getenv(f"{prefix}_EF_SEARCH", ef_search)),
+            "horizon_days": int(horizon_days) if horizon_days else None}
+
+
+# SERIALIZED SIZE OF THE INDEX (CLOSE TO ITS RESIDENT MEMORY)
+def index_memory_bytes(index):
+    return int(faiss.serialize_index(index).nbytes)
+
+
+# OFFLINE BUILD COMMAND
+#   python -m app.ann_index --source ../news_embeddings.faiss --kind hnsw --out ../news_embeddings.hnsw.faiss
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Build an ANN index from the exact (flat) news embedding index")
+    parser.add_argument("--source", required = True, help = "flat FAISS index holding the exact embeddings")
+    parser.add_argument("--kind", choices = INDEX_KINDS, required = True)
+    parser.add_argument("--out", required = True)
+    parser.add_argument("--nlist", type = int, default = None)
+    parser.add_argument("--hnsw-m", type = int, default = 32)
+    parser.add_argument("--ef-construction", type = int, default = 200)
+    parser.add_argument("--pq-m", type = int, default = 16)
+    parser.add_argument("--pq-bits", type = int, default = 8)
+    args = parser.parse_args(argv)
+
+    source = faiss.read_index(args.source)
+    embeddings = source.reconstruct_n(0, source.ntotal)
+
+    start = time.perf_counter()
+    index = build_index(embeddings, kind = args.kind, nlist = args.nlist, hnsw_m = args.hnsw_m,
+                        ef_construction = args.ef_construction, pq_m = args.pq_m, pq_bits = args.pq_bits)
+    elapsed = time.perf_counter() - start
+
+    faiss.write_index(index, args.out)
+    print(f"built {args.kind} index over {index.ntotal} vectors in {elapsed:.1f}s "
+          f"({index_memory_bytes(index) / 2**20:.1f} MiB) -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import faiss
+import numpy as np
+
+from . import ann_index
+
+
+# FAISS OPENMP THREADS PER WORKER PROCESS
+# N UVICORN WORKERS x M FAISS THREADS SHOULD NOT EXCEED THE NUMBER OF CORES , OTHERWISE THEY FIGHT EACH OTHER
+def configure_faiss_threads(threads : int | None = None, workers : int | None = None):
+
+    if threads is None:
+        threads = os.getenv("FAISS_THREADS")
+
+    if threads is None:
+        workers = workers or int(os.getenv("WEB_CONCURRENCY", 1))
+        threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+
+    faiss.omp_set_num_threads(int(threads))
+    return int(threads)
+
+
+# ONE PENDING QUERY
+class _PendingSearch:
+
+    __slots__ = ("index", "vector", "k", "nprobe", "ef_search", "future")
+
+    def __init__(self, index, vector, k, nprobe, ef_search):
+        self.index = index
+        self.vector = vector
+        self.k = k
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.future = Future()
+
+
+# MICRO-BATCHING DISPATCHER IN FRONT OF FAISS
+# CONCURRENT REQUESTS PUT THEIR SESSION VECTOR IN A QUEUE , ONE BACKGROUND THREAD COLLECTS EVERYTHING THAT
+# ARRIVES WITHIN `window_ms` (OR UNTIL `max_batch` VECTORS) AND RUNS IT AS ONE MULTI-ROW SEARCH
+class SearchBatcher:
+
+    def __init__(self, max_batch : int = 64, window_ms : float = 2.0):
+
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+
+        # COUNTERS (FOR LOAD TESTS / METRICS)
+        self.batches = 0
+        self.queries = 0
+
+        self._thread = threading.Thread(target = self._run, name = "faiss-search-batcher", daemon = True)
+        self._thread.start()
+
+    # BLOCKING SEARCH OF ONE (1 , d) QUERY , SAME RETURN VALUE AS index.search
+    def search(self, index, vector, k, nprobe = None, ef_search = None, timeout : float | None = None):
+
+        if self._closed:
+            return ann_index.search(index, vector, k, nprobe = nprobe, ef_search = ef_search)
+
+        pending = _PendingSearch(index, np.asarray(vector, dtype = np.float32).reshape(-1), k, nprobe, ef_search)
+        self._queue.put(pending)
+
+        return pending.future.result(timeout = timeout)
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout = remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            # QUERIES CAN ONLY SHARE A SEARCH CALL IF THEY HIT THE SAME INDEX WITH THE SAME TUNING
+            groups = {}
+            for pending in batch:
+                groups.setdefault((id(pending.index), pending.nprobe, pending.ef_search), []).append(pending)
+
+            for group in groups.values():
+                self._search_group(group)
+
+    def _search_group(self, group):
+
+        head = group[0]
+        k = max(pending.k for pending in group)
+
+        try:
+            queries = np.ascontiguousarray(np.stack([pending.vector for pending in group]))
+            scores, index = ann_index.search(head.index, queries, k, nprobe = head.nprobe, ef_search = head.ef_search)
+        except Exception as error:
+            for pending in group:
+                pending.future.set_exception(error)
+            return
+
+        self.batches += 1
+        self.queries += len(group)
+
+        for row, pending in enumerate(group):
+            pending.future.set_result((scores[row:row + 1, :pending.k], index[row:row + 1, :pending.k]))
+
+
+# BATCHER FROM ENVIRONMENT (SEARCH_BATCHING=1 , SEARCH_BATCH_MAX , SEARCH_BATCH_WINDOW_MS) , NONE WHEN DISABLED
+def batcher_from_env():
+
+    if os.getenv("SEARCH_BATCHING", "0").lower() not in ("1", "true", "yes"):
+        return None
+
+    return SearchBatcher(max_batch = int(os.getenv("SEARCH_BATCH_MAX", 64)),
+                         window_ms = float(os.getenv("SEARCH_BATCH_WINDOW_MS", 2.0)))
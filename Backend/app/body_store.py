@@ -0,0 +1,201 @@
+import fcntl
+import os
+import threading
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+
+# COLUMNS THE RANKERS AND FEED RESPONSES ACTUALLY USE , EVERYTHING ELSE STAYS OUT OF THE HOT FRAME
+RANKING_COLUMNS = ["id", "title", "source", "image", "url", "date", "topic_id", "category", "confidence", "summary"]
+
+BODY_FILE = "bodies.bin"
+INDEX_FILE = "bodies.idx.npz"
+LOG_FILE = "bodies.log"
+LOG_RECORD_BYTES = 24     # (id , offset , length) AS int64
+
+
+# ARTICLE BODIES ON DISK , READ ONLY WHEN /news/{article_id} ASKS FOR ONE
+#   bodies.bin     : ZLIB-COMPRESSED UTF-8 BODIES , ONE AFTER ANOTHER (APPEND-ONLY)
+#   bodies.idx.npz : ids / offsets / lengths ARRAYS (ID -> BYTE RANGE) + log_position (LOG BYTES ALREADY FOLDED INTO IT)
+#   bodies.log     : (id , offset , length) RECORDS OF APPENDED BODIES (APPEND-ONLY) , FOLDED INTO THE INDEX EVERY
+#                    compact_rows RECORDS , SO AN INGEST WRITES A FEW BYTES INSTEAD OF THE WHOLE INDEX
+# LOOKUP IS ONE HASH PROBE + ONE pread , HOT ARTICLES ARE SERVED FROM A BOUNDED LRU
+class ArticleBodyStore:
+
+    def __init__(self, directory, cache_size : int = 1024, compact_rows : int = 10000):
+
+        self.directory = Path(directory)
+        self.compact_rows = compact_rows
+        self._lock = threading.Lock()
+        self._cache = LRUCache(maxsize = cache_size)
+
+        self._load_index()
+        self._refresh()
+
+        self._fd = os.open(self.directory / BODY_FILE, os.O_RDONLY)
+
+    def __len__(self):
+        return len(self._ids) + len(self._recent)
+
+    def _load_index(self):
+
+        path = self.directory / INDEX_FILE
+        stat = path.stat()
+        index = np.load(path)
+
+        self._ids = index["ids"].astype(np.int64)
+        self._offsets = index["offsets"].astype(np.int64)
+        self._lengths = index["lengths"].astype(np.int64)
+        self._id_index = pd.Index(self._ids)
+        self._log_position = int(index["log_position"]) if "log_position" in index.files else 0
+        self._index_version = (stat.st_ino, stat.st_mtime_ns)
+        self._recent = {}         # ID -> (OFFSET , LENGTH) FROM THE LOG PAST log_position (NEWER THAN THE INDEX)
+
+    # WRITE A NEW STORE (OVERWRITES)
+    @classmethod
+    def build(cls, directory, ids, bodies, cache_size : int = 1024):
+
+        directory = Path(directory)
+        directory.mkdir(parents = True, exist_ok = True)
+
+        ids = np.asarray(ids, dtype = np.int64)
+        offsets = np.zeros(len(ids), dtype = np.int64)
+        lengths = np.zeros(len(ids), dtype = np.int64)
+
+        with open(directory / BODY_FILE, "wb") as sink:
+            position = 0
+            for i, body in enumerate(bodies):
+                blob = compress(body)
+                sink.write(blob)
+                offsets[i], lengths[i] = position, len(blob)
+                position += len(blob)
+
+        (directory / LOG_FILE).unlink(missing_ok = True)
+        write_index(directory, ids, offsets, lengths)
+        return cls(directory, cache_size = cache_size)
+
+    # PICK UP BODIES APPENDED BY OTHER PROCESSES SHARING THE DIRECTORY (AND AN INDEX ONE OF THEM COMPACTED)
+    def refresh(self):
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+
+        stat = (self.directory / INDEX_FILE).stat()
+        if (stat.st_ino, stat.st_mtime_ns) != self._index_version:
+            self._load_index()
+            self._cache.clear()
+
+        log_path = self.directory / LOG_FILE
+        if not log_path.exists():
+            return
+
+        with open(log_path, "rb") as source:
+            source.seek(self._log_position)
+            data = source.read()
+
+        # WHOLE RECORDS ONLY (A RECORD BEING WRITTEN IS READ NEXT TIME)
+        complete = len(data) - len(data) % LOG_RECORD_BYTES
+        for article_id, offset, length in np.frombuffer(data[:complete], dtype = np.int64).reshape(-1, 3).tolist():
+            self._recent[article_id] = (offset, length)
+            self._cache.pop(article_id, None)
+        self._log_position += complete
+
+    # FOLD THE LOG RECORDS INTO bodies.idx.npz (CALLED UNDER THE DATA FILE flock)
+    def _compact(self):
+
+        ids = np.fromiter(self._recent.keys(), dtype = np.int64, count = len(self._recent))
+        ranges = np.asarray(list(self._recent.values()), dtype = np.int64).reshape(-1, 2)
+
+        self._ids = np.concatenate([self._ids, ids])
+        self._offsets = np.concatenate([self._offsets, ranges[:, 0]])
+        self._lengths = np.concatenate([self._lengths, ranges[:, 1]])
+        self._id_index = pd.Index(self._ids)
+        self._recent = {}
+
+        write_index(self.directory, self._ids, self._offsets, self._lengths, log_position = self._log_position)
+        stat = (self.directory / INDEX_FILE).stat()
+        self._index_version = (stat.st_ino, stat.st_mtime_ns)
+
+    # BODY OF ONE ARTICLE , NONE IF UNKNOWN
+    def get(self, article_id):
+
+        article_id = int(article_id)
+
+        with self._lock:
+            if article_id in self._cache:
+                return self._cache[article_id]
+            recent = self._recent.get(article_id)
+            ids_index, offsets, lengths = self._id_index, self._offsets, self._lengths
+
+        # LATEST VERSION OF AN ID WINS (RE-INGESTED ARTICLES ARE APPENDED AGAIN , THE LOG IS NEWER THAN THE INDEX)
+        if recent is not None:
+            offset, length = recent
+        else:
+            positions = ids_index.get_indexer_for([article_id])
+            if len(positions) == 0 or positions[-1] < 0:
+                return None
+            offset, length = int(offsets[positions[-1]]), int(lengths[positions[-1]])
+
+        body = decompress(os.pread(self._fd, length, offset))
+
+        with self._lock:
+            self._cache[article_id] = body
+
+        return body
+
+    # APPEND BODIES OF NEWLY INGESTED ARTICLES : DATA , THEN ONE LOG RECORD PER BODY (NOTHING IS REWRITTEN)
+    def append(self, ids, bodies):
+
+        ids = np.asarray(ids, dtype = np.int64)
+        if len(ids) == 0:
+            return
+
+        blobs = [compress(body) for body in bodies]
+        lengths = np.asarray([len(blob) for blob in blobs], dtype = np.int64)
+
+        # flock ON THE DATA FILE : WORKERS SHARING ONE DIRECTORY NEVER INTERLEAVE THEIR APPENDS , LOG RECORDS OR COMPACTIONS
+        with self._lock, open(self.directory / BODY_FILE, "ab") as sink:
+            fcntl.flock(sink, fcntl.LOCK_EX)
+
+            start = sink.seek(0, os.SEEK_END)
+            for blob in blobs:
+                sink.write(blob)
+            sink.flush()
+
+            offsets = start + np.r_[0, np.cumsum(lengths)[:-1]].astype(np.int64)
+            with open(self.directory / LOG_FILE, "ab") as log:
+                log.write(np.column_stack([ids, offsets, lengths]).astype(np.int64).tobytes())
+
+            self._refresh()
+            if len(self._recent) >= self.compact_rows:
+                self._compact()
+
+
+# WRITE THE ID -> BYTE RANGE INDEX (TEMP FILE + RENAME , READERS NEVER SEE A HALF-WRITTEN INDEX)
+def write_index(directory, ids, offsets, lengths, log_position : int = 0):
+
+    tmp = Path(directory) / (INDEX_FILE + ".tmp")
+    with open(tmp, "wb") as sink:
+        np.savez(sink, ids = ids, offsets = offsets, lengths = lengths, log_position = np.int64(log_position))
+    os.replace(tmp, Path(directory) / INDEX_FILE)
+
+
+def compress(body):
+    text = "" if body is None or (isinstance(body, float) and np.isnan(body)) else str(body)
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def decompress(blob):
+    return zlib.decompress(blob).decode("utf-8")
+
+
+# MOVE THE `content` COLUMN INTO A BODY STORE , RETURNS (RANKING FRAME , STORE)
+def split_bodies(df : pd.DataFrame, directory, cache_size : int = 1024):
+
+    store = ArticleBodyStore.build(directory, df["id"].to_numpy(), df["content"].tolist(), cache_size = cache_size)
+    return df[[col for col in RANKING_COLUMNS if col in df.columns]], store
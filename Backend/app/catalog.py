@@ -0,0 +1,333 @@
+import os
+import copy
+
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+
+from . import ann_index
+
+
+EPOCH = pd.Timestamp("1970-01-01", tz = "UTC")
+SECONDS_PER_DAY = 86400.0
+
+# FILTERED SEARCHES OVER AT MOST THIS MANY ROWS SCORE THE SUBSET EXACTLY (ABOVE IT : INDEX + ID SELECTOR)
+EXACT_FILTER_ROWS = int(os.getenv("EXACT_FILTER_ROWS", 10000))
+
+
+# RAISED WHEN NONE OF THE REQUESTED ARTICLES EXIST IN THE CATALOG
+class UnknownArticleError(KeyError):
+
+    def __init__(self, article_ids):
+        self.article_ids = [int(article_id) for article_id in article_ids]
+        super().__init__(f"unknown article ids: {self.article_ids}")
+
+
+# CONVERT DATETIME COLUMN INTO (FRACTIONAL) DAYS SINCE UNIX EPOCH , NaT BECOME NaN
+def to_epoch_days(dates : pd.Series) -> np.ndarray:
+
+    dates = pd.to_datetime(dates, errors = "coerce")
+
+    # NAIVE DATES ARE TREATED AS UTC
+    if dates.dt.tz is None:
+        dates = dates.dt.tz_localize("UTC")
+
+    return ((dates - EPOCH) / pd.Timedelta(days = 1)).to_numpy(dtype = np.float64, na_value = np.nan)
+
+
+# CURRENT TIME IN EPOCH DAYS
+def now_epoch_days(now : datetime | None = None) -> float:
+
+    now = now or datetime.now(timezone.utc)
+    return now.timestamp() / SECONDS_PER_DAY
+
+
+# EMBEDDING MATRIX SPLIT IN ROW SEGMENTS : THE BASE MATRIX (SHARED , OFTEN MEMORY-MAPPED) AND THE BLOCKS APPENDED SINCE
+#   READ LIKE AN ARRAY THROUGH GATHERS (embeddings[rows] , ANY SHAPE OF ROWS) , SO APPENDING NEVER COPIES THE BASE
+class SegmentedEmbeddings:
+
+    def __init__(self, segments, max_segments : int = 8):
+        self.segments = [np.ascontiguousarray(segment, dtype = np.float32) for segment in segments]   # NO COPY WHEN ALREADY FLOAT32
+        self.max_segments = max_segments
+        self.starts = np.cumsum([0] + [len(segment) for segment in self.segments])
+        self.shape = (int(self.starts[-1]), self.segments[0].shape[1])
+        self.dtype = np.dtype(np.float32)
+        self.ndim = 2
+
+    def __len__(self):
+        return self.shape[0]
+
+    # SAME ROWS PLUS `block` AT THE END , MORE THAN max_segments -> THE APPENDED ONES ARE MERGED (THE BASE NEVER IS)
+    def append(self, block):
+
+        segments = self.segments + [block]
+        if len(segments) > self.max_segments:
+            segments = [segments[0], np.concatenate(segments[1:])]
+
+        return SegmentedEmbeddings(segments, self.max_segments)
+
+    def __getitem__(self, rows):
+
+        if isinstance(rows, slice):
+            rows = np.arange(*rows.indices(len(self)))
+        rows = np.asarray(rows, dtype = np.int64)
+        flat = rows.reshape(-1)
+
+        out = np.empty((len(flat), self.shape[1]), dtype = np.float32)
+        segment = np.searchsorted(self.starts, flat, side = "right") - 1
+        for i in np.unique(segment).tolist():
+            picked = segment == i
+            out[picked] = self.segments[i][flat[picked] - self.starts[i]]
+
+        return out.reshape(rows.shape + (self.shape[1],))
+
+    # WHOLE MATRIX (A COPY , OFFLINE TOOLS ONLY)
+    def __array__(self, dtype = None, copy = None):
+        return np.concatenate(self.segments).astype(dtype or self.dtype, copy = False)
+
+
+# ARTICLE CATALOG (BUILT ONCE AT STARTUP)
+# HOLDS THE RANKING FRAME , THE FAISS INDEX AND THE ARRAYS THAT THE RANKERS NEED ON EVERY REQUEST
+class ArticleCatalog:
+
+    def __init__(self, df : pd.DataFrame, faiss_index, embeddings : np.ndarray | None = None, active : np.ndarray | None = None,
+                 delta_index = None, index_rows : np.ndarray | None = None):
+
+        # FAISS ROW i MUST BE DATAFRAME ROW i
+        if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+            df = df.reset_index(drop = True)
+
+        self.df = df
+        self.faiss_index = faiss_index
+
+        # OPTIONAL MICRO-BATCHING DISPATCHER FOR SINGLE-QUERY SEARCHES (SEE batching.SearchBatcher)
+        self.batcher = None
+
+        # OPTIONAL TIME-PARTITIONED INDEX FOR RECENCY-BOUNDED SEARCHES (SEE shards.ShardedIndex)
+        self.shards = None
+
+        # COMPRESSED INDEX (SQ / PQ CODES) : THE TOP `rescore` HITS ARE RESCORED WITH THE EXACT EMBEDDINGS (0 = OFF)
+        self.rescore = 0
+        self.lossy_index = ann_index.index_kind(faiss_index) in ann_index.LOSSY_KINDS
+
+        # CONTIGUOUS FLOAT32 EMBEDDING MATRIX (ROW i = ARTICLE IN DATAFRAME ROW i) , SEGMENTED AFTER LIVE APPENDS
+        if embeddings is None:
+            embeddings = faiss_index.reconstruct_n(0, faiss_index.ntotal)
+        self.embeddings = embeddings if isinstance(embeddings, SegmentedEmbeddings) else np.ascontiguousarray(embeddings, dtype = np.float32)
+
+        if len(self.embeddings) != len(df):
+            raise ValueError(f"catalog has {len(df)} rows but {len(self.embeddings)} embeddings")
+
+        # DELTA SEGMENT (SEE ingest.CatalogStore.append) : ROWS [base_rows , len) ARE NOT IN faiss_index , THEY ARE IN THIS
+        # SMALL EXACT INDEX (LOCAL ID i = ROW base_rows + i) , EVERY SEARCH READS BOTH
+        self.delta_index = delta_index
+        self.base_rows = len(df) - (0 if delta_index is None else delta_index.ntotal)
+        self._active_filter = None
+
+        # BASE ROWS IN faiss_index : NONE = ALL (FAISS ID i = ROW i) , ELSE THE SORTED LABELS OF A COMPACTED INDEX (SEE with_index)
+        self.index_rows = index_rows
+
+        # RETRACTED ARTICLES STAY IN THE INDEX (UNTIL IT IS COMPACTED) BUT ARE MASKED OUT EVERYWHERE
+        self.active = np.ones(len(df), dtype = bool) if active is None else np.asarray(active, dtype = bool)
+        self.retracted_count = int(len(df) - self.active.sum())
+        self.index_retracted = self._count_index_retracted()
+
+        # PUBLICATION DATE AS EPOCH DAYS (NO DATETIME ARITHMETIC AT REQUEST TIME)
+        self.epoch_days = to_epoch_days(df["date"])
+
+        # SOURCE AS INTEGER CODES (DIVERSITY RULES COMPARE INTS , NOT STRINGS)
+        self.source_codes, self.sources = pd.factorize(df["source"])
+
+        # HASHED ID -> ROW MAPPING (FIRST ACTIVE OCCURRENCE WINS , SAME AS THE OLD df.index[df["id"] == id][0]
+        # WHEN NOTHING WAS RETRACTED , AND A RE-INGESTED ARTICLE RESOLVES TO ITS NEW ROW)
+        self.ids = df["id"].to_numpy(dtype = np.int64)
+        order = np.lexsort((np.arange(len(self.ids)), ~self.active, self.ids))
+        unique_ids, first = np.unique(self.ids[order], return_index = True)
+
+        if len(unique_ids) == len(self.ids):
+            self._id_index = pd.Index(self.ids)
+            self._id_rows  = np.arange(len(self.ids), dtype = np.int64)
+        else:
+            self._id_index = pd.Index(unique_ids)
+            self._id_rows  = order[first].astype(np.int64)
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def dim(self):
+        return self.embeddings.shape[1]
+
+    # ROW OF EVERY ID (-1 FOR UNKNOWN OR RETRACTED IDS) , ONE VECTORIZED HASH LOOKUP
+    def lookup(self, article_ids):
+
+        positions = self._id_index.get_indexer(np.asarray(article_ids, dtype = np.int64))
+        rows = np.where(positions >= 0, self._id_rows[positions], -1)
+
+        if self.retracted_count:
+            rows[(rows >= 0) & ~self.active[rows]] = -1
+
+        return rows
+
+    # LOOKUP ROWS FOR MANY IDS AT ONCE , RETURNS (ROWS , MISSING IDS)
+    def rows_for(self, article_ids):
+
+        article_ids = np.asarray(list(article_ids), dtype = np.int64)
+        rows = self.lookup(article_ids)
+
+        found = rows >= 0
+        return rows[found], article_ids[~found].tolist()
+
+    # LOOKUP A SINGLE ROW , NONE IF THE ID IS UNKNOWN
+    def row_of(self, article_id):
+
+        row = self.lookup([article_id])[0]
+        return None if row < 0 else int(row)
+
+    # IDS THAT ARE NOT IN THE CATALOG
+    def missing(self, article_ids):
+        return self.rows_for(article_ids)[1]
+
+    # SAME CATALOG WITH SOME ROWS MASKED OUT (O(N) BOOLEAN COPY , NOTHING ELSE IS REBUILT)
+    def with_retracted(self, rows):
+
+        retracted = copy.copy(self)
+        retracted.active = self.active.copy()
+        retracted.active[rows] = False
+        retracted.retracted_count = int(len(self) - retracted.active.sum())
+        retracted.index_retracted = retracted._count_index_retracted()
+        retracted._active_filter = None
+
+        return retracted
+
+    # SAME CATALOG SEARCHING `faiss_index` , A COMPACTED BASE INDEX HOLDING ONLY THE BASE ROWS `index_rows` (LABELLED WITH THEM)
+    def with_index(self, faiss_index, index_rows):
+
+        compacted = copy.copy(self)
+        compacted.faiss_index = faiss_index
+        compacted.index_rows = np.asarray(index_rows, dtype = np.int64)
+        compacted.index_retracted = compacted._count_index_retracted()
+        compacted._active_filter = None
+
+        return compacted
+
+    # RETRACTED ROWS A SEARCH CAN STILL HIT (THE ONES A COMPACTION LEFT OUT OF THE BASE INDEX ARE NOT COUNTED)
+    def _count_index_retracted(self):
+
+        if self.index_rows is None or not self.retracted_count:
+            return self.retracted_count
+        return int((~self.active[self.index_rows]).sum() + (~self.active[self.base_rows:]).sum())
+
+    # ACTIVE ROWS AND AN ID SELECTOR OVER THEIR BASE-INDEX PART , BUILT ON FIRST USE (THE MASK OF A CATALOG NEVER CHANGES)
+    def active_filter(self):
+
+        if self._active_filter is None:
+            self._active_filter = (np.flatnonzero(self.active), ann_index.mask_selector(self.active[:self.base_rows]))
+        return self._active_filter
+
+    # SEARCH THE INDEX , SINGLE QUERIES GO THROUGH THE BATCHER WHEN ONE IS ATTACHED
+    # WITH A horizon_days THE TIME SHARDS INSIDE THE HORIZON ARE SEARCHED INSTEAD (WHEN THEY COVER IT)
+    # RETRACTED ROWS ARE NEVER RETURNED , SO EVERY QUERY GETS k HITS WHEN THE CATALOG HAS k ACTIVE ROWS :
+    #   AT MOST k RETRACTED : OVER-FETCH BY THEIR COUNT AND DROP THEM
+    #   MORE (e.g. AFTER RETENTION) : FILTERED SEARCH OVER THE ACTIVE ROWS (search_rows WITH THE CACHED SELECTOR)
+    #   TIME SHARDS : EACH SHARD IS ASKED FOR AS MANY EXTRA HITS AS IT HOLDS RETRACTED ROWS (ShardedIndex.search WITH THE MASK)
+    def search(self, queries, k, nprobe = None, ef_search = None, horizon_days = None):
+
+        if horizon_days is not None and self.shards is not None and self.shards.covers(horizon_days):
+            active = self.active if self.retracted_count else None
+            return self.shards.search(queries, k, horizon_days, nprobe = nprobe, ef_search = ef_search, active = active)
+
+        if self.index_retracted > k:
+            rows, selector = self.active_filter()
+            return self.search_rows(queries, k, rows, nprobe = nprobe, ef_search = ef_search, selector = selector)
+
+        fetch = k + self.index_retracted
+        rescore = self.rescore if self.lossy_index else 0
+
+        if self.batcher is not None and len(queries) == 1:
+            scores, found = self.batcher.search(self.faiss_index, queries, max(fetch, rescore), nprobe = nprobe, ef_search = ef_search)
+        else:
+            scores, found = ann_index.search(self.faiss_index, queries, max(fetch, rescore), nprobe = nprobe, ef_search = ef_search)
+
+        if rescore:
+            scores, found = self.rescore_hits(queries, found, fetch)
+
+        if self.delta_index is not None:
+            delta_scores, delta_found = self.delta_index.search(np.ascontiguousarray(queries, dtype = np.float32), min(fetch, self.delta_index.ntotal))
+            scores, found = ann_index.merge_hits(fetch, (scores, found), (delta_scores, np.where(delta_found >= 0, delta_found + self.base_rows, -1)))
+
+        return self._drop_inactive(k, scores, found) if self.index_retracted else (scores, found)
+
+    def _drop_inactive(self, k, scores, found):
+
+        keep = found >= 0
+        keep[keep] = self.active[found[keep]]
+        return ann_index.merge_hits(k, (scores, np.where(keep, found, -1)))
+
+    def rescore_hits(self, queries, found, k):
+        return ann_index.rescore(self.embeddings, queries, found, k)
+
+    # SEARCH RESTRICTED TO `rows` (SORTED) , SAME RETURN VALUE AS search() WITH CATALOG ROWS
+    #   FEW ROWS : EXACT SCORES ON THE GATHERED SUBSET , CHEAPER THAN ANY INDEX WALK
+    #   MANY ROWS : INDEX SEARCH WITH AN ID SELECTOR , nprobe / ef_search SCALED BY 1 / SELECTIVITY (SAME NUMBER OF
+    #   IN-FILTER CANDIDATES AS AN UNFILTERED SEARCH) , QUERIES IT STILL LEAVES SHORT ARE REDONE EXACTLY
+    #   selector : OPTIONAL PREBUILT ann_index.mask_selector OF THE BASE PART OF `rows` (e.g. active_filter())
+    def search_rows(self, queries, k, rows, nprobe = None, ef_search = None, selector = None):
+
+        queries = np.ascontiguousarray(queries, dtype = np.float32)
+        rows = np.asarray(rows, dtype = np.int64)
+
+        # ROWS OF THE DELTA SEGMENT ARE FEW : ALWAYS SCORED EXACTLY , MERGED WITH THE FILTERED BASE SEARCH
+        base, delta = rows[rows < self.base_rows], rows[rows >= self.base_rows]
+        if len(rows) <= EXACT_FILTER_ROWS or len(base) == 0:
+            return self._exact_search(queries, k, rows)
+
+        if selector is None:
+            mask = np.zeros(self.base_rows, dtype = bool)
+            mask[base] = True
+            selector = ann_index.mask_selector(mask)
+        nprobe, ef_search = ann_index.filtered_search_params(self.faiss_index, len(base) / max(self.faiss_index.ntotal, 1), nprobe, ef_search)
+        rescore = self.rescore if self.lossy_index else 0
+
+        scores, found = ann_index.search(self.faiss_index, queries, max(k, rescore), nprobe = nprobe, ef_search = ef_search, selector = selector[0])
+        if rescore:
+            scores, found = self.rescore_hits(queries, found, k)
+
+        if len(delta):
+            scores, found = ann_index.merge_hits(k, (scores, found), self._exact_search(queries, k, delta))
+
+        short = (found < 0).any(axis = 1) & (len(rows) >= k)
+        if short.any():
+            scores[short], found[short] = self._exact_search(queries[short], k, rows)
+
+        return scores, found
+
+    def _exact_search(self, queries, k, rows):
+
+        sims = queries @ self.embeddings[rows].T
+        top = min(k, len(rows))
+
+        scores = np.full((len(queries), k), -np.inf, dtype = np.float32)
+        found = np.full((len(queries), k), -1, dtype = np.int64)
+        if top == 0:
+            return scores, found
+
+        best = np.argpartition(-sims, top - 1, axis = 1)[:, :top]
+        best = np.take_along_axis(best, np.argsort(-np.take_along_axis(sims, best, axis = 1), axis = 1, kind = "stable"), axis = 1)
+
+        scores[:, :top] = np.take_along_axis(sims, best, axis = 1)
+        found[:, :top] = rows[best]
+        return scores, found
+
+    # ROWS PUBLISHED IN THE LAST `horizon_days` DAYS (EVERYTHING WHEN horizon_days IS NONE)
+    def within_horizon(self, rows, horizon_days = None, now : datetime | None = None):
+
+        if horizon_days is None:
+            return np.ones(len(rows), dtype = bool)
+        return self.epoch_days[rows] >= now_epoch_days(now) - horizon_days
+
+    # WHOLE DAYS SINCE PUBLICATION (SAME AS (now - date).days)
+    def age_days(self, rows = None, now : datetime | None = None):
+
+        days = self.epoch_days if rows is None else self.epoch_days[rows]
+        return np.floor(now_epoch_days(now) - days)
@@ -0,0 +1,263 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pandas as pd
+
+
+# ================================ ENCODERS ======================================
+
+# ENCODER INTERFACE : encode(texts) -> (len(texts) , dim) FLOAT32 (NOT NECESSARILY NORMALIZED)
+class TextEncoder:
+
+    dim : int
+
+    def encode(self, texts : list) -> np.ndarray:
+        raise NotImplementedError
+
+
+# DETERMINISTIC LOCAL STAND-IN (NO MODEL , NO NETWORK) : SIGNED FEATURE HASHING OF WORDS AND WORD BIGRAMS
+# SAME TEXT -> SAME VECTOR IN EVERY PROCESS (blake2b , NOT THE SALTED BUILTIN hash) , TEXTS SHARING WORDS ARE SIMILAR
+class HashingEncoder(TextEncoder):
+
+    def __init__(self, dim : int = 384):
+        self.dim = dim
+
+    @staticmethod
+    @lru_cache(maxsize = 1 << 16)
+    def _slot(feature : str):
+        digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size = 8).digest(), "little")
+        return digest >> 1, 1.0 if digest & 1 else -1.0
+
+    def encode(self, texts : list) -> np.ndarray:
+
+        vectors = np.zeros((len(texts), self.dim), dtype = np.float32)
+
+        for i, text in enumerate(texts):
+            words = re.findall(r"\w+", str(text).lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                slot, sign = self._slot(feature)
+                vectors[i, slot % self.dim] += sign
+
+        return vectors
+
+
+# SENTENCE-TRANSFORMERS MODEL (LOADED ON FIRST USE , ONE COPY PER WORKER PROCESS)
+class SentenceTransformerEncoder(TextEncoder):
+
+    def __init__(self, model_name : str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"):
+        self.model_name = model_name
+        self._model = None
+
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, device = "cpu")
+        return self._model
+
+    @property
+    def dim(self):
+        return self.model().get_sentence_embedding_dimension()
+
+    def encode(self, texts : list) -> np.ndarray:
+        return self.model().encode(list(texts), batch_size = len(texts), convert_to_numpy = True).astype(np.float32)
+
+
+# "hashing:384" | "sentence-transformers:<model name>" -> ENCODER (A STRING , SO IT CAN BE SENT TO WORKER PROCESSES)
+def encoder_from_spec(spec : str) -> TextEncoder:
+
+    kind, _, arg = spec.partition(":")
+
+    if kind == "hashing":
+        return HashingEncoder(dim = int(arg or 384))
+    if kind == "sentence-transformers":
+        return SentenceTransformerEncoder(arg) if arg else SentenceTransformerEncoder()
+
+    raise ValueError(f"unknown encoder {spec!r} (expected hashing:<dim> or sentence-transformers:<model>)")
+
+
+# TEXT THAT IS EMBEDDED FOR EVERY ARTICLE (TITLE + SUMMARY)
+def article_texts(articles : pd.DataFrame):
+
+    title = articles["title"].fillna("").astype(str)
+    summary = articles["summary"].fillna("").astype(str) if "summary" in articles else ""
+    return (title + ". " + summary).str.strip(". ").tolist()
+
+
+# ENCODE AND L2-NORMALIZE (INNER PRODUCT = COSINE , LIKE THE NOTEBOOK INDEX)
+def embed_texts(encoder : TextEncoder, texts : list) -> np.ndarray:
+
+    vectors = np.ascontiguousarray(encoder.encode(texts), dtype = np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+# ================================ WORKER PROCESSES ======================================
+
+_WORKER_ENCODER = None
+
+
+def _init_worker(spec, threads):
+    global _WORKER_ENCODER
+
+    # ONE THREAD PER PROCESS , THE POOL IS THE PARALLELISM
+    faiss.omp_set_num_threads(threads)
+    _WORKER_ENCODER = encoder_from_spec(spec)
+
+
+def _encode_batch(texts):
+    return embed_texts(_WORKER_ENCODER, texts)
+
+
+# ================================ PIPELINE ======================================
+
+# STREAMING CHUNKS OF A .csv / .parquet / .jsonl FILE
+def read_chunks(path, chunk_size : int = 2048):
+
+    path = Path(path)
+
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size = chunk_size):
+            yield batch.to_pandas()
+
+    elif path.suffix in (".jsonl", ".ndjson"):
+        yield from pd.read_json(path, lines = True, chunksize = chunk_size)
+
+    else:
+        yield from pd.read_csv(path, chunksize = chunk_size)
+
+
+# ARTICLES -> NORMALIZED FLOAT32 BLOCKS , WRITTEN IN THE INGEST DROP FORMAT (<name>.parquet + <name>.npy)
+#   CHUNKS ARE ENCODED IN batch_size SLICES ACROSS A PROCESS POOL (workers = 0 : IN THIS PROCESS)
+#   A CHECKPOINT FILE LISTS THE FINISHED CHUNKS , A RESTARTED RUN SKIPS THEM
+#   THE OUTPUT DIRECTORY CAN BE INGEST_DROP_DIR (FILES APPEAR ATOMICALLY , VECTORS BEFORE ARTICLES)
+class EmbeddingPipeline:
+
+    def __init__(self, encoder_spec : str = "hashing:384", out_dir = "embedded", workers : int = os.cpu_count() or 1,
+                 chunk_size : int = 2048, batch_size : int = 64, prefix : str = "articles", checkpoint = None):
+
+        self.encoder_spec = encoder_spec
+        self.out_dir = Path(out_dir)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.checkpoint = Path(checkpoint) if checkpoint else self.out_dir / f"{prefix}.progress.json"
+
+    def _load_checkpoint(self, source):
+
+        state = {"source": str(source), "encoder": self.encoder_spec, "chunk_size": self.chunk_size, "done": [], "articles": 0}
+        if not self.checkpoint.exists():
+            return state
+
+        saved = json.loads(self.checkpoint.read_text())
+
+        # CHUNK NUMBERS ONLY MEAN THE SAME ROWS FOR THE SAME SOURCE AND CHUNK SIZE
+        if any(saved.get(key) != state[key] for key in ("source", "encoder", "chunk_size")):
+            raise ValueError(f"checkpoint {self.checkpoint} belongs to another run ({saved.get('source')} , "
+                             f"{saved.get('encoder')} , chunk_size {saved.get('chunk_size')}) , remove it to start over")
+        return saved
+
+    def _save_checkpoint(self, state):
+        tmp = self.checkpoint.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, self.checkpoint)
+
+    def _write_block(self, number, articles, vectors):
+
+        name = str(self.out_dir / f"{self.prefix}-{number:06d}")
+
+        with open(name + ".npy.tmp", "wb") as f:
+            np.save(f, vectors)
+        os.replace(name + ".npy.tmp", name + ".npy")
+
+        articles.drop(columns = ["embedding"], errors = "ignore").to_parquet(name + ".parquet.tmp", index = False)
+        os.replace(name + ".parquet.tmp", name + ".parquet")
+
+    def _encode(self, pool, encoder, texts):
+
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        blocks = pool.map(_encode_batch, batches) if pool is not None else (embed_texts(encoder, batch) for batch in batches)
+        return np.concatenate(list(blocks)) if batches else np.zeros((0, encoder.dim if encoder else 0), dtype = np.float32)
+
+    # EMBED EVERY CHUNK OF `source` , YIELDS ONE METRICS DICT PER CHUNK (SKIPPED CHUNKS INCLUDED)
+    def run(self, source):
+
+        self.out_dir.mkdir(parents = True, exist_ok = True)
+        state = self._load_checkpoint(source)
+        done = set(state["done"])
+
+        pool, encoder = None, None
+        if self.workers > 0:
+            pool = ProcessPoolExecutor(self.workers, initializer = _init_worker, initargs = (self.encoder_spec, 1))
+        else:
+            encoder = encoder_from_spec(self.encoder_spec)
+
+        started = time.perf_counter()
+        embedded = 0
+
+        try:
+            for number, articles in enumerate(read_chunks(source, self.chunk_size)):
+                if number in done:
+                    yield {"chunk": number, "skipped": True, "articles": len(articles)}
+                    continue
+
+                chunk_start = time.perf_counter()
+                articles = articles.reset_index(drop = True)
+                vectors = self._encode(pool, encoder, article_texts(articles))
+                self._write_block(number, articles, vectors)
+
+                state["done"].append(number)
+                state["articles"] += len(articles)
+                self._save_checkpoint(state)
+
+                embedded += len(articles)
+                seconds = time.perf_counter() - chunk_start
+                total = time.perf_counter() - started
+                yield {"chunk": number, "articles": len(articles), "dim": int(vectors.shape[1]), "seconds": round(seconds, 3),
+                       "articles_per_sec": round(len(articles) / max(seconds, 1e-9), 1),
+                       "total_articles_per_sec": round(embedded / max(total, 1e-9), 1)}
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures = True)
+
+
+# OFFLINE / CRON JOB
+#   python -m app.embedding --input new_articles.csv --out $INGEST_DROP_DIR --encoder hashing:384 --workers 4
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Embed new articles (title + summary) into ingest-ready parquet + npy blocks")
+    parser.add_argument("--input", required = True, help = ".csv , .parquet or .jsonl with at least id and title")
+    parser.add_argument("--out", required = True, help = "output directory (e.g. INGEST_DROP_DIR)")
+    parser.add_argument("--encoder", default = os.getenv("EMBEDDING_ENCODER", "hashing:384"),
+                        help = "hashing:<dim> (deterministic stand-in) or sentence-transformers:<model>")
+    parser.add_argument("--workers", type = int, default = os.cpu_count() or 1, help = "encoder processes (0 = in this process)")
+    parser.add_argument("--chunk-size", type = int, default = 2048, help = "articles per output block (and per checkpoint)")
+    parser.add_argument("--batch-size", type = int, default = 64, help = "texts per encoder call")
+    parser.add_argument("--prefix", default = None, help = "output file prefix (default : input file name)")
+    parser.add_argument("--checkpoint", default = None, help = "progress file (default : <out>/<prefix>.progress.json)")
+    args = parser.parse_args(argv)
+
+    pipeline = EmbeddingPipeline(args.encoder, args.out, workers = args.workers, chunk_size = args.chunk_size,
+                                 batch_size = args.batch_size, prefix = args.prefix or Path(args.input).stem, checkpoint = args.checkpoint)
+
+    start, articles = time.perf_counter(), 0
+    for metrics in pipeline.run(args.input):
+        print(json.dumps(metrics))
+        articles += 0 if metrics.get("skipped") else metrics["articles"]
+
+    seconds = time.perf_counter() - start
+    print(json.dumps({"articles": articles, "seconds": round(seconds, 1), "articles_per_sec": round(articles / max(seconds, 1e-9), 1)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import copy
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .catalog import ArticleCatalog
+
+
+# COLD-START CANDIDATES PER FEED : THE BEST ROWS BY FRESHNESS x CONFIDENCE , THE PER-USER NOISE IS DRAWN ONLY OVER THESE
+FEED_POOL_SIZE = int(os.getenv("FEED_POOL_SIZE", 1000))
+
+
+# POSTING LISTS : LOWERCASED VALUE -> ROWS HAVING THAT VALUE (ONLY ROWS WHERE `active`)
+def build_postings(values : pd.Series, active : np.ndarray | None = None):
+
+    codes, uniques = pd.factorize(values.astype("string").str.lower())
+    if active is not None:
+        codes = np.where(active, codes, -1)
+
+    order = np.argsort(codes, kind = "stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+
+    return {str(key): order[bounds[i]:bounds[i + 1]] for i, key in enumerate(uniques)}
+
+
+# POSTING LISTS AFTER `appended` ROWS (AT THE END OF THE CATALOG , SO EVERY LIST STAYS SORTED) WERE ADDED AND `removed` ROWS
+# DROPPED , `values` ARE THE COLUMN OF THE CATALOG . ONLY THE LISTS OF THE CHANGED ROWS ARE TOUCHED , RETURNS (POSTINGS , KEYS)
+def patch_postings(postings : dict, values : pd.Series, appended, removed):
+
+    postings = dict(postings)
+    changed = set()
+
+    for rows, add in ((removed, False), (appended, True)):
+        if len(rows) == 0:
+            continue
+
+        keys = values.iloc[rows].astype("string").str.lower().to_numpy(dtype = object, na_value = None)
+        for key in set(keys) - {None}:
+            selected = rows[keys == key]
+            current = postings.get(key, selected[:0])
+            postings[key] = np.concatenate([current, selected]) if add else current[~np.isin(current, selected)]
+            changed.add(key)
+
+    return postings, changed
+
+
+# TOP-K POSITIONS OF `scores` (DESCENDING , NaN LAST) WITHOUT SORTING EVERYTHING
+def top_k_positions(scores, top_k):
+
+    if top_k >= len(scores):
+        return np.argsort(-scores, kind = "stable")
+
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates], kind = "stable")]
+
+
+# SPLITMIX64 FINALIZER (UINT64 ARRAYS , WRAPAROUND ARITHMETIC)
+def mix64(x):
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+# KEYED PSEUDO-RANDOM PERMUTATION OF [0 , n) : BALANCED FEISTEL NETWORK + CYCLE WALKING
+#   SAME (n , seed) -> SAME ORDER , EVERY POSITION MAPS TO A DISTINCT ROW , O(1) PER POSITION , NOTHING OF SIZE n IS BUILT
+class FeistelPermutation:
+
+    def __init__(self, n : int, seed : int, rounds : int = 4):
+
+        self.n = n
+        self.half_bits = max(1, ((max(n, 2) - 1).bit_length() + 1) // 2)   # DOMAIN 4 ** half_bits < 4n
+        self.mask = np.uint64((1 << self.half_bits) - 1)
+
+        keys = mix64(np.uint64(seed % 2**64) + np.arange(1, rounds + 1, dtype = np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+        self.keys = [np.uint64(key) for key in keys]
+
+    def _encrypt(self, x):
+
+        shift = np.uint64(self.half_bits)
+        left, right = x >> shift, x & self.mask
+        for key in self.keys:
+            left, right = right, left ^ (mix64(right ^ key) & self.mask)
+
+        return (left << shift) | right
+
+    # ROW POSITIONS FOR THE GIVEN FEED POSITIONS (ARRAY IN , ARRAY OUT)
+    def __call__(self, positions):
+
+        with np.errstate(over = "ignore"):
+            out = self._encrypt(np.asarray(positions, dtype = np.uint64))
+
+            # OUTSIDE [0 , n) : ENCRYPT AGAIN UNTIL INSIDE (FEWER THAN 4 STEPS ON AVERAGE)
+            outside = out >= self.n
+            while outside.any():
+                out[outside] = self._encrypt(out[outside])
+                outside = out >= self.n
+
+        return out.astype(np.int64)
+
+
+# PRECOMPUTED CANDIDATE POOLS FOR THE COLD-START FEEDS (HOME , CATEGORY , SOURCE , LATEST)
+# A REQUEST ONLY TOUCHES ITS OWN SLICE : NO df.copy() , NO ROW-WISE apply , NO FULL SORT
+class FeedPools:
+
+    def __init__(self, catalog : ArticleCatalog, now : datetime | None = None, pool_size : int = FEED_POOL_SIZE):
+
+        self.catalog = catalog
+        self.pool_size = pool_size
+        self.all_rows = np.flatnonzero(catalog.active)
+        self.by_category = build_postings(catalog.df["category"], catalog.active)
+        self.by_source = build_postings(catalog.df["source"], catalog.active)
+        self.confidence = catalog.df["confidence"].to_numpy(dtype = np.float64, na_value = np.nan)
+
+        # NEWEST FIRST (NaT LAST)
+        order = np.argsort(-np.nan_to_num(catalog.epoch_days, nan = -np.inf), kind = "stable")
+        self.latest_order = order[catalog.active[order]]
+
+        self.refresh(now)
+
+    # RECOMPUTE THE TIME-DEPENDENT ARRAYS (AGES CHANGE ONCE A DAY , SO A FEW MINUTES OF STALENESS IS INVISIBLE)
+    def refresh(self, now : datetime | None = None):
+
+        self.now = now
+        self.freshness = self._freshness(None)
+
+        # THE USER WEIGHTS ONLY SCALE freshness x confidence , SO ONE RANKING SERVES EVERY USER : KEEP ITS TOP pool_size ROWS
+        # (OVERALL , PER CATEGORY , PER SOURCE) , A REQUEST RESCORES AT MOST pool_size ROWS INSTEAD OF THE WHOLE CATALOG
+        base = np.nan_to_num(self.freshness * self.confidence, nan = -np.inf)
+        self.home_pool = self._pool(base, self.all_rows)
+        self.category_pools = {key: self._pool(base, rows) for key, rows in self.by_category.items()}
+        self.source_pools = {key: self._pool(base, rows) for key, rows in self.by_source.items()}
+        self.refreshed_at = time.time()
+
+    def _freshness(self, rows):
+        days_diff = np.maximum(self.catalog.age_days(rows, now = self.now), 0)
+        return 1.0 / np.log1p(days_diff + 1)
+
+    def _pool(self, base, rows):
+        return rows[top_k_positions(base[rows], self.pool_size)]
+
+    # POOLS OF `catalog` , A LATER VERSION OF self.catalog WITH `appended` ROWS AT THE END AND `removed` ROWS NO LONGER ACTIVE
+    #   ONLY THE POSTING LISTS AND POOLS OF THE CHANGED ROWS ARE REBUILT (NO FACTORIZE , SORT OR PARTITION OF THE WHOLE CATALOG) :
+    #   A POOL GAINS ITS NEW ROWS (TOP-K OF OLD POOL + NEW ROWS = TOP-K OF THE LIST , OLD SCORES DID NOT CHANGE) , A POOL THAT LOST
+    #   A ROW IS RE-RANKED OVER ITS POSTING LIST . THE ROW ARRAYS ARE EXTENDED OR FILTERED (MEMORY COPIES)
+    #   THE BACKGROUND refresh() STILL RE-RANKS EVERYTHING AS THE ARTICLES AGE
+    def patched(self, catalog : ArticleCatalog, appended = None, removed = None):
+
+        feeds = copy.copy(self)
+        feeds.catalog = catalog
+
+        new_rows = np.arange(len(self.confidence), len(catalog))
+        appended = np.asarray(new_rows if appended is None else appended, dtype = np.int64)
+        appended = appended[catalog.active[appended]]
+        removed = np.asarray([] if removed is None else removed, dtype = np.int64)
+
+        feeds.confidence = np.concatenate([self.confidence, catalog.df["confidence"].iloc[new_rows].to_numpy(dtype = np.float64, na_value = np.nan)])
+        feeds.freshness = np.concatenate([self.freshness, feeds._freshness(new_rows)])
+
+        feeds.all_rows, feeds.latest_order = self.all_rows, self.latest_order
+        if len(removed):
+            feeds.all_rows = feeds.all_rows[catalog.active[feeds.all_rows]]
+            feeds.latest_order = feeds.latest_order[catalog.active[feeds.latest_order]]
+        if len(appended):
+            feeds.all_rows = np.concatenate([feeds.all_rows, appended])
+
+            # NEWEST FIRST , A NEW ROW GOES AFTER THE OLD ONES OF THE SAME DATE (AS THE STABLE SORT OF THE FULL BUILD)
+            keys = -np.nan_to_num(catalog.epoch_days, nan = -np.inf)
+            added = appended[np.argsort(keys[appended], kind = "stable")]
+            feeds.latest_order = np.insert(feeds.latest_order, np.searchsorted(keys[feeds.latest_order], keys[added], side = "right"), added)
+
+        # EVERY ROW LIST IS SORTED , ITS NEW ROWS ARE ITS TAIL
+        def pool(old_pool, rows):
+            kept = old_pool[catalog.active[old_pool]]
+            candidates = rows if len(kept) < len(old_pool) else np.concatenate([kept, rows[np.searchsorted(rows, len(self.confidence)):]])
+            scores = np.nan_to_num(feeds.freshness[candidates] * feeds.confidence[candidates], nan = -np.inf)
+            return candidates[top_k_positions(scores, feeds.pool_size)]
+
+        feeds.home_pool = pool(self.home_pool, feeds.all_rows)
+
+        feeds.by_category, categories = patch_postings(self.by_category, catalog.df["category"], appended, removed)
+        feeds.category_pools = dict(self.category_pools)
+        feeds.category_pools.update({key: pool(self.category_pools.get(key, removed[:0]), feeds.by_category[key]) for key in categories})
+
+        feeds.by_source, sources = patch_postings(self.by_source, catalog.df["source"], appended, removed)
+        feeds.source_pools = dict(self.source_pools)
+        feeds.source_pools.update({key: pool(self.source_pools.get(key, removed[:0]), feeds.by_source[key]) for key in sources})
+
+        return feeds
+
+    def category_rows(self, category : str):
+        return self.by_category.get(category.lower(), self.all_rows[:0])
+
+    def source_rows(self, source : str):
+        return self.by_source.get(source.lower(), self.all_rows[:0])
+
+    # COLD-START SCORE (FRESHNESS x CONFIDENCE , PER-USER WEIGHTS AND NOISE) , OVER THE HOME POOL OR THE GIVEN `rows`
+    def home_feed(self, user_id, rows = None, top_k = 10):
+
+        rows = self.home_pool if rows is None else rows
+
+        seed = abs(hash(user_id)) % (2**32)
+        rng = np.random.default_rng(seed)
+
+        w_freshness = rng.random()
+        w_confidence = 1.0 - w_freshness
+
+        # AGGREGATE
+        noise = rng.normal(0, 0.05, size = len(rows))
+        score = ((self.freshness[rows] * w_freshness) * (self.confidence[rows] * w_confidence)) * (1 + noise)
+
+        return rows[top_k_positions(score, top_k)]
+
+    def category_feed(self, category, user_id = None, top_k = 10):
+        return self.home_feed(user_id, self.category_pools.get(category.lower(), self.all_rows[:0]), top_k)
+
+    def source_feed(self, source, user_id, top_k = 10):
+        return self.home_feed(user_id, self.source_pools.get(source.lower(), self.all_rows[:0]), top_k)
+
+    # page_size ROWS OF THE SEED'S RANDOM ORDER STARTING AT cursor (STABLE FOR A SNAPSHOT , NO SHUFFLE OF THE CATALOG)
+    def random_page(self, seed : int, cursor : int = 0, page_size : int = 1):
+
+        stop = min(cursor + page_size, len(self.all_rows))
+        if cursor < 0 or cursor >= stop:
+            return self.all_rows[:0]
+
+        return self.all_rows[FeistelPermutation(len(self.all_rows), seed)(np.arange(cursor, stop))]
+
+    def latest(self, top_k = None):
+        return self.latest_order if top_k is None else self.latest_order[:top_k]
+
+    # RESPONSE FRAME FOR THE SELECTED ROWS
+    def frame(self, rows):
+        return self.catalog.df.iloc[rows].reset_index(drop = True)
@@ -0,0 +1,70 @@
+import math
+from datetime import date
+
+import numpy as np
+
+from .feeds import FeedPools
+
+
+# CATEGORY / SOURCE / PUBLICATION DATE CONSTRAINTS OF A PERSONALIZED FEED
+#   RESOLVED TO THE SORTED ROWS THAT PASS , FROM THE POSTINGS OF THE SNAPSHOT'S FEED POOLS (NO COLUMN SCAN)
+#   THE SEARCH THEN ONLY SCORES THOSE ROWS (ArticleCatalog.search_rows) , SO A FULL TOP-K OF IN-FILTER ARTICLES COMES BACK
+class ArticleFilter:
+
+    def __init__(self, categories = None, sources = None, date_from : date | None = None, date_to : date | None = None):
+        self.categories = sorted({value.lower() for value in categories or []})
+        self.sources = sorted({value.lower() for value in sources or []})
+        self.date_from = date_from    # INCLUSIVE
+        self.date_to = date_to        # INCLUSIVE (THE WHOLE DAY)
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(categories = getattr(request, "categories", None), sources = getattr(request, "sources", None),
+                   date_from = getattr(request, "date_from", None), date_to = getattr(request, "date_to", None))
+
+    def __bool__(self):
+        return bool(self.categories or self.sources or self.date_from or self.date_to)
+
+    # CANONICAL TEXT (CACHE KEYS) , "" WHEN NOTHING IS FILTERED
+    def key(self):
+
+        if not self:
+            return ""
+        return (f"category={','.join(self.categories)};source={','.join(self.sources)};"
+                f"from={self.date_from or ''};to={self.date_to or ''}")
+
+    # SORTED ACTIVE ROWS OF feeds.catalog THAT PASS EVERY CONSTRAINT
+    def rows(self, feeds : FeedPools):
+
+        rows = feeds.all_rows
+
+        if self.categories:
+            rows = np.intersect1d(rows, np.concatenate([feeds.category_rows(value) for value in self.categories]), assume_unique = True)
+
+        if self.sources:
+            rows = np.intersect1d(rows, np.concatenate([feeds.source_rows(value) for value in self.sources]), assume_unique = True)
+
+        if self.date_from or self.date_to:
+            days = feeds.catalog.epoch_days[rows]
+            keep = np.ones(len(rows), dtype = bool)
+
+            if self.date_from:
+                keep &= days >= epoch_day(self.date_from)
+            if self.date_to:
+                keep &= days < epoch_day(self.date_to) + 1
+
+            rows = rows[keep]
+
+        return rows
+
+    # ONLY n SOURCES ALLOWED : RAISE THE PER-SOURCE CAP SO THE DIVERSITY RULE CAN STILL FILL top_k
+    def source_cap(self, top_k, max_source):
+
+        if not self.sources:
+            return max_source
+        return max(max_source, math.ceil(top_k / len(self.sources)))
+
+
+# CALENDAR DAY -> EPOCH DAYS OF ITS MIDNIGHT (UTC , LIKE NAIVE CATALOG DATES)
+def epoch_day(day : date):
+    return float((np.datetime64(day, "D") - np.datetime64("1970-01-01", "D")).astype(np.int64))
@@ -0,0 +1,548 @@
+import copy
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pandas as pd
+import pydantic
+
+from . import ann_index, schemas
+from .catalog import ArticleCatalog, SegmentedEmbeddings, now_epoch_days
+from .feeds import FeedPools
+from .interests import interest_centroids
+from .recommender import session_embeddings
+
+
+DATE_COLUMNS = ["date", "created_at", "updated_at"]
+
+# APPENDED ROWS ARE SEARCHED IN A SMALL EXACT DELTA INDEX NEXT TO THE SHARED BASE INDEX , PAST THIS MANY ROWS THE DELTA IS
+# FOLDED INTO A COPY OF THE BASE INDEX (ONE O(N) COPY PER DELTA_MAX_ROWS APPENDED ROWS , NOT ONE PER BATCH)
+DELTA_MAX_ROWS = int(os.getenv("DELTA_MAX_ROWS", 10000))
+
+# RETENTION ONLY MASKS EXPIRED ROWS , ONCE MORE THAN THIS FRACTION OF THE BASE INDEX IS MASKED THE INDEX IS REBUILT OVER THE
+# ACTIVE ROWS (SEE CatalogStore.compact_index)
+INDEX_COMPACT_FRACTION = float(os.getenv("INDEX_COMPACT_FRACTION", 0.5))
+
+
+# ONE CONSISTENT VIEW OF THE CATALOG : A REQUEST READS `store.current` ONCE AND USES ONLY THAT
+class CatalogSnapshot:
+
+    def __init__(self, catalog : ArticleCatalog, feeds : FeedPools | None = None, version : int = 0, neighbors = None, text_index = None):
+        self.catalog = catalog
+        self.feeds = feeds or FeedPools(catalog)
+        self.version = version
+        self.neighbors = neighbors        # OPTIONAL app.neighbors.NeighborGraph OF THIS CATALOG
+        self.text_index = text_index      # OPTIONAL app.text_search.TextIndex OF THIS CATALOG
+
+
+# WHAT CHANGED BETWEEN TWO SNAPSHOTS (PASSED TO LISTENERS , e.g. CACHE INVALIDATION)
+class CatalogChange:
+
+    def __init__(self, kind, snapshot, article_ids, rows):
+        self.kind = kind                  # "append" OR "retract"
+        self.snapshot = snapshot          # THE NEW SNAPSHOT
+        self.article_ids = article_ids    # IDS THAT WERE ADDED / RETRACTED
+        self.rows = rows                  # THEIR ROWS IN snapshot.catalog
+
+
+# HOLDS THE CURRENT SNAPSHOT AND SWAPS IT ATOMICALLY ON INGESTION
+# WRITERS ARE SERIALIZED , READERS NEVER TAKE A LOCK (A REFERENCE ASSIGNMENT IS ATOMIC)
+class CatalogStore:
+
+    def __init__(self, snapshot : CatalogSnapshot, bodies = None):
+        self._current = snapshot
+        self.bodies = bodies              # OPTIONAL app.body_store.ArticleBodyStore (GETS THE `content` OF NEW ARTICLES)
+        self._write_lock = threading.Lock()
+        self._listeners = []
+        self._compact_lock = threading.Lock()
+
+    @property
+    def current(self) -> CatalogSnapshot:
+        return self._current
+
+    # RECOMPUTE FRESHNESS OF THE CURRENT FEED POOLS EVERY `interval` SECONDS
+    def start_feed_refresher(self, interval : float = 600):
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self._current.feeds.refresh()
+
+        thread = threading.Thread(target = loop, name = "feed-pool-refresher", daemon = True)
+        thread.start()
+        return thread
+
+    # CALLBACK(change) AFTER EVERY SWAP
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    # `removed` ARE THE ROWS THAT STOPPED BEING ACTIVE , THE FEED POOLS ARE PATCHED WITH THEM AND THE NEW ROWS (NOT REBUILT)
+    def _publish(self, kind, catalog, article_ids, rows, neighbors = None, text_index = None, removed = None):
+
+        feeds = self._current.feeds.patched(catalog, removed = removed)
+        snapshot = CatalogSnapshot(catalog, feeds, version = self._current.version + 1, neighbors = neighbors, text_index = text_index)
+        self._current = snapshot
+
+        change = CatalogChange(kind, snapshot, article_ids, rows)
+        for listener in self._listeners:
+            listener(change)
+
+        return change
+
+    # APPEND NEW ARTICLES (AN EXISTING ID IS REPLACED : OLD ROW RETRACTED , NEW ROW APPENDED)
+    def append(self, articles : pd.DataFrame, embeddings : np.ndarray):
+
+        embeddings = np.ascontiguousarray(embeddings, dtype = np.float32)
+        if len(articles) != len(embeddings):
+            raise ValueError(f"{len(articles)} articles but {len(embeddings)} embeddings")
+        if len(articles) == 0:
+            return None
+
+        # EVERYTHING IS CHECKED BEFORE THE BODY STORE OR A SNAPSHOT IS TOUCHED
+        dim = self._current.catalog.dim
+        if embeddings.ndim != 2 or embeddings.shape[1] != dim:
+            raise ValueError(f"embeddings must have shape (n, {dim}) , got {embeddings.shape}")
+        if not np.isfinite(embeddings).all():
+            raise ValueError("embeddings must be finite")
+
+        faiss.normalize_L2(embeddings)
+
+        with self._write_lock:
+            old = self._current.catalog
+            contents = articles["content"].tolist() if "content" in articles else None
+            articles = prepare_articles(articles, old.df)
+
+            # BODIES GO TO THE BODY STORE , THE CATALOG FRAME ONLY KEEPS WHAT THE RANKERS USE
+            if self.bodies is not None and contents is not None:
+                self.bodies.append(articles["id"].to_numpy(dtype = np.int64), contents)
+
+            # NEW FRAME (ARROW COLUMNS JUST GAIN A CHUNK) , THE NEW VECTORS AS ONE MORE EMBEDDING SEGMENT , THE BASE MATRIX AND
+            # THE BASE INDEX ARE SHARED WITH THE OLD SNAPSHOT (NOT COPIED , MAPPED PAGES STAY SHARED BETWEEN WORKERS)
+            df = pd.concat([old.df, articles], ignore_index = True)
+            base_embeddings = old.embeddings if isinstance(old.embeddings, SegmentedEmbeddings) else SegmentedEmbeddings([old.embeddings])
+            all_embeddings = base_embeddings.append(embeddings)
+            delta_vectors = all_embeddings[np.arange(old.base_rows, len(df))]
+
+            index_rows = old.index_rows
+            if len(delta_vectors) <= DELTA_MAX_ROWS:
+                index = old.faiss_index
+                delta_index = faiss.IndexFlatIP(old.dim)
+                delta_index.add(delta_vectors)
+            else:
+                index = faiss.deserialize_index(faiss.serialize_index(old.faiss_index))   # OWNED COPY (clone_index KEEPS MMAP VIEWS)
+                delta_rows = np.arange(old.base_rows, len(df))
+                ann_index.add_rows(index, delta_vectors, delta_rows)
+                index_rows = None if index_rows is None else np.concatenate([index_rows, delta_rows])
+                delta_index = None
+
+            # REPLACED ARTICLES
+            active = np.concatenate([old.active, np.ones(len(articles), dtype = bool)])
+            replaced = old.lookup(articles["id"].to_numpy(dtype = np.int64))
+            active[replaced[replaced >= 0]] = False
+
+            catalog = ArticleCatalog(df, index, embeddings = all_embeddings, active = active, delta_index = delta_index, index_rows = index_rows)
+            catalog.batcher = old.batcher
+            catalog.rescore = old.rescore
+
+            rows = np.arange(len(old), len(df))
+
+            # TIME SHARDS : ONLY THE WINDOWS THE NEW ARTICLES FALL IN ARE COPIED
+            if old.shards is not None:
+                catalog.shards = old.shards.extend(catalog, rows)
+
+            # NEIGHBOR LISTS OF THE NEW ARTICLES (AND OF THE OLD ONES THEY NOW BEAT)
+            neighbors = self._current.neighbors
+            if neighbors is not None:
+                neighbors = neighbors.extend(catalog, rows)
+
+            # TEXT SEARCH : ONE NEW SEGMENT FOR THE NEW ARTICLES
+            text_index = self._current.text_index
+            if text_index is not None:
+                text_index = text_index.extend(catalog, rows)
+
+            return self._publish("append", catalog, articles["id"].tolist(), rows, neighbors, text_index, removed = replaced[replaced >= 0])
+
+    # RETRACT ARTICLES (MASKED OUT OF SEARCH , FEEDS AND LOOKUPS)
+    def retract(self, article_ids):
+
+        with self._write_lock:
+            old = self._current.catalog
+            rows, _ = old.rows_for(article_ids)
+            if len(rows) == 0:
+                return None
+
+            # THE NEIGHBOR GRAPH AND THE TEXT INDEX ARE KEPT , RETRACTED ROWS ARE MASKED WHEN THEY ARE READ
+            catalog = old.with_retracted(rows)
+            return self._publish("retract", catalog, old.ids[rows].tolist(), rows, self._current.neighbors, self._current.text_index, removed = rows)
+
+    # RETENTION : DROP (OR ARCHIVE) EVERY TIME SHARD THAT ENDS MORE THAN `max_age_days` BEFORE `now_days` (DEFAULT NOW)
+    #   THE DROP ITSELF IS A DICT UPDATE (NO INDEX REBUILD) , ARTICLES OF THOSE WINDOWS ARE RETRACTED IN THE SAME SWAP
+    #   SO THE FULL INDEX , FEEDS AND LOOKUPS STOP SERVING THEM TOO
+    #   THEIR VECTORS STAY IN THE FULL INDEX (MASKED) UNTIL THEY ARE INDEX_COMPACT_FRACTION OF IT , THEN compact_index() RUNS
+    #   IN THE BACKGROUND (IN EVERY WORKER , A JOURNAL REPLAY OF THE EXPIRY STARTS IT TOO)
+    def expire(self, max_age_days : float, archive_dir = None, now_days : float | None = None):
+
+        with self._write_lock:
+            old = self._current.catalog
+            if old.shards is None:
+                return None
+
+            now_days = now_epoch_days() if now_days is None else now_days
+            shards, dropped = old.shards.drop_before(now_days - max_age_days, archive_dir = archive_dir)
+            if not dropped:
+                return None
+
+            # EVERY ACTIVE ARTICLE OLDER THAN THE NEW LIVE WINDOW (ALSO THE ONES PUBLISHED BEFORE THE SHARDS WERE BUILT)
+            rows = np.flatnonzero(old.active & (old.epoch_days < shards.live_from))
+
+            catalog = old.with_retracted(rows)
+            catalog.shards = shards
+            change = self._publish("retract", catalog, old.ids[rows].tolist(), rows, self._current.neighbors, self._current.text_index, removed = rows)
+
+        if catalog.index_retracted > INDEX_COMPACT_FRACTION * catalog.faiss_index.ntotal:
+            threading.Thread(target = self.compact_index, name = "index-compaction", daemon = True).start()
+
+        return change
+
+    # REBUILD THE BASE INDEX OVER THE ACTIVE BASE ROWS (LABELLED WITH THEIR ROWS , SEE ann_index.compact_index)
+    #   BUILT OUTSIDE THE WRITE LOCK , THEN SWAPPED INTO THE CURRENT SNAPSHOT (SAME VERSION : SEARCHES RETURN THE SAME ROWS) ,
+    #   ROWS RETRACTED MEANWHILE STAY MASKED , AN APPEND THAT FOLDED THE DELTA INTO THE BASE MEANWHILE CANCELS IT
+    #   RETURNS THE NUMBER OF VECTORS DROPPED (0 WHEN NOTHING WAS SWAPPED)
+    def compact_index(self):
+
+        if not self._compact_lock.acquire(blocking = False):
+            return 0
+
+        try:
+            catalog = self._current.catalog
+            rows = np.flatnonzero(catalog.active[:catalog.base_rows])
+            if catalog.faiss_index.ntotal - len(rows) <= 0:
+                return 0
+
+            index = ann_index.compact_index(catalog.faiss_index, catalog.embeddings, rows)
+
+            with self._write_lock:
+                current = self._current
+                if current.catalog.faiss_index is not catalog.faiss_index:
+                    return 0
+
+                compacted = current.catalog.with_index(index, rows)
+                feeds = copy.copy(current.feeds)
+                feeds.catalog = compacted
+                self._current = CatalogSnapshot(compacted, feeds, version = current.version, neighbors = current.neighbors,
+                                                text_index = current.text_index)
+
+            return catalog.faiss_index.ntotal - len(rows)
+        finally:
+            self._compact_lock.release()
+
+    # RUN expire() EVERY `interval` SECONDS (ON `writer` , e.g. AN IngestJournal , INSTEAD OF THIS STORE WHEN GIVEN)
+    def start_retention(self, max_age_days : float, interval : float = 3600, archive_dir = None, writer = None):
+
+        writer = writer or self
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    writer.expire(max_age_days, archive_dir = archive_dir)
+                except Exception:
+                    traceback.print_exc()
+
+        thread = threading.Thread(target = loop, name = "shard-retention", daemon = True)
+        thread.start()
+        return thread
+
+
+# EVERY ROW AGAINST schemas.IngestArticle (REQUIRED FIELDS , URLS , DATES) AND NO ID TWICE IN ONE BATCH , ValueError OTHERWISE
+def validate_articles(articles : pd.DataFrame):
+
+    records = articles.astype(object).where(articles.notna(), None).to_dict(orient = "records")
+    for position, record in enumerate(records):
+        try:
+            schemas.IngestArticle.model_validate(record)
+        except pydantic.ValidationError as error:
+            problems = " , ".join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}" for item in error.errors())
+            raise ValueError(f"article {position} (id {record.get('id')}) : {problems}") from None
+
+    duplicated = articles["id"][articles["id"].duplicated()]
+    if len(duplicated):
+        raise ValueError(f"duplicate article ids in the batch : {sorted(set(duplicated.tolist()))}")
+
+
+# ALIGN INCOMING ROWS WITH THE CATALOG FRAME (SAME COLUMNS , DATES PARSED LIKE AT STARTUP)
+def prepare_articles(articles : pd.DataFrame, reference : pd.DataFrame):
+
+    articles = articles.drop(columns = ["embedding"], errors = "ignore").reset_index(drop = True)
+    validate_articles(articles)
+
+    for col in DATE_COLUMNS:
+        if col in articles and col in reference:
+            articles[col] = pd.to_datetime(articles[col], errors = "coerce", utc = reference[col].dt.tz is not None)
+
+    articles = articles.reindex(columns = reference.columns)
+
+    # KEEP ARROW-BACKED COLUMNS ARROW-BACKED (CONCAT THEN JUST ADDS A CHUNK , THE MAPPED DATA IS NOT COPIED)
+    for col, dtype in reference.dtypes.items():
+        if isinstance(dtype, pd.ArrowDtype):
+            articles[col] = articles[col].astype(dtype)
+
+    return articles
+
+
+# CANDIDATE CACHE INVALIDATION (app.result_cache) : ONLY POOLS THE CHANGE CAN AFFECT
+#   RETRACT : HISTORY OR POOL CONTAINS A RETRACTED ID (THE POOL WOULD COME BACK SHORT)
+#   APPEND  : A NEW ARTICLE IS MORE SIMILAR TO THE SESSION VECTOR THAN THE WORST CANDIDATE OF THE POOL
+def invalidate_personalization_cache(cache, change : CatalogChange):
+
+    entries = cache.entries()
+    if not entries:
+        return 0
+
+    if change.kind == "retract":
+        retracted = np.asarray(change.article_ids, dtype = np.int64)
+        stale = [key for key, pool in entries
+                 if np.isin(pool.history, retracted).any() or np.isin(pool.ids, retracted).any()]
+
+    else:
+        catalog = change.snapshot.catalog
+        added = catalog.embeddings[change.rows]
+        vectors, valid, _ = session_embeddings([list(pool.history) for _, pool in entries], catalog)
+        best = (vectors @ added.T).max(axis = 1)
+
+        # INTEREST POOLS (KEY ENDS WITH "interests") : THE BEST MATCH OVER THE HISTORY'S CENTROIDS (SAME HISTORY -> SAME CENTROIDS)
+        for position, (key, pool) in enumerate(entries):
+            if valid[position] and key[-1] == "interests":
+                centroids, _ = interest_centroids(list(pool.history), catalog)
+                best[position] = (centroids @ added.T).max()
+
+        floors = np.asarray([pool.candidate_floor for _, pool in entries])
+        stale = [key for (key, _), affected in zip(entries, (best >= floors) | ~valid) if affected]
+
+    cache.discard(stale)
+    return len(stale)
+
+
+# READ ONE DROPPED BATCH : <name>.csv / <name>.parquet + <name>.npy (OR AN `embedding` COLUMN LIKE THE NOTEBOOK)
+def read_batch(path : Path):
+
+    articles = pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+
+    vectors_path = path.with_suffix(".npy")
+    if vectors_path.exists():
+        embeddings = np.load(vectors_path)
+    elif "embedding" in articles:
+        embeddings = np.vstack(articles["embedding"].map(
+            lambda x: x if isinstance(x, (list, np.ndarray)) else np.fromstring(str(x).strip("[]"), sep = ",")).to_numpy())
+    else:
+        raise ValueError(f"no embeddings for {path.name} (expected {vectors_path.name} or an embedding column)")
+
+    return articles, embeddings
+
+
+# WATCHED DROP DIRECTORY
+#   <name>.csv | <name>.parquet (+ <name>.npy)  -> APPENDED
+#   <name>.retract.json ([id, id, ...])          -> RETRACTED
+# PROCESSED FILES ARE MOVED TO processed/ , BROKEN ONES TO failed/ (WITH A .error FILE)
+# PRODUCERS SHOULD WRITE THE .npy FIRST AND RENAME THE TABLE INTO PLACE LAST , SO A HALF-WRITTEN FILE IS NEVER PICKED UP
+# `store` IS A CatalogStore , OR AN IngestJournal WHEN SEVERAL WORKERS SERVE THE CATALOG (ONLY ITS LEADER WATCHES)
+class DropDirectoryWatcher:
+
+    def __init__(self, store, directory, interval : float = 10.0):
+        self.store = store
+        self.directory = Path(directory)
+        self.interval = interval
+        self.processed = self.directory / "processed"
+        self.failed = self.directory / "failed"
+
+    def start(self):
+        for folder in (self.directory, self.processed, self.failed):
+            folder.mkdir(parents = True, exist_ok = True)
+
+        thread = threading.Thread(target = self._loop, name = "ingest-drop-dir", daemon = True)
+        thread.start()
+        return thread
+
+    def _loop(self):
+        while True:
+            self.poll()
+            time.sleep(self.interval)
+
+    # PROCESS EVERYTHING CURRENTLY IN THE DIRECTORY (OLDEST FIRST)
+    def poll(self):
+
+        files = sorted((path for path in self.directory.iterdir()
+                        if path.is_file() and (path.suffix in (".csv", ".parquet") or path.name.endswith(".retract.json"))),
+                       key = lambda path: path.stat().st_mtime)
+
+        for path in files:
+            companions = [path.with_suffix(".npy")] if path.suffix in (".csv", ".parquet") else []
+            try:
+                if path.name.endswith(".retract.json"):
+                    self.store.retract(json.loads(path.read_text()))
+                else:
+                    self.store.append(*read_batch(path))
+                target = self.processed
+            except Exception:
+                (self.failed / (path.name + ".error")).write_text(traceback.format_exc())
+                target = self.failed
+
+            for file in [path, *companions]:
+                if file.exists():
+                    shutil.move(str(file), str(target / file.name))
+
+
+# SHARED INGESTION JOURNAL (INGEST_JOURNAL_DIR) : KEEPS SEVERAL WORKER PROCESSES ON THE SAME CATALOG
+#   A CHANGE (APPEND , RETRACT , EXPIRE) IS APPLIED BY ONE WORKER UNDER journal.lock , THEN WRITTEN AS THE NEXT NUMBERED ENTRY
+#   EVERY OTHER WORKER REPLAYS THE ENTRIES IN ORDER : SAME CHANGES IN THE SAME ORDER -> SAME SNAPSHOTS AND VERSIONS
+#   <seq>.npy (APPENDED EMBEDDINGS) IS WRITTEN FIRST , <seq>.json (THE ENTRY) IS RENAMED INTO PLACE LAST
+#   A REJECTED CHANGE (ValueError) IS NEVER WRITTEN , A CHANGE THAT DID NOTHING EITHER
+#   AN ENTRY THAT FAILS TO REPLAY STOPS THE REPLAY : IT IS RETRIED ON THE NEXT POLL , THE WORKER IS NOT READY UNTIL IT APPLIES
+#   ARTICLE BODIES ARE WRITTEN TO THE SHARED BODY STORE ONCE , BY THE WRITER , THE OTHER WORKERS ONLY RE-READ ITS INDEX
+#   ONE WORKER AT A TIME HOLDS leader.lock AND RUNS THE BACKGROUND WRITERS (DROP DIRECTORY , RETENTION) , THE LOCK IS
+#   RELEASED WHEN ITS PROCESS EXITS AND ANOTHER WORKER TAKES OVER
+# THE ENTRIES APPLY ON TOP OF THE CATALOG LOADED AT STARTUP : EMPTY THE DIRECTORY WHEN THAT CATALOG IS RE-EXPORTED
+class IngestJournal:
+
+    def __init__(self, store : CatalogStore, directory, interval : float = 1.0):
+        self.store = store
+        self.directory = Path(directory)
+        self.interval = interval
+        self.applied = 0                  # LAST ENTRY IN store.current
+        self.error = None                 # WHY THE NEXT ENTRY DID NOT REPLAY (RETRIED ON THE NEXT POLL)
+        self.leader = False
+        self._leader_file = None
+        self._lock = threading.Lock()
+
+        self.directory.mkdir(parents = True, exist_ok = True)
+
+    def _path(self, seq, suffix = ".json"):
+        return self.directory / f"{seq:012d}{suffix}"
+
+    # THIS THREAD IS THE ONLY WRITER OF ANY PROCESS (THE FILE LOCK IS RELEASED WHEN THE FILE IS CLOSED)
+    @contextmanager
+    def _writing(self):
+        with self._lock, open(self.directory / "journal.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    # APPLY EVERY ENTRY NEWER THAN store.current , RETURNS HOW MANY
+    def catch_up(self):
+        with self._lock:
+            return self._replay()
+
+    def _replay(self):
+
+        count = 0
+        while self._path(self.applied + 1).exists():
+            seq = self.applied + 1
+            try:
+                entry = json.loads(self._path(seq).read_text())
+                if entry["kind"] == "append":
+                    self.store.append(pd.DataFrame(entry["articles"]), np.load(self._path(seq, ".npy")))
+                    if self.store.bodies is not None:
+                        self.store.bodies.refresh()
+                elif entry["kind"] == "retract":
+                    self.store.retract(entry["article_ids"])
+                else:
+                    self.store.expire(entry["max_age_days"], now_days = entry["now_days"])
+            except Exception as error:
+                self.error = f"entry {seq} : {error!r}"
+                raise JournalReplayError(self.error) from error
+
+            self.applied = seq
+            self.error = None
+            count += 1
+
+        return count
+
+    # CATCH UP , apply() ON THE STORE , WRITE `entry` IF IT CHANGED SOMETHING
+    def _write(self, apply, entry, embeddings = None):
+
+        with self._writing():
+            self._replay()
+            change = apply()
+            if change is None:
+                return None
+
+            seq = self.applied + 1
+            if embeddings is not None:
+                np.save(self._path(seq, ".npy"), embeddings)
+
+            partial = self._path(seq, ".json.tmp")
+            partial.write_text(json.dumps(entry))
+            partial.rename(self._path(seq))
+            self.applied = seq
+
+            return change
+
+    # SAME SIGNATURES AS CatalogStore , SO THE ENDPOINTS AND THE DROP DIRECTORY WATCHER USE EITHER
+
+    # (THE ENTRY HAS NO `content` WHEN THE STORE HAS A BODY STORE : store.append OF THIS WORKER WRITES IT THERE)
+    def append(self, articles : pd.DataFrame, embeddings : np.ndarray):
+        articles = articles.drop(columns = ["embedding"], errors = "ignore")
+        embeddings = np.array(embeddings, dtype = np.float32)
+        journaled = articles.drop(columns = ["content"], errors = "ignore") if self.store.bodies is not None else articles
+        entry = {"kind": "append", "articles": json.loads(journaled.to_json(orient = "records", date_format = "iso"))}
+        return self._write(lambda: self.store.append(articles, embeddings), entry, embeddings)
+
+    def retract(self, article_ids):
+        article_ids = [int(article_id) for article_id in article_ids]
+        return self._write(lambda: self.store.retract(article_ids), {"kind": "retract", "article_ids": article_ids})
+
+    # THE CUTOFF IS FIXED HERE , SO A WORKER REPLAYING THE ENTRY LATER DROPS THE SAME SHARDS (ONLY THIS ONE ARCHIVES THEM)
+    def expire(self, max_age_days : float, archive_dir = None):
+        now_days = now_epoch_days()
+        return self._write(lambda: self.store.expire(max_age_days, archive_dir = archive_dir, now_days = now_days),
+                           {"kind": "expire", "max_age_days": max_age_days, "now_days": now_days})
+
+    # NON-BLOCKING , TRUE WHEN THIS PROCESS HOLDS leader.lock (KEPT UNTIL IT EXITS)
+    def try_lead(self):
+
+        if not self.leader:
+            lock_file = open(self.directory / "leader.lock", "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._leader_file, self.leader = lock_file, True
+
+        return True
+
+    # PER WORKER (AFTER THE fork) : REPLAY NEW ENTRIES EVERY `interval` SECONDS , on_lead() ONCE IF THIS WORKER BECOMES THE LEADER
+    def start(self, on_lead = None):
+
+        def loop():
+            while True:
+                error = self.error
+                try:
+                    self.catch_up()
+                    if not self.leader and self.try_lead() and on_lead is not None:
+                        on_lead()
+                except JournalReplayError:
+                    if self.error != error:           # LOGGED ONCE , NOT ON EVERY RETRY
+                        traceback.print_exc()
+                except Exception:
+                    traceback.print_exc()
+                time.sleep(self.interval)
+
+        thread = threading.Thread(target = loop, name = "ingest-journal", daemon = True)
+        thread.start()
+        return thread
+
+    def info(self):
+        return {"directory": str(self.directory), "applied": self.applied, "leader": self.leader, "error": self.error}
+
+
+# A JOURNAL ENTRY DID NOT REPLAY : THIS WORKER IS BEHIND THE OTHERS UNTIL A RETRY SUCCEEDS
+class JournalReplayError(RuntimeError):
+    pass
@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+
+from . import metrics
+from .catalog import ArticleCatalog, UnknownArticleError
+from .recommender import CandidatePool, scored_pool, search_candidates
+
+
+# MULTI-INTEREST USERS : A HISTORY OF SPORT AND POLITICS AVERAGES INTO ONE BLURRED QUERY THAT RETRIEVES NEITHER WELL
+# SO THE HISTORY IS CLUSTERED INTO UP TO `max_interests` CENTROIDS , ALL SEARCHED IN ONE CALL , AND THEIR HITS MERGED BY QUOTA
+MAX_INTERESTS = int(os.getenv("MAX_INTERESTS", 4))
+MIN_READS_PER_INTEREST = int(os.getenv("MIN_READS_PER_INTEREST", 3))   # A SHORT HISTORY STAYS ONE INTEREST
+INTEREST_POOL_SIZE = int(os.getenv("INTEREST_POOL_SIZE", 50))
+
+
+# WEIGHTED SPHERICAL K-MEANS ON THE GATHERED (n , dim) BLOCK , RETURNS (CENTROIDS (m , dim) FLOAT32 UNIT ROWS , STRENGTH (m ,))
+#   WEIGHTS ARE THE SAME AGE DECAY AS session_embedding , STRENGTH IS THE SHARE OF THE DECAYED WEIGHT IN EACH CLUSTER
+#   DETERMINISTIC (FARTHEST-POINT SEEDING) SO THE SAME HISTORY ALWAYS GIVES THE SAME CENTROIDS (CACHE INVALIDATION RELIES ON IT)
+def interest_centroids(article_ids, catalog : ArticleCatalog, max_interests = MAX_INTERESTS, min_reads = MIN_READS_PER_INTEREST,
+                       iterations = 10, decay_lambda : float = 0.0001, min_weights : float = 0.01):
+
+    rows, missing = catalog.rows_for(article_ids)
+    if len(rows) == 0:
+        raise UnknownArticleError(missing)
+
+    vectors = catalog.embeddings[rows].astype(np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis = 1, keepdims = True), 1e-12)
+    weights = np.fmax(np.exp(-decay_lambda * catalog.age_days(rows)), min_weights)
+
+    k = int(min(max_interests, len(rows) // max(min_reads, 1)))
+
+    if k <= 1:
+        centroid = (weights.astype(np.float32) @ vectors).reshape(1, -1)
+        return centroid / max(float(np.linalg.norm(centroid)), 1e-12), np.ones(1)
+
+    # SEEDS : THE HEAVIEST (MOST RECENT) READ , THEN EACH TIME THE READ LEAST SIMILAR TO EVERY SEED SO FAR
+    seeds = [int(np.argmax(weights))]
+    closest = vectors @ vectors[seeds[0]]
+    for _ in range(k - 1):
+        seeds.append(int(np.argmin(closest)))
+        closest = np.maximum(closest, vectors @ vectors[seeds[-1]])
+    centroids = vectors[seeds]
+
+    assignment = None
+    for _ in range(iterations):
+        new_assignment = np.argmax(vectors @ centroids.T, axis = 1)
+        if assignment is not None and np.array_equal(new_assignment, assignment):
+            break
+        assignment = new_assignment
+
+        # WEIGHTED SUM PER CLUSTER AS ONE (k , n) @ (n , dim) PRODUCT
+        members = (assignment[None, :] == np.arange(k)[:, None]) * weights[None, :]
+        sums = members.astype(np.float32) @ vectors
+        norms = np.linalg.norm(sums, axis = 1, keepdims = True)
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+    # EMPTY CLUSTERS ARE DROPPED
+    mass = np.bincount(assignment, weights = weights, minlength = k)
+    used = mass > 0
+
+    return np.ascontiguousarray(centroids[used], dtype = np.float32), mass[used] / mass.sum()
+
+
+# SPLIT pool_size OVER THE INTERESTS BY STRENGTH (LARGEST REMAINDER) , EVERY INTEREST GETS AT LEAST ONE SLOT
+def interest_quotas(strength, pool_size):
+
+    share = np.asarray(strength, dtype = np.float64) * max(pool_size - len(strength), 0)
+    quotas = np.floor(share).astype(np.int64)
+
+    remainder = max(pool_size - len(strength), 0) - int(quotas.sum())
+    quotas[np.argsort(-(share - quotas), kind = "stable")[:remainder]] += 1
+
+    return quotas + 1
+
+
+# ONE BATCHED SEARCH FOR ALL CENTROIDS , THEN EACH INTEREST TAKES ITS QUOTA OF HITS (BEST FIRST , NO DUPLICATES)
+# SLOTS THAT AN INTEREST CANNOT FILL GO TO THE BEST REMAINING HITS OF THE OTHERS
+# RETURNS (ROWS , SIMILARITY TO THE CENTROID THAT RETRIEVED THEM , CANDIDATE FLOOR)
+def retrieve_interest_candidates(article_ids, catalog : ArticleCatalog, pool_size = INTEREST_POOL_SIZE, nprobe = None, ef_search = None,
+                                 horizon_days = None, allowed_rows = None, max_interests = MAX_INTERESTS, decay_lambda = 0.0001):
+
+    with metrics.span("session_embedding"):
+        centroids, strength = interest_centroids(article_ids, catalog, max_interests = max_interests, decay_lambda = decay_lambda)
+
+    quotas = interest_quotas(strength, pool_size)
+
+    k = int(quotas.max()) + len(article_ids)
+    with metrics.span("faiss_search"):
+        scores, index = search_candidates(catalog, centroids, k, nprobe, ef_search, horizon_days, allowed_rows)
+
+    read_ids = np.asarray(article_ids, dtype = np.int64)
+    taken, taken_similarity, leftovers, floors = [], [], [], []
+    seen = set()
+
+    for hits, similarity, quota in zip(index, scores, quotas.tolist()):
+
+        keep = hits >= 0
+        keep[keep] = catalog.active[hits[keep]] & ~np.isin(catalog.ids[hits[keep]], read_ids) & catalog.within_horizon(hits[keep], horizon_days)
+        hits, similarity = hits[keep], similarity[keep]
+
+        count = 0
+        for position, row in enumerate(hits.tolist()):
+            if row in seen:
+                continue
+            if count == quota:
+                leftovers.extend(zip(similarity[position:].tolist(), hits[position:].tolist()))
+                break
+            seen.add(row)
+            taken.append(row)
+            taken_similarity.append(float(similarity[position]))
+            count += 1
+
+        # A NEW ARTICLE BELOW THIS INTEREST'S LAST TAKEN HIT CANNOT ENTER ITS QUOTA , A SHORT INTEREST HAS NO FLOOR
+        floors.append(taken_similarity[-1] if count == quota else -np.inf)
+
+    for similarity, row in sorted(leftovers, reverse = True):
+        if len(taken) >= pool_size:
+            break
+        if row not in seen:
+            seen.add(row)
+            taken.append(row)
+            taken_similarity.append(similarity)
+
+    candidate_floor = min(floors) if len(taken) >= pool_size else -np.inf
+    return np.asarray(taken, dtype = np.int64), np.asarray(taken_similarity, dtype = np.float32), candidate_floor
+
+
+def interest_candidate_pool(article_ids, catalog : ArticleCatalog, pool_size = INTEREST_POOL_SIZE, nprobe = None, ef_search = None,
+                            horizon_days = None, allowed_rows = None, max_interests = MAX_INTERESTS, decay_lambda = 0.0001) -> CandidatePool:
+
+    rows, similarity, candidate_floor = retrieve_interest_candidates(article_ids, catalog, pool_size = pool_size, nprobe = nprobe,
+                                                                     ef_search = ef_search, horizon_days = horizon_days,
+                                                                     allowed_rows = allowed_rows, max_interests = max_interests,
+                                                                     decay_lambda = decay_lambda)
+
+    return scored_pool(article_ids, catalog, rows, similarity, pool_size, candidate_floor = candidate_floor)
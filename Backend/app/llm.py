@@ -1,34 +1,27 @@
 import os
-from dotenv import load_dotenv
+import re
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
 
-import google
-from google import genai
+import numpy as np
+from cachetools import TTLCache
 
-import schemas
-import recommender
+from . import schemas
+from . import metrics
+from . import recommender
 
 
-# ACCESS AND GET GEMINI API KEY
-load_dotenv()
+# BUILD USER CONTEXT (FOR PROMPT) , ONCE PER REQUEST : HASHED LOOKUP OF THE HISTORY ROWS , NO SCAN OF df
+def build_user_context(article_ids, catalog, max_chars = 1500):
 
-GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
-print(f"Connected to Gemini API: {GOOGLE_API_KEY[:5]}***")
-
-# ACTIVATE GEMINI API
-client = genai.Client(api_key = GOOGLE_API_KEY)
-
-
-# BUILD USER CONTEXT (FOR PROMPT)
-def build_user_context(article_ids, df, max_chars = 1500):
-
-    # GET ALL ARTICLES THAT USER HAVE READ
-    user_articles = df[df['id'].isin(article_ids)]
+    # GET ALL ARTICLES THAT USER HAVE READ (CATALOG ORDER , SAME AS df[df['id'].isin(article_ids)])
+    rows = np.unique(catalog.lookup(article_ids))
+    rows = rows[rows >= 0]
+    user_articles = catalog.df.iloc[rows]
 
     # FOR EACH USER ARTICLES
-    context = []
-    for _, row in user_articles.iterrows():
-        text = f"- {row['title']}: {row['summary']}"
-        context.append(text)
+    context = [f"- {title}: {summary}" for title, summary in zip(user_articles["title"], user_articles["summary"])]
 
     full_context = "\n".join(context)
     return full_context[:max_chars]
@@ -38,19 +31,19 @@ def build_user_context(article_ids, df, max_chars = 1500):
 def build_candidate_context(row, max_chars=800):
     text = f"""Judul: {row['title']}
                Sumber: {row['source']}"""
-    
+
     return text.strip()[:max_chars]
 
 
-def build_explanation_prompt(user_context, 
+def build_explanation_prompt(user_context,
                              candidate_context):
     prompt = f"""Kamu adalah sistem rekomendasi berita.
-                 Riwayat bacaan pengguna: 
+                 Riwayat bacaan pengguna:
                  {user_context}
 
                  Berita yang direkomendasikan:
                  {candidate_context}
-                 
+
                  Tugasmu:
                  Buat SATU kalimat pendek (maksimal 12 kata) dengan format PERSIS berikut:
                  "Direkomendasikan karena membahas <topik utama>."
@@ -59,23 +52,231 @@ def build_explanation_prompt(user_context,
                                - Jangan menjelaskan lebih dari satu alasan.
                                - Jangan lebih dari satu kalimat.
                                - Jangan menambahkan konteks lain.
-                               - Fokus hanya pada topik inti berita. 
+                               - Fokus hanya pada topik inti berita.
                                Jawaban HARUS satu kalimat pendek."""
     return prompt.strip()
 
 
+# ONE PROMPT FOR EVERY CANDIDATE , ONE NUMBERED ANSWER LINE PER CANDIDATE
+def build_batched_prompt(user_context, candidate_contexts):
+
+    candidates = "\n\n".join(f"[{i}]\n{context}" for i, context in enumerate(candidate_contexts, start = 1))
+
+    prompt = f"""Kamu adalah sistem rekomendasi berita.
+                 Riwayat bacaan pengguna:
+                 {user_context}
+
+                 Berita yang direkomendasikan:
+                 {candidates}
+
+                 Tugasmu:
+                 Untuk SETIAP berita di atas , tulis SATU baris dengan format PERSIS berikut:
+                 "[nomor] Direkomendasikan karena membahas <topik utama>."
+
+                 Aturan keras: - Jangan gunakan kata "relevan", "serupa", atau "pengguna".
+                               - Satu baris per berita , urut sesuai nomor.
+                               - Setiap baris maksimal 12 kata setelah nomornya.
+                               - Fokus hanya pada topik inti berita."""
+    return prompt.strip()
+
+
+# "[1] ...\n[2] ..." -> {1: "...", 2: "..."}
+def parse_batched_answer(text):
+    return {int(number): line.strip() for number, line in re.findall(r"^\s*\[(\d+)\]\s*(.+?)\s*$", text or "", flags = re.MULTILINE)}
+
+
+# ================================ LLM CLIENTS ======================================
+
+# CLIENT INTERFACE (ABSTRACT , NEVER SERVED ITSELF) : SUBCLASSES IMPLEMENT async generate(prompt) -> str
+class ExplanationClient(ABC):
+
+    @abstractmethod
+    async def generate(self, prompt : str) -> str:
+        ...
+
+
+# GOOGLE GEMINI / GEMMA (ASYNC API , CLIENT CREATED ON FIRST USE , NOT AT IMPORT)
+class GeminiClient(ExplanationClient):
+
+    def __init__(self, model = "models/gemma-3-27b-it", api_key = None):
+        self.model = model
+        self.api_key = api_key
+        self._client = None
+
+    def client(self):
+
+        if self._client is None:
+            from dotenv import load_dotenv
+            from google import genai
+
+            # ACCESS AND GET GEMINI API KEY
+            load_dotenv()
+            self._client = genai.Client(api_key = self.api_key or os.getenv("GEMINI_API_KEY"))
+
+        return self._client
+
+    async def generate(self, prompt : str) -> str:
+        answer = await self.client().aio.models.generate_content(model = self.model, contents = prompt)
+        return answer.text
+
+
+# LOCAL FAKE (NO NETWORK) : FIXED LATENCY , ANSWERS BUILT FROM THE PROMPT , TRACKS PEAK CONCURRENCY
+class FakeClient(ExplanationClient):
+
+    def __init__(self, latency : float = 0.5):
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
 
-# GENERATE LLM EXPLANATION FOR RELEVANT ARTICLES
-def generate_explanation(article_ids, relevant_articles, df):
+    async def generate(self, prompt : str) -> str:
+
+        self.calls += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+
+        titles = re.findall(r"Judul: (.+)", prompt)
+        answers = [f"Direkomendasikan karena membahas {' '.join(title.split()[:4]).lower()}." for title in titles]
+
+        if "[1]" in prompt:
+            return "\n".join(f"[{i}] {answer}" for i, answer in enumerate(answers, start = 1))
+        return answers[0] if answers else ""
+
+
+# ================================ EXPLANATION SERVICE ======================================
+
+# SAME HISTORY (IN ANY ORDER) -> SAME FINGERPRINT
+def history_fingerprint(article_ids):
+    ids = np.unique(np.asarray(article_ids, dtype = np.int64))
+    return hashlib.blake2b(ids.tobytes(), digest_size = 16).hexdigest()
+
+
+# EXPLANATIONS FOR A WHOLE RESULT FRAME
+#   USER CONTEXT BUILT ONCE , CANDIDATE PROMPTS FANNED OUT CONCURRENTLY (<= concurrency IN FLIGHT , timeout EACH)
+#   OR ONE BATCHED PROMPT FOR ALL CANDIDATES , CACHED PER (HISTORY FINGERPRINT , CANDIDATE ID)
+#   A FAILED / TIMED OUT CALL GIVES reason = None FOR THAT CANDIDATE (THE REST OF THE RESPONSE IS NOT BLOCKED)
+class ExplanationService:
+
+    def __init__(self, client : ExplanationClient, concurrency : int = 4, timeout : float = 10.0, batched : bool = False,
+                 cache_size : int = 4096, cache_ttl : float = 3600):
+
+        self.client = client
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.batched = batched
+        self.cache = TTLCache(maxsize = cache_size, ttl = cache_ttl)
+        self.stats = {"requests": 0, "llm_calls": 0, "cache_hits": 0, "timeouts": 0, "errors": 0}
+        self._semaphore = None
+
+    def semaphore(self):
+        # CREATED INSIDE THE RUNNING EVENT LOOP
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def _call(self, prompt):
+
+        async with self.semaphore():
+            self.stats["llm_calls"] += 1
+            try:
+                with metrics.span("llm"):
+                    return await asyncio.wait_for(self.client.generate(prompt), timeout = self.timeout)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+            except Exception:
+                self.stats["errors"] += 1
+
+        return None
+
+    # (POSITION , REASON OR NONE) FOR EVERY ROW OF `recommendation` , AS SOON AS EACH ONE IS KNOWN
+    #   CACHED REASONS FIRST , THEN EVERY LLM ANSWER IN COMPLETION ORDER (ALL AT ONCE WHEN BATCHED)
+    async def explain_iter(self, article_ids, recommendation, catalog):
+
+        self.stats["requests"] += 1
+        fingerprint = history_fingerprint(article_ids)
+        candidate_ids = [int(candidate_id) for candidate_id in recommendation["id"]]
+
+        todo = []
+        for i, candidate_id in enumerate(candidate_ids):
+            reason = self.cache.get((fingerprint, candidate_id))
+            if reason is None:
+                todo.append(i)
+            else:
+                yield i, reason
+
+        self.stats["cache_hits"] += len(candidate_ids) - len(todo)
+        if not todo:
+            return
+
+        # BUILD CONTEXT (ONCE)
+        user_context = build_user_context(article_ids, catalog)
+        contexts = [build_candidate_context(recommendation.iloc[i]) for i in todo]
+
+        if self.batched:
+            parsed = parse_batched_answer(await self._call(build_batched_prompt(user_context, contexts)))
+            for number, i in enumerate(todo, start = 1):
+                yield i, self._remember(fingerprint, candidate_ids[i], parsed.get(number))
+            return
+
+        async def explain_one(i, context):
+            return i, await self._call(build_explanation_prompt(user_context, context))
+
+        tasks = [asyncio.ensure_future(explain_one(i, context)) for i, context in zip(todo, contexts)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                i, reason = await finished
+                yield i, self._remember(fingerprint, candidate_ids[i], reason)
+        finally:
+            # CONSUMER WENT AWAY (e.g. CLIENT CLOSED THE STREAM) : DO NOT KEEP CALLING THE LLM
+            for task in tasks:
+                task.cancel()
+
+    def _remember(self, fingerprint, candidate_id, reason):
+        if reason:
+            self.cache[(fingerprint, candidate_id)] = reason
+        return reason
+
+    # ONE REASON (OR NONE) PER ROW OF `recommendation` , IN ORDER
+    async def explain(self, article_ids, recommendation, catalog):
+
+        reasons = [None] * len(recommendation)
+        async for i, reason in self.explain_iter(article_ids, recommendation, catalog):
+            reasons[i] = reason
+
+        return reasons
+
+
+# LLM_BACKEND = gemini | fake , LLM_CONCURRENCY , LLM_TIMEOUT , LLM_BATCHED , LLM_CACHE_SIZE , LLM_CACHE_TTL
+def explanation_service_from_env():
+
+    backend = os.getenv("LLM_BACKEND", "gemini").lower()
+    if backend == "fake":
+        client = FakeClient(latency = float(os.getenv("LLM_FAKE_LATENCY", 0.5)))
+    else:
+        client = GeminiClient(model = os.getenv("LLM_MODEL", "models/gemma-3-27b-it"))
+
+    return ExplanationService(client,
+                              concurrency = int(os.getenv("LLM_CONCURRENCY", 4)),
+                              timeout = float(os.getenv("LLM_TIMEOUT", 10)),
+                              batched = os.getenv("LLM_BATCHED", "0").lower() in ("1", "true", "yes"),
+                              cache_size = int(os.getenv("LLM_CACHE_SIZE", 4096)),
+                              cache_ttl = float(os.getenv("LLM_CACHE_TTL", 3600)))
+
+
+# GENERATE LLM EXPLANATION FOR ONE RELEVANT ARTICLE (BLOCKING , KEPT FOR SCRIPTS / NOTEBOOKS)
+def generate_explanation(article_ids, relevant_articles, catalog, client : ExplanationClient | None = None):
 
     # BUILD CONTEXT
-    user_context = build_user_context(article_ids, df)
+    user_context = build_user_context(article_ids, catalog)
     candidate_context = build_candidate_context(relevant_articles)
 
     # BUILD PROMPT
     prompt = build_explanation_prompt(user_context, candidate_context)
 
     # LLM GENERATE
-    answer = client.models.generate_content(model= "models/gemma-3-27b-it", contents = prompt)
-
-    return answer.text
+    return asyncio.run((client or GeminiClient()).generate(prompt))
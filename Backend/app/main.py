@@ -1,53 +1,155 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from functools import lru_cache
-from cachetools import TTLCache, cached
 
+import os
 import faiss
 import numpy as np
 import pandas as pd
 
-import llm
-import schemas
-import recommender
+from . import llm
+from . import schemas
+from . import recommender
+from . import ann_index
+from . import batching
+from . import storage
+from . import result_cache
+from . import streaming
+from . import metrics
+from .catalog import ArticleCatalog, UnknownArticleError
+from .startup import Startup
+
+# TIMED STARTUP PHASES (LOGGED , SHOWN BY /health/ready) , PER-WORKER HOOKS RUN BY THE LIFESPAN
+startup = Startup("main")
 
 # DEFINE FASTAPI
-app = FastAPI(title = 'news recommender')
+app = FastAPI(title = 'news recommender', lifespan = startup.lifespan)
 
-# LOAD DATA
-df = pd.read_csv(r'../news-dataset/labeled_data.csv')
+# LATENCY HISTOGRAMS PER ENDPOINT , STAGE BREAKDOWN IN A Server-Timing HEADER FOR REQUESTS SENT WITH `X-Profile: 1`
+app.middleware("http")(metrics.observe_request)
 
-# LOAD FAISS 
-faiss_index = faiss.read_index(r"../news_embeddings.faiss")
+# DEFAULT ANN TUNING PER ENDPOINT (REQUEST VALUES WIN)
+SEARCH_PARAMS = {"recommendation": ann_index.endpoint_search_params("recommendation"),
+                 "reason": ann_index.endpoint_search_params("reason")}
 
+# MEMORY-MAPPED CATALOG DIRECTORY (BUILT WITH `python -m app.storage`) , CSV + FAISS FILE OTHERWISE
+CATALOG_DIR = os.getenv("CATALOG_DIR")
 
-# PREPROCESSING : CHANGE TO DATETIME
-df['date'] = pd.to_datetime(df['date'], errors='coerce')
-df['created_at'] = pd.to_datetime(df['created_at'], errors='coerce')
-df['updated_at'] = pd.to_datetime(df['updated_at'], errors='coerce')
+with startup.phase("load_catalog"):
 
+    if CATALOG_DIR:
+        catalog = storage.load_catalog(CATALOG_DIR)
+        df = catalog.df
 
-# DEFINE CACHE MEMORY
-cache_limit = TTLCache(maxsize = 500, ttl = 300)
+    else:
+        # LOAD DATA
+        df = pd.read_csv(r'../news-dataset/labeled_data.csv')
+
+        # LOAD FAISS 
+        faiss_index = faiss.read_index(r"../news_embeddings.faiss")
+
+
+        # PREPROCESSING : CHANGE TO DATETIME
+        df['date'] = pd.to_datetime(df['date'], errors='coerce')
+        df['created_at'] = pd.to_datetime(df['created_at'], errors='coerce')
+        df['updated_at'] = pd.to_datetime(df['updated_at'], errors='coerce')
+
+        # OPTIONAL ANN INDEX (BUILT OFFLINE WITH `python -m app.ann_index`) , EXACT SEARCH ON THE FLAT INDEX OTHERWISE
+        ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH")
+        search_index = ann_index.load_index(ANN_INDEX_PATH) if ANN_INDEX_PATH else faiss_index
+
+        # BUILD ARTICLE CATALOG (ID -> ROW MAP , EXACT EMBEDDING MATRIX , PUBLICATION DAYS)
+        catalog = ArticleCatalog(df, search_index, embeddings = faiss_index.reconstruct_n(0, faiss_index.ntotal))
+
+# FAISS THREADS OF THE STARTUP PHASES (ONE IN A PRELOADING PARENT , SEE main_HF) , EACH WORKER SETS ITS OWN IN start_worker()
+FAISS_THREADS = batching.configure_faiss_threads(1 if startup.preloading else None)
+catalog.rescore = int(os.getenv("RESCORE_CANDIDATES", 100))
+
+
+# DEFINE CACHE MEMORY (CANDIDATE POOLS , THE STOCHASTIC RERANK RUNS PER REQUEST)
+candidate_cache = result_cache.candidate_cache_from_env()
 
 
 # RECOMMENDATION PIPELINE
-@cached(cache = cache_limit)  #@lru_cache(maxsize = 500)    # --> CACHE RECOMMENDATION
-def recommender_pipeline(article_ids, top_k):
-    return recommender.news_recommender(article_ids = article_ids, 
-                                        df = df, 
-                                        faiss_index = faiss_index,
-                                        top_k = top_k)
+def recommender_pipeline(article_ids, top_k, nprobe = None, ef_search = None):
+
+    key = (article_ids, nprobe, ef_search)
+
+    with metrics.span("cache_lookup"):
+        pool = candidate_cache.get(key)
+    metrics.CACHE_REQUESTS.inc("miss" if pool is None else "hit")
+
+    if pool is None:
+        pool = recommender.candidate_pool(article_ids, catalog, nprobe = nprobe, ef_search = ef_search)
+        candidate_cache.put(key, pool)
+
+    return recommender.recommend_from_pool(pool, catalog, top_k = top_k)
+
+
+# FIND MOST RELEVANT DOCUMENT , UNKNOWN HISTORY BECOME 404 INSTEAD OF INDEX ERROR
+def run_recommender(article_ids, top_k, nprobe = None, ef_search = None):
+    try:
+        return recommender_pipeline(article_ids, top_k, nprobe, ef_search)
+    except UnknownArticleError as error:
+        raise HTTPException(status_code = 404, detail = {"message": "Unknown article ids", "unknown_ids": error.article_ids})
+
+# LLM EXPLANATIONS (ASYNC , CONCURRENT , CACHED) , LLM_BACKEND=fake FOR OFFLINE RUNS
+# (NO NETWORK AND NO API KEY AT IMPORT : THE GEMINI CLIENT IS CREATED BY THE FIRST EXPLANATION)
+explainer = llm.explanation_service_from_env()
+
+
+# PER WORKER PROCESS : FAISS THREADS (CORES / WEB_CONCURRENCY) AND THE OPTIONAL SEARCH MICRO-BATCHING THREAD
+@startup.on_worker
+def start_worker():
+
+    global FAISS_THREADS
+    FAISS_THREADS = batching.configure_faiss_threads()
+    catalog.batcher = batching.batcher_from_env()
+
+
+if hasattr(candidate_cache, "close"):
+    startup.before_fork(candidate_cache.close)
+
+
+# REPRESENTATIVE RECOMMENDATIONS BEFORE REPORTING READY (NOT CACHED , NO LLM CALL) , WARMUP_QUERIES=0 SKIPS THEM
+WARMUP_QUERIES = int(os.getenv("WARMUP_QUERIES", 8))
 
-# LLM GENERATOR 
-#@lru_cache(maxsize = 500)  # --> CACHE LLM 
-def llm_pipeline(article_ids, relevant_article):
+def warmup(queries = WARMUP_QUERIES):
 
-    return llm.generate_explanation(article_ids = article_ids, relevant_articles = relevant_article, df = df)
+    if queries <= 0:
+        return
 
-    # IF USE CACHE
-    #return llm.generate_explanation(article_ids = article_ids, 
-    #                                relevant_articles = {"id" : id, "source" : source, "title" : title, "summary" : summary},
-    #                               df = df)
+    defaults = SEARCH_PARAMS["recommendation"]
+    latest = np.argsort(-catalog.epoch_days, kind = "stable")[:queries * 5]
+
+    for rows in np.array_split(latest, max(min(queries, len(latest)), 1)):
+        if len(rows) == 0:
+            continue
+
+        article_ids = tuple(sorted(catalog.ids[rows].tolist()))
+        pool = recommender.candidate_pool(article_ids, catalog, nprobe = defaults["nprobe"], ef_search = defaults["ef_search"])
+        results = recommender.recommend_from_pool(pool, catalog, top_k = 10)
+
+        results["date"] = results["date"].astype(str)
+        schemas.RecommendationResponse(top_k = len(results), results = results.to_dict(orient = "records"))
+
+
+with startup.phase("warmup"):
+    warmup()
+startup.mark_warm()
+
+
+# LIVENESS : THE PROCESS ANSWERS
+@app.get(path = '/health/live')
+async def liveness():
+    return {"status": "alive", "pid": os.getpid()}
+
+
+# READINESS : 503 UNTIL THE WARMUP RAN AND THIS WORKER STARTED , WITH THE STARTUP PHASE TIMINGS
+@app.get(path = '/health/ready')
+async def readiness():
+    return JSONResponse(startup.info(), status_code = 200 if startup.ready else 503)
 
 
 
@@ -58,46 +160,80 @@ def get_recommendation(request : schemas.RecommendationRequest):
     article_ids = tuple(sorted(request.article_ids))
 
     # FIND MOST RELEVANT DOCUMENT (RECOMMENDATION)
-    results = recommender_pipeline(article_ids, request.top_k)
+    defaults = SEARCH_PARAMS["recommendation"]
+    results = run_recommender(article_ids, request.top_k,
+                              nprobe = request.nprobe or defaults["nprobe"],
+                              ef_search = request.ef_search or defaults["ef_search"])
 
     # RETURN DATETIME TO STR
-    results["date"] = results["date"].astype(str)
+    with metrics.span("serialize"):
+        results["date"] = results["date"].astype(str)
 
-    return schemas.RecommendationResponse(top_k = len(results), 
-                                          results = results.to_dict(orient = "records"))
+        return schemas.RecommendationResponse(top_k = len(results), 
+                                              results = results.to_dict(orient = "records"),
+                                              unknown_ids = catalog.missing(article_ids) or None)
 
 
 
 @app.post(path = '/recommendation/reason', response_model = schemas.RecommendationResponse, response_model_exclude_none = True)
-def get_reason(request : schemas.RecommendationRequest):
+async def get_reason(request : schemas.RecommendationRequest):
 
     # CONVERT TO TUPLE
     article_ids = tuple(sorted(request.article_ids))
 
-    # RECOMMENDATION
-    recommendation = recommender_pipeline(article_ids, request.top_k)
+    # RECOMMENDATION (CPU WORK , OFF THE EVENT LOOP)
+    defaults = SEARCH_PARAMS["reason"]
+    recommendation = await run_in_threadpool(run_recommender, article_ids, request.top_k,
+                                             nprobe = request.nprobe or defaults["nprobe"],
+                                             ef_search = request.ef_search or defaults["ef_search"])
 
     # RETURN DATETIME TO STR
     recommendation['date'] = recommendation['date'].astype(str)
 
-    # LLM
-    results = []
-    for _, row in recommendation.iterrows():
+    # LLM (ALL CANDIDATES AT ONCE)
+    reasons = await explainer.explain(article_ids, recommendation, catalog)
 
-        # GENERATE EXPLAINATION BY LLM
-        #llm_explanation = llm_pipeline(article_ids, row['id'], row['source'], row['title'], row['summary'])  #  --> KHUSUS JIKA PAKAI CACHE
+    results = []
+    for row, reason in zip(recommendation.to_dict(orient = "records"), reasons):
 
         results.append(schemas.RecommendationItem(id = row["id"],
                                                   title = row["title"],
                                                   source = row['source'],
+                                                  image  = row['image'],
+                                                  url    = row['url'],
                                                   date   = row['date'],
                                                   final_score = row['final_score'],
                                                   topic_id = row['topic_id'],
                                                   category = row['category'],
                                                   confidence = row['confidence'],
-                                                  reason = llm_pipeline(article_ids, row)))
+                                                  reason = reason))
+
+    return schemas.RecommendationResponse(top_k = request.top_k, results = results, unknown_ids = catalog.missing(article_ids) or None)
+
+
+
+# STREAMED VARIANT : RANKED ITEMS IMMEDIATELY , THEN EACH REASON AS SOON AS THE LLM ANSWERS (?format=ndjson | sse)
+@app.post(path = '/recommendation/reason/stream')
+async def stream_reason(request : schemas.RecommendationRequest, stream_format : str = Query("ndjson", alias = "format", pattern = "^(ndjson|sse)$")):
+
+    article_ids = tuple(sorted(request.article_ids))
+
+    defaults = SEARCH_PARAMS["reason"]
+    recommendation = await run_in_threadpool(run_recommender, article_ids, request.top_k,
+                                             nprobe = request.nprobe or defaults["nprobe"],
+                                             ef_search = request.ef_search or defaults["ef_search"])
+
+    async def events():
+        yield streaming.items_event(recommendation, catalog.missing(article_ids))
+
+        async for rank, reason in explainer.explain_iter(article_ids, recommendation, catalog):
+            yield {"type": "reason", "rank": rank, "id": int(recommendation["id"].iloc[rank]), "reason": reason}
+
+    return streaming.stream_events(events(), stream_format)
 
-    return schemas.RecommendationResponse(top_k = request.top_k, results = results)
-        
 
 
+# PROMETHEUS SCRAPE ENDPOINT (LLM TIME IS THE `llm` STAGE)
+@app.get(path = '/metrics', include_in_schema = False)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type = "text/plain; version=0.0.4")
@@ -1,20 +1,42 @@
+import hmac
+import os
+import secrets
+import tempfile
 import faiss
 import numpy as np
 import pandas as pd
 
-from fastapi import FastAPI
-from datasets import load_dataset
-from huggingface_hub import hf_hub_download
-
-from cachetools import TTLCache, cached
+from fastapi import FastAPI, HTTPException, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from . import schemas
 from . import recommender
-
+from . import ann_index
+from . import batching
+from . import storage
+from . import body_store
+from . import result_cache
+from . import streaming
+from . import metrics
+from .catalog import ArticleCatalog, UnknownArticleError
+from .neighbors import NeighborGraph, neighbor_candidate_pool
+from .profiles import profile_candidate_pool, profile_store_from_env
+from .trending import trending_from_env
+from .text_search import TextIndex
+from .shards import ShardedIndex
+from .filters import ArticleFilter
+from .interests import interest_candidate_pool
+from .startup import Startup
+from .ingest import CatalogStore, CatalogSnapshot, DropDirectoryWatcher, IngestJournal, JournalReplayError, invalidate_personalization_cache
+
+
+# TIMED STARTUP PHASES (LOGGED , SHOWN BY /health/ready) , PER-WORKER HOOKS RUN BY THE LIFESPAN
+startup = Startup("main_HF")
 
 # DEFINE FASTAPI LAUNCHER
-app = FastAPI(title="Indonesian News Recommender API", docs_url = "/run/api/docs", redoc_url = "/run/api/redoc", openapi_url = "/run/api/openapi.json")
+app = FastAPI(title="Indonesian News Recommender API", docs_url = "/run/api/docs", redoc_url = "/run/api/redoc", openapi_url = "/run/api/openapi.json",
+              lifespan = startup.lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,43 +44,337 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], 
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# LATENCY HISTOGRAMS PER ENDPOINT , STAGE BREAKDOWN IN A Server-Timing HEADER FOR REQUESTS SENT WITH `X-Profile: 1`
+app.middleware("http")(metrics.observe_request)
+
+
+# DEFAULT ANN TUNING PER ENDPOINT (REQUEST VALUES WIN)
+SEARCH_PARAMS = {"personalization": ann_index.endpoint_search_params("personalization")}
+
+# MEMORY-MAPPED CATALOG DIRECTORY (BUILT WITH `python -m app.storage`) , HUGGING FACE DATASET OTHERWISE
+CATALOG_DIR = os.getenv("CATALOG_DIR")
+
+with startup.phase("load_catalog"):
+
+    if CATALOG_DIR:
+
+        # NO CSV PARSING , NO DATETIME PARSING , EMBEDDINGS AND INDEX PAGES SHARED BY EVERY WORKER
+        catalog = storage.load_catalog(CATALOG_DIR)
+        bodies = storage.load_body_store(CATALOG_DIR, cache_size = int(os.getenv("BODY_CACHE_SIZE", 1024)))
+
+    else:
+        from datasets import load_dataset
+        from huggingface_hub import hf_hub_download
+
+        # LOAD DATASET
+        dataset = load_dataset(path="SandKing/News-Recommendation",
+                               data_files="labeled_news.csv",
+                               split="train",
+                               streaming=False)
+
+        # CONVERT TO PANDAS
+        df = dataset.to_pandas()
+
+        # LOAD FAISS 
+        FAISS_path = hf_hub_download(repo_id = "SandKing/News-Recommendation", 
+                                     filename = 'news_embeddings.faiss', 
+                                     repo_type = "dataset")
+        faiss_index = faiss.read_index(FAISS_path)
+
+        # PREPROCESS
+        # CONVERT OBJECT TO DATETIME DATA TYPE
+        for col in ["date", "created_at", "updated_at"]:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+
+        # MOVE ARTICLE BODIES TO AN ON-DISK STORE , THE RANKING FRAME KEEPS ONLY THE COLUMNS THE RANKERS USE
+        df, bodies = body_store.split_bodies(df, os.getenv("BODY_STORE_DIR") or tempfile.mkdtemp(prefix = "article-bodies-"),
+                                             cache_size = int(os.getenv("BODY_CACHE_SIZE", 1024)))
+
+        # OPTIONAL ANN INDEX (BUILT OFFLINE WITH `python -m app.ann_index`) , EXACT SEARCH ON THE FLAT INDEX OTHERWISE
+        ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH")
+        search_index = ann_index.load_index(ANN_INDEX_PATH) if ANN_INDEX_PATH else faiss_index
+
+        # EXACT EMBEDDINGS , MEMORY-MAPPED FROM EMBEDDINGS_DIR WHEN SET (e.g. NEXT TO A COMPRESSED ANN_INDEX_PATH)
+        embeddings = faiss_index.reconstruct_n(0, faiss_index.ntotal)
+        EMBEDDINGS_DIR = os.getenv("EMBEDDINGS_DIR")
+        if EMBEDDINGS_DIR:
+            os.makedirs(EMBEDDINGS_DIR, exist_ok = True)
+            embeddings = storage.write_embeddings(embeddings, os.path.join(EMBEDDINGS_DIR, "embeddings.f32"))
+
+        # BUILD ARTICLE CATALOG (ID -> ROW MAP , EXACT EMBEDDING MATRIX , PUBLICATION DAYS)
+        catalog = ArticleCatalog(df, search_index, embeddings = embeddings)
+
+        # THE FLAT INDEX IS ONLY KEPT WHEN IT IS THE SEARCH INDEX
+        del faiss_index, embeddings
+
+
+# FAISS THREADS OF THE STARTUP PHASES : ONE IN A PRELOADING PARENT (AN OPENMP THREAD POOL DOES NOT SURVIVE fork() ,
+# WORKERS THAT INHERIT ONE HANG IN THEIR FIRST SEARCH) , EACH WORKER SETS ITS OWN IN start_worker()
+FAISS_THREADS = batching.configure_faiss_threads(1 if startup.preloading else None)
+
+# COMPRESSED INDEXES (sq_fp16 , sq_int8 , pq , ivf_pq) : EXACT RESCORING OF THE TOP RESCORE_CANDIDATES HITS (0 = OFF)
+catalog.rescore = int(os.getenv("RESCORE_CANDIDATES", 100))
+
+# ITEM-TO-ITEM NEIGHBOR GRAPH (RELATED ARTICLES , NEIGHBOR PERSONALIZATION) : ONLY LOADED , PRECOMPUTED OFFLINE WITH
+# `python -m app.neighbors --catalog <dir>` INTO NEIGHBOR_GRAPH_DIR (DEFAULT CATALOG_DIR)
+#   THE BUILD IS O(N^2 d) : AT STARTUP IT WOULD DELAY READINESS (AND RUN IN A PRELOADING PARENT) , SO IT IS OPT-IN
+#   (NEIGHBOR_BUILD=1 , TOP-NEIGHBOR_K) FOR SMALL CATALOGS AND DEVELOPMENT
+NEIGHBOR_GRAPH_DIR = os.getenv("NEIGHBOR_GRAPH_DIR") or CATALOG_DIR
+NEIGHBOR_K = int(os.getenv("NEIGHBOR_K", 20))
+NEIGHBOR_BUILD = os.getenv("NEIGHBOR_BUILD", "0").lower() in ("1", "true", "yes")
+
+with startup.phase("neighbors"):
+    neighbors = None
+    if NEIGHBOR_GRAPH_DIR and NeighborGraph.exists(NEIGHBOR_GRAPH_DIR):
+        neighbors = NeighborGraph.load(NEIGHBOR_GRAPH_DIR)
+        if len(neighbors) != len(catalog):
+            startup.log(f"neighbor graph in {NEIGHBOR_GRAPH_DIR} has {len(neighbors)} rows , the catalog {len(catalog)} : not used")
+            neighbors = None
+
+    if neighbors is None and NEIGHBOR_BUILD and NEIGHBOR_K > 0:
+        neighbors = NeighborGraph.build(catalog, k = NEIGHBOR_K)
+
+# OPTIONAL TIME SHARDS (SHARD_WINDOW = week | month) : ONE INDEX PER WINDOW OF THE LAST SHARD_LIVE_DAYS DAYS
+# REQUESTS WITH A horizon_days ONLY SEARCH THE WINDOWS INSIDE IT
+SHARD_WINDOW = os.getenv("SHARD_WINDOW")
+if SHARD_WINDOW:
+    with startup.phase("shards"):
+        catalog.shards = ShardedIndex.build(catalog, window = SHARD_WINDOW, live_days = float(os.getenv("SHARD_LIVE_DAYS", 90)),
+                                            kind = os.getenv("SHARD_INDEX_KIND", "flat"))
+
+# FULL-TEXT SEARCH (BM25 OVER title + summary) , TEXT_SEARCH=0 TURNS IT OFF
+with startup.phase("text_index"):
+    text_index = TextIndex.build(catalog) if os.getenv("TEXT_SEARCH", "1") != "0" else None
+
+# CURRENT SNAPSHOT (CATALOG + PRECOMPUTED COLD-START POOLS) , SWAPPED ATOMICALLY ON INGESTION
+# EVERY ENDPOINT READS `store.current` ONCE , SO IN-FLIGHT REQUESTS KEEP A CONSISTENT VIEW
+with startup.phase("feed_pools"):
+    store = CatalogStore(CatalogSnapshot(catalog, neighbors = neighbors, text_index = text_index), bodies = bodies)
+
+# OPTIONAL RETENTION : WHOLE SHARDS OLDER THAN RETENTION_DAYS ARE DROPPED (AND ARCHIVED TO SHARD_ARCHIVE_DIR)
+RETENTION_DAYS = os.getenv("RETENTION_DAYS")
+
+# TRENDING : DECAYED VIEW COUNTS (DETAIL PAGES + NEW PERSONALIZATION READS) , TOP LISTS REBUILT IN THE BACKGROUND
+# PER WORKER , OR SUMMED OVER EVERY WORKER WHEN TRENDING_PATH IS SET (app.serve SETS IT WHEN IT FORKS MORE THAN ONE)
+with startup.phase("trending"):
+    trending = trending_from_env()
+    trending.refresh(store.current)
+
+# OPTIONAL WATCHED DROP DIRECTORY FOR NEW / RETRACTED ARTICLES
+INGEST_DROP_DIR = os.getenv("INGEST_DROP_DIR")
+
+# SHARED INGESTION JOURNAL OF THE WORKER PROCESSES (SET BY app.serve WHEN IT FORKS MORE THAN ONE) : EVERY CHANGE GOES THROUGH IT
+# AND EVERY WORKER REPLAYS IT , ONE WORKER (THE LEADER) WATCHES INGEST_DROP_DIR AND RUNS RETENTION
+# WITHOUT ONE EACH WORKER HAS ITS OWN CATALOG AND /admin/articles ONLY CHANGES THE WORKER THAT ANSWERED
+INGEST_JOURNAL_DIR = os.getenv("INGEST_JOURNAL_DIR")
+
+# TOKEN FOR EVERY /admin ENDPOINT (SENT AS X-Ingest-Token) , WITHOUT ONE THE /admin ENDPOINTS ANSWER 503
+INGEST_TOKEN = os.getenv("INGEST_TOKEN")
+
+
+# RERANKER SETTINGS OF THE PERSONALIZED FEEDS
+PIPELINE_PARAMS = {"temperature": 0.2, "lambda_div": 0.3, "max_source": 5}
+
+# MAX USERS IN ONE BATCH REQUEST
+MAX_BATCH_USERS = int(os.getenv("MAX_BATCH_USERS", 2000))
+
+# CANDIDATE CACHE (FAISS HITS + FRESHNESS PER HISTORY , 5 MIN TTL) , SHARED BY THE WORKERS WHEN RESULT_CACHE_PATH IS SET
+candidate_cache = result_cache.candidate_cache_from_env()
+
+# ON INGESTION DROP ONLY THE CACHED POOLS THE CHANGE CAN AFFECT
+store.add_listener(lambda change: invalidate_personalization_cache(candidate_cache, change))
+
+# CHANGES WRITTEN BEFORE THIS PROCESS STARTED ARE REPLAYED NOW (ONCE IN THE PRELOADING PARENT) , THE ENDPOINTS WRITE TO `ingest_writer`
+journal = None
+if INGEST_JOURNAL_DIR:
+    with startup.phase("ingest_journal"):
+        journal = IngestJournal(store, INGEST_JOURNAL_DIR, interval = float(os.getenv("INGEST_JOURNAL_POLL_SECONDS", 1)))
+        try:
+            journal.catch_up()
+        except JournalReplayError as error:
+            startup.log(f"ingest journal : {error} , the workers retry it")
+ingest_writer = journal or store
+
+
+# INCREMENTAL USER PROFILES (DECAYED EMBEDDING SUM PER USER) , PERSISTED AND SHARED BY THE WORKERS WHEN PROFILE_STORE_PATH IS SET
+profiles = profile_store_from_env()
+
+
+# PER WORKER PROCESS (THREADS DO NOT SURVIVE A fork() , AND THE PRELOADING PARENT SEARCHES WITH ONE FAISS THREAD)
+@startup.on_worker
+def start_worker():
+
+    # FAISS THREADS PER WORKER (FAISS_THREADS , OR CORES / WEB_CONCURRENCY) AND OPTIONAL SEARCH MICRO-BATCHING
+    global FAISS_THREADS
+    FAISS_THREADS = batching.configure_faiss_threads()
+    store.current.catalog.batcher = batching.batcher_from_env()
+
+    store.start_feed_refresher(interval = float(os.getenv("FEED_REFRESH_SECONDS", 600)))
+    trending.start(store, interval = float(os.getenv("TRENDING_REFRESH_SECONDS", 30)))
+
+    # WITH A JOURNAL ONLY ITS LEADER RUNS THE BACKGROUND WRITERS , THE OTHER WORKERS REPLAY WHAT THEY WRITE
+    if journal is None:
+        start_ingest_writers()
+    else:
+        journal.start(on_lead = start_ingest_writers)
+
+
+# BACKGROUND WRITERS (RETENTION , DROP DIRECTORY) , IN ONE PROCESS ONLY
+def start_ingest_writers():
+
+    if SHARD_WINDOW and RETENTION_DAYS:
+        store.start_retention(float(RETENTION_DAYS), interval = float(os.getenv("RETENTION_CHECK_SECONDS", 3600)),
+                              archive_dir = os.getenv("SHARD_ARCHIVE_DIR"), writer = ingest_writer)
 
-# LOAD DATASET
-dataset = load_dataset(path="SandKing/News-Recommendation",
-                       data_files="labeled_news.csv",
-                       split="train",
-                       streaming=False)
+    if INGEST_DROP_DIR:
+        DropDirectoryWatcher(ingest_writer, INGEST_DROP_DIR, interval = float(os.getenv("INGEST_POLL_SECONDS", 10))).start()
 
-# CONVERT TO PANDAS
-df = dataset.to_pandas()
 
-# LOAD FAISS 
-FAISS_path = hf_hub_download(repo_id = "SandKing/News-Recommendation", 
-                             filename = 'news_embeddings.faiss', 
-                             repo_type = "dataset")
-faiss_index = faiss.read_index(FAISS_path)
+# SQLITE CONNECTIONS (RESULT_CACHE_PATH , PROFILE_STORE_PATH , TRENDING_PATH) MUST NOT CROSS THE fork() , THE WORKERS REOPEN THEIR OWN
+for backend in (candidate_cache, profiles.backend, trending.shared):
+    if hasattr(backend, "close"):
+        startup.before_fork(backend.close)
 
-# PREPROCESS
-# CONVERT OBJECT TO DATETIME DATA TYPE
-for col in ["date", "created_at", "updated_at"]:
-    df[col] = pd.to_datetime(df[col], errors="coerce")
 
+# REPRESENTATIVE QUERIES BEFORE REPORTING READY : THE FIRST-CALL COSTS (INDEX AND MEMORY-MAPPED PAGES , NUMPY / PANDAS / PYDANTIC
+# CODE PATHS) ARE PAID HERE , ONCE IN THE PARENT WHEN PRELOADED , INSTEAD OF BY THE FIRST USERS . NOTHING IS CACHED OR COUNTED
+WARMUP_QUERIES = int(os.getenv("WARMUP_QUERIES", 8))
 
-# CACHE (REMOVE CACHE AFTER 5 MIN)
-cache_limit = TTLCache(maxsize = 500, ttl = 300)
+def warmup(queries = WARMUP_QUERIES):
 
-# RECOMMENDATION PIPELINE
-@cached(cache = cache_limit)
-def recommender_pipeline(article_ids, top_k):
-    return recommender.news_recommender(article_ids = article_ids, 
-                                        df = df, 
-                                        faiss_index = faiss_index, 
-                                        top_k = top_k,
-                                        temperature = 0.2,
-                                        lambda_div = 0.3,
-                                        max_source = 5)
+    if queries <= 0:
+        return
+
+    snapshot = store.current
+    catalog, feeds = snapshot.catalog, snapshot.feeds
+    defaults = SEARCH_PARAMS["personalization"]
+
+    # HISTORIES OF 5 RECENT ARTICLES
+    latest = feeds.latest(queries * 5)
+    for rows in np.array_split(latest, max(min(queries, len(latest)), 1)):
+
+        if len(rows) == 0:
+            continue
+
+        article_ids = tuple(sorted(catalog.ids[rows].tolist()))
+        for build in (recommender.candidate_pool, interest_candidate_pool):
+            pool = build(article_ids, catalog, nprobe = defaults["nprobe"], ef_search = defaults["ef_search"], horizon_days = defaults["horizon_days"])
+            results = recommender.recommend_from_pool(pool, catalog, top_k = 10, **PIPELINE_PARAMS)
+
+        if snapshot.neighbors is not None:
+            pool = neighbor_candidate_pool(article_ids, catalog, snapshot.neighbors)
+            recommender.recommend_from_pool(pool, catalog, top_k = 10, **PIPELINE_PARAMS)
+
+        if snapshot.text_index is not None:
+            title = str(catalog.df["title"].iloc[rows[0]])
+            snapshot.text_index.search(title, catalog, top_k = 10)
+            snapshot.text_index.hybrid_search(title, catalog, top_k = 10, nprobe = defaults["nprobe"], ef_search = defaults["ef_search"])
+
+        results["date"] = results["date"].astype(str)
+        schemas.RecommendationResponse(top_k = len(results), results = results.to_dict(orient = "records"))
+
+    # COLD-START FEEDS
+    for category in list(feeds.by_category)[:queries]:
+        feeds.frame(feeds.category_feed(category, "warmup"))
+    feeds.frame(feeds.home_feed("warmup"))
+
+
+with startup.phase("warmup"):
+    warmup()
+startup.mark_warm()
+
+
+# CANDIDATE CACHE KEY : INTEREST POOLS ARE CACHED APART FROM THE SINGLE-VECTOR ONES (THE LAST FIELD , ALSO READ BY THE INVALIDATION)
+def pool_key(article_ids, nprobe, ef_search, mode, horizon_days, article_filter):
+    return (article_ids, nprobe, ef_search, horizon_days, article_filter.key(), "interests" if mode == "interests" else "ann")
+
+
+# POOL OF A HISTORY , NONE WHEN NONE OF ITS ARTICLES IS KNOWN (A BATCH ANSWERS THAT USER WITH AN EMPTY LIST , NOT A 404)
+def known_history_pool(build, *args, **kwargs):
+    try:
+        return build(*args, **kwargs)
+    except UnknownArticleError:
+        return None
+
+
+# CANDIDATE POOLS OF MANY HISTORIES : SAME MODES AND CANDIDATE CACHE AS recommender_pipeline , THE "ann" POOLS THE CACHE
+# MISSES ARE RETRIEVED WITH ONE FAISS SEARCH FOR THE WHOLE BATCH
+def batch_candidate_pools(histories, snapshot, nprobe = None, ef_search = None, mode = None, horizon_days = None, article_filter = None):
+
+    catalog = snapshot.catalog
+    article_filter = article_filter or ArticleFilter()
+
+    if mode == "neighbors" and snapshot.neighbors is not None and not article_filter:
+        return [known_history_pool(neighbor_candidate_pool, history, catalog, snapshot.neighbors) for history in histories]
+
+    keys = [pool_key(history, nprobe, ef_search, mode, horizon_days, article_filter) for history in histories]
+    with metrics.span("cache_lookup"):
+        pools = [candidate_cache.get(key, version = snapshot.version) for key in keys]
+    for pool in pools:
+        metrics.CACHE_REQUESTS.inc("miss" if pool is None else "hit")
+
+    misses = [user for user, pool in enumerate(pools) if pool is None]
+    if not misses:
+        return pools
+
+    search = {"nprobe": nprobe, "ef_search": ef_search, "horizon_days": horizon_days,
+              "allowed_rows": article_filter.rows(snapshot.feeds) if article_filter else None}
+
+    if mode == "interests":
+        built = [known_history_pool(interest_candidate_pool, histories[user], catalog, **search) for user in misses]
+    else:
+        built = [pool for pool, _ in recommender.candidate_pool_batch([histories[user] for user in misses], catalog, **search)]
+
+    for user, pool in zip(misses, built):
+        pools[user] = pool
+        if pool is not None and store.current is snapshot:
+            candidate_cache.put(keys[user], pool, version = snapshot.version)
+
+    return pools
+
+
+# RECOMMENDATION PIPELINE : CACHED CANDIDATE POOL -> PER-REQUEST RERANK (FRESH FRAME , SAFE TO MODIFY)
+def recommender_pipeline(article_ids, top_k, nprobe = None, ef_search = None, mode = None, horizon_days = None, article_filter = None):
+
+    snapshot = store.current
+    article_filter = article_filter or ArticleFilter()
+
+    # NEIGHBOR MODE : CANDIDATES FROM THE PRECOMPUTED GRAPH (A FEW ROW LOOKUPS , NOT WORTH CACHING)
+    # (FILTERED FEEDS ALWAYS SEARCH : A NEIGHBOR LIST CANNOT GUARANTEE top_k IN-FILTER ARTICLES)
+    if mode == "neighbors" and snapshot.neighbors is not None and not article_filter:
+        pool = neighbor_candidate_pool(article_ids, snapshot.catalog, snapshot.neighbors)
+        return recommender.recommend_from_pool(pool, snapshot.catalog, top_k = top_k, **PIPELINE_PARAMS)
+
+    retrieval = "interests" if mode == "interests" else "ann"
+    key = pool_key(article_ids, nprobe, ef_search, mode, horizon_days, article_filter)
+
+    with metrics.span("cache_lookup"):
+        pool = candidate_cache.get(key, version = snapshot.version)
+    metrics.CACHE_REQUESTS.inc("miss" if pool is None else "hit")
+
+    if pool is None:
+        # FILTERS ARE APPLIED DURING THE SEARCH (ONLY IN-FILTER ROWS ARE SCORED)
+        allowed_rows = article_filter.rows(snapshot.feeds) if article_filter else None
+        build = interest_candidate_pool if retrieval == "interests" else recommender.candidate_pool
+        pool = build(article_ids, snapshot.catalog, nprobe = nprobe, ef_search = ef_search, horizon_days = horizon_days, allowed_rows = allowed_rows)
+
+        # DO NOT CACHE A POOL COMPUTED ON A SNAPSHOT THAT WAS SWAPPED OUT MEANWHILE
+        if store.current is snapshot:
+            candidate_cache.put(key, pool, version = snapshot.version)
+
+    params = dict(PIPELINE_PARAMS, max_source = article_filter.source_cap(top_k, PIPELINE_PARAMS["max_source"]))
+    return recommender.recommend_from_pool(pool, snapshot.catalog, top_k = top_k, **params)
+
+
+# UNKNOWN HISTORY BECOME 404 INSTEAD OF INDEX ERROR
+def run_recommender(article_ids, top_k, nprobe = None, ef_search = None, mode = None, horizon_days = None, article_filter = None):
+    try:
+        return recommender_pipeline(article_ids, top_k, nprobe, ef_search, mode, horizon_days, article_filter)
+    except UnknownArticleError as error:
+        raise HTTPException(status_code = 404, detail = {"message": "Unknown article ids", "unknown_ids": error.article_ids})
 
 
 @app.get("/")
@@ -66,22 +382,155 @@ def health_check():
     return {"status": "ok", "message": "news recommender api is running"}
 
 
+# LIVENESS : THE PROCESS ANSWERS (ASYNC , SO A SATURATED THREADPOOL DOES NOT GET THE WORKER KILLED)
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive", "pid": os.getpid()}
+
+
+# READINESS : 503 UNTIL THE WARMUP RAN AND THIS WORKER STARTED ITS BACKGROUND TASKS , WITH THE STARTUP PHASE TIMINGS
+# (AND WHILE AN INGEST JOURNAL ENTRY FAILS TO REPLAY : THE WORKER SERVES AN OLDER CATALOG THAN THE OTHERS)
+@app.get("/health/ready")
+async def readiness():
+
+    info = startup.info()
+    if journal is not None:
+        info["ingest_journal"] = journal.info()
+
+    ready = startup.ready and (journal is None or journal.error is None)
+    return JSONResponse(info, status_code = 200 if ready else 503)
+
+
+# PROMETHEUS SCRAPE ENDPOINT (METRICS OF THE WORKER THAT ANSWERS)
+@app.get("/metrics", include_in_schema = False)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type = "text/plain; version=0.0.4")
+
+
 # RECOMMENDATION
 @app.post("/feed/personalization", response_model = schemas.RecommendationResponse, response_model_exclude_none=True)
 def get_recommendation(request: schemas.RecommendationRequest):
 
+    # NO TRENDING VIEW HERE : THE HISTORY IS RESENT ON EVERY REFRESH , VIEWS COME FROM /news AND /feed/personalization/user
     article_ids = tuple(sorted(request.article_ids))
-    results = recommender_pipeline(article_ids, request.top_k)
-    results["date"] = results["date"].astype(str)
+    defaults = SEARCH_PARAMS["personalization"]
+    results = run_recommender(article_ids, request.top_k,
+                              nprobe = request.nprobe or defaults["nprobe"],
+                              ef_search = request.ef_search or defaults["ef_search"],
+                              mode = request.mode,
+                              horizon_days = request.horizon_days or defaults["horizon_days"],
+                              article_filter = ArticleFilter.from_request(request))
+
+    with metrics.span("serialize"):
+        results["date"] = results["date"].astype(str)
 
-    return schemas.RecommendationResponse(top_k = len(results), results = results.to_dict(orient="records"))
+        return schemas.RecommendationResponse(top_k = len(results), 
+                                              results = results.to_dict(orient="records"),
+                                              unknown_ids = store.current.catalog.missing(article_ids) or None)
+
+
+# STREAMED VARIANT (?format=ndjson | sse) : SAME RESULTS , SERIALIZED WITHOUT PER-ITEM PYDANTIC VALIDATION
+@app.post("/feed/personalization/stream")
+def stream_recommendation(request: schemas.RecommendationRequest, stream_format: str = Query("ndjson", alias = "format", pattern = "^(ndjson|sse)$")):
+
+    article_ids = tuple(sorted(request.article_ids))
+    defaults = SEARCH_PARAMS["personalization"]
+    results = run_recommender(article_ids, request.top_k,
+                              nprobe = request.nprobe or defaults["nprobe"],
+                              ef_search = request.ef_search or defaults["ef_search"],
+                              mode = request.mode,
+                              horizon_days = request.horizon_days or defaults["horizon_days"],
+                              article_filter = ArticleFilter.from_request(request))
+
+    return streaming.stream_events([streaming.items_event(results, store.current.catalog.missing(article_ids))], stream_format)
+
+
+# BATCH RECOMMENDATION (MANY USERS , ONE FAISS SEARCH FOR THE POOLS THE CACHE MISSES) FOR OFFLINE DIGEST / PUSH JOBS
+@app.post("/feed/personalization/batch", response_model = schemas.BatchRecommendationResponse, response_model_exclude_none=True)
+def get_batch_recommendation(request: schemas.BatchRecommendationRequest):
+
+    if len(request.users) > MAX_BATCH_USERS:
+        raise HTTPException(status_code = 413, detail = f"At most {MAX_BATCH_USERS} users per batch")
+
+    histories = [tuple(sorted(user.article_ids)) for user in request.users]
+    defaults = SEARCH_PARAMS["personalization"]
+    snapshot = store.current
+
+    article_filter = ArticleFilter.from_request(request)
+    params = dict(PIPELINE_PARAMS, max_source = article_filter.source_cap(request.top_k, PIPELINE_PARAMS["max_source"]))
+
+    pools = batch_candidate_pools(histories, snapshot,
+                                  nprobe = request.nprobe or defaults["nprobe"],
+                                  ef_search = request.ef_search or defaults["ef_search"],
+                                  mode = request.mode,
+                                  horizon_days = request.horizon_days or defaults["horizon_days"],
+                                  article_filter = article_filter)
+
+    results = []
+    for user, history, pool in zip(request.users, histories, pools):
+
+        unknown = snapshot.catalog.missing(history)
+        if pool is None:
+            results.append(schemas.UserRecommendation(user_id = user.user_id, top_k = 0, results = [], unknown_ids = unknown))
+            continue
+
+        recommendation = recommender.recommend_from_pool(pool, snapshot.catalog, top_k = request.top_k, **params)
+        recommendation["date"] = recommendation["date"].astype(str)
+        results.append(schemas.UserRecommendation(user_id = user.user_id,
+                                                  top_k = len(recommendation),
+                                                  results = recommendation.to_dict(orient = "records"),
+                                                  unknown_ids = unknown or None))
+
+    return schemas.BatchRecommendationResponse(results = results)
+
+
+# RECOMMENDATION FROM A STORED PROFILE : O(dim) PER NEW READ + ONE SEARCH , THE FULL HISTORY IS NEVER RESENT
+# (NOT CACHED : THE PROFILE MOVES WITH EVERY READ , AND WITHOUT A SESSION EMBEDDING A MISS COSTS ONLY THE SEARCH)
+@app.post("/feed/personalization/user", response_model = schemas.RecommendationResponse, response_model_exclude_none=True)
+def get_profile_recommendation(request: schemas.ProfileRecommendationRequest):
+
+    snapshot = store.current
+    trending.record(request.new_article_ids)
+    profile, unknown = profiles.record(request.user_id, request.new_article_ids, snapshot.catalog)
+
+    if profile is None:
+        raise HTTPException(status_code = 404, detail = {"message": "Unknown user and no known article ids", "unknown_ids": unknown})
+
+    defaults = SEARCH_PARAMS["personalization"]
+    article_filter = ArticleFilter.from_request(request)
+
+    pool = profile_candidate_pool(profile, snapshot.catalog,
+                                  nprobe = request.nprobe or defaults["nprobe"],
+                                  ef_search = request.ef_search or defaults["ef_search"],
+                                  horizon_days = request.horizon_days or defaults["horizon_days"],
+                                  allowed_rows = article_filter.rows(snapshot.feeds) if article_filter else None)
+
+    params = dict(PIPELINE_PARAMS, max_source = article_filter.source_cap(request.top_k, PIPELINE_PARAMS["max_source"]))
+    results = recommender.recommend_from_pool(pool, snapshot.catalog, top_k = request.top_k, **params)
+
+    with metrics.span("serialize"):
+        results["date"] = results["date"].astype(str)
+
+        return schemas.RecommendationResponse(top_k = len(results),
+                                              results = results.to_dict(orient="records"),
+                                              unknown_ids = unknown or None)
+
+
+# FORGET A USER PROFILE
+@app.delete("/feed/personalization/user/{user_id}")
+def reset_profile(user_id: str):
+
+    if not profiles.reset(user_id):
+        raise HTTPException(status_code = 404, detail = "Unknown user")
+    return {"user_id": user_id, "deleted": True}
 
 
 # COLD START RECOMMENDATION
 @app.get("/feed/home", response_model = schemas.RecommendationResponse)
-def cold_recommendation(user_id, top_k: int = 10):
+def cold_recommendation(user_id, top_k: int = Query(10, ge = 1, le = schemas.MAX_TOP_K)):
 
-    results = recommender.home_feed_news(df, user_id, top_k)
+    feeds = store.current.feeds
+    results = feeds.frame(feeds.home_feed(user_id, top_k = top_k))
     results["date"] = results["date"].astype(str)
 
     return schemas.RecommendationResponse(top_k = len(results), 
@@ -89,10 +538,11 @@ def cold_recommendation(user_id, top_k: int = 10):
 
 # LATEST NEWS RECOMMENDATION
 @app.get("/feed/latest", response_model= schemas.RecommendationResponse)
-def latest_news_recommendation(top_k : int = 20):
+def latest_news_recommendation(top_k : int = Query(20, ge = 1, le = schemas.MAX_TOP_K)):
 
     # GET TOP-K LATEST NEWS
-    results = recommender.latest_news(df, top_k)
+    feeds = store.current.feeds
+    results = feeds.frame(feeds.latest(top_k))
     results['date'] = results['date'].astype(str)
 
     return schemas.RecommendationResponse(top_k = len(results),
@@ -101,9 +551,10 @@ def latest_news_recommendation(top_k : int = 20):
 
 # CATEGORY RECOMMENDATION
 @app.get("/feed/category/{category}", response_model = schemas.RecommendationResponse)
-def category_feed_recommendation(category: str, top_k: int = 10):
+def category_feed_recommendation(category: str, top_k: int = Query(10, ge = 1, le = schemas.MAX_TOP_K), user_id: str | None = None):
 
-    results = recommender.category_feed(df, category, top_k)
+    feeds = store.current.feeds
+    results = feeds.frame(feeds.category_feed(category, user_id, top_k))
     results["date"] = results["date"].astype(str)
 
     return schemas.RecommendationResponse(top_k = len(results), 
@@ -112,9 +563,10 @@ def category_feed_recommendation(category: str, top_k: int = 10):
 
 # SOURCE RECOMMENDATION
 @app.get("/feed/source/{source}", response_model = schemas.RecommendationResponse)
-def source_feed_recommendation(source : str, user_id : str, top_k: int = 10):
+def source_feed_recommendation(source : str, user_id : str, top_k: int = Query(10, ge = 1, le = schemas.MAX_TOP_K)):
 
-    results = recommender.source_feed(df, source, user_id, top_k)
+    feeds = store.current.feeds
+    results = feeds.frame(feeds.source_feed(source, user_id, top_k))
     results["date"] = results["date"].astype(str)
 
     return schemas.RecommendationResponse(top_k = len(results), 
@@ -122,38 +574,81 @@ def source_feed_recommendation(source : str, user_id : str, top_k: int = 10):
 
 
 
+# FULL-TEXT SEARCH : BM25 OVER title + summary , mode=hybrid ALSO BRINGS THE ARTICLES CLOSEST TO THE BEST LEXICAL HITS
+@app.get("/search", response_model = schemas.RecommendationResponse)
+def search_news(q: str = Query(..., min_length = 1, max_length = 200), top_k: int = Query(10, ge = 1, le = schemas.MAX_TOP_K),
+                mode: str = Query("bm25", pattern = "^(bm25|hybrid)$"), alpha: float = Query(0.5, ge = 0, le = 1)):
+
+    snapshot = store.current
+    if snapshot.text_index is None:
+        raise HTTPException(status_code = 503, detail = "Text search is disabled (TEXT_SEARCH=0)")
+
+    with metrics.span("text_search"):
+        if mode == "hybrid":
+            defaults = SEARCH_PARAMS["personalization"]
+            rows, scores = snapshot.text_index.hybrid_search(q, snapshot.catalog, top_k = top_k, alpha = alpha,
+                                                             nprobe = defaults["nprobe"], ef_search = defaults["ef_search"])
+        else:
+            rows, scores = snapshot.text_index.search(q, snapshot.catalog, top_k = top_k)
+
+    results = snapshot.feeds.frame(rows)
+    results["final_score"] = scores
+    results["date"] = results["date"].astype(str)
+
+    return schemas.RecommendationResponse(top_k = len(results),
+                                          results = results.to_dict(orient="records"))
+
+
+# TRENDING FEED : A SLICE OF THE LAST MATERIALIZED LIST (final_score = DECAYED VIEWS , 0 FOR PADDING ARTICLES)
+@app.get("/feed/trending", response_model = schemas.RecommendationResponse)
+def trending_feed(top_k: int = Query(10, ge = 1, le = schemas.MAX_TOP_K), category: str | None = None):
+
+    feeds = store.current.feeds
+    ids, views = trending.feed(category, top_k + min(feeds.catalog.retracted_count, top_k))
+
+    # ARTICLES RETRACTED SINCE THE LAST REFRESH ARE SKIPPED
+    rows = feeds.catalog.lookup(ids)
+    keep = np.flatnonzero(rows >= 0)[:top_k]
+
+    results = feeds.frame(rows[keep])
+    results["final_score"] = views[keep]
+    results["date"] = results["date"].astype(str)
+
+    return schemas.RecommendationResponse(top_k = len(results),
+                                          results = results.to_dict(orient="records"))
+
+
+# RANDOM FEED : A SEEDED PERMUTATION OF THE ACTIVE ARTICLES , PAGED BY `cursor`
+# SEND BACK THE RETURNED `seed` TO KEEP SCROLLING THROUGH THE SAME ORDER (NO REPEATS WITHIN A SNAPSHOT)
+RANDOM_COLUMNS = ["id", "title", "source", "image", "url", "date", "category", "confidence", "summary"]
+
 @app.get("/feed/random")
-def random_news(cursor: int = 0):
-    random_df = df.sample(frac=1).reset_index(drop=True)
-    TOTAL_RANDOM = len(random_df)
+def random_news(cursor: int = 0, seed: int | None = None, page_size: int = Query(1, ge = 1, le = 100)):
+
+    feeds = store.current.feeds
+    seed = secrets.randbits(32) if seed is None else seed
+    TOTAL_RANDOM = len(feeds.all_rows)
 
     # guard
     if cursor < 0 or cursor >= TOTAL_RANDOM:
         return {
             "cursor": 0,
             "is_end": True,
-            "result": None
+            "seed": seed,
+            "result": None,
+            "results": []
         }
 
-    row = random_df.iloc[cursor].copy()
-    row["date"] = str(row["date"]) if pd.notnull(row["date"]) else None
-
-    result = {
-        "id": int(row["id"]),
-        "title": row["title"],
-        "source": row["source"],
-        "image": row["image"],
-        "url": row["url"],
-        "date": row["date"],
-        "category": row.get("category"),
-        "confidence": row.get("confidence"),
-        "summary": row.get("summary")
-    }
+    rows = feeds.random_page(seed, cursor, page_size)
+    results = streaming.records(feeds.frame(rows)[RANDOM_COLUMNS])
+    next_cursor = cursor + len(rows)
 
     return {
-        "cursor": cursor + 1,
-        "is_end": cursor + 1 >= TOTAL_RANDOM,
-        "result": result
+        "cursor": next_cursor,
+        "is_end": next_cursor >= TOTAL_RANDOM,
+        "seed": seed,
+        "result": results[0],
+        "results": results
     }
 
 
@@ -161,27 +656,155 @@ def random_news(cursor: int = 0):
 @app.get("/news/{article_id}")
 def get_news_detail(article_id: int):
     
-    #  GET THE SELECTED ID
-    row = df[df['id'] == article_id]
+    #  GET THE SELECTED ID (HASHED LOOKUP , RETRACTED ARTICLES ARE NOT FOUND)
+    catalog = store.current.catalog
+    row = catalog.row_of(article_id)
     
-    if row.empty:
+    if row is None:
         return {"error": "News not found"}
+
+    trending.record([article_id])
     
-    # GET UNIQUE ID
-    item = row.iloc[0]
-    
-    # DATETIME FORMAT
-    date_str = str(item['date']) if pd.notnull(item['date']) else None
+    # GET UNIQUE ID (PLAIN PYTHON VALUES , MISSING OPTIONAL FIELDS AS None , DATES AS TEXT)
+    item = streaming.records(catalog.df.iloc[[row]])[0]
+
+    # BODY IS READ FROM THE BODY STORE ONLY HERE (CATALOGS EXPORTED WITHOUT ONE STILL CARRY `content`)
+    content = bodies.get(article_id) if bodies is not None else item.get("content")
 
     return {
         "id": int(item['id']),
         "title": item['title'],
         "source": item['source'],
-        "image": item['image'],
-        "content": item['content'], 
-        "date": date_str,
+        "image": item.get('image'),
+        "content": content, 
+        "date": None if item.get('date') is None else str(item['date']),
         "category": item.get("category"),
         "author": "Redaksi", 
         "url": item['url'] 
     }
 
+
+
+# RELATED ARTICLES (PRECOMPUTED NEIGHBORS , NO INDEX SEARCH)
+@app.get("/news/{article_id}/related", response_model = schemas.RecommendationResponse)
+def related_news(article_id: int, top_k: int = Query(10, ge = 1, le = schemas.MAX_TOP_K)):
+
+    snapshot = store.current
+    if snapshot.neighbors is None:
+        raise HTTPException(status_code = 503, detail = "Neighbor graph is not loaded (precompute it with python -m app.neighbors)")
+
+    row = snapshot.catalog.row_of(article_id)
+    if row is None:
+        raise HTTPException(status_code = 404, detail = "News not found")
+
+    rows, similarity = snapshot.neighbors.related(snapshot.catalog, row, top_k)
+    results = recommender.build_results(snapshot.catalog, rows, similarity)
+    results["date"] = results["date"].astype(str)
+
+    return schemas.RecommendationResponse(top_k = len(results),
+                                          results = results.to_dict(orient = "records"))
+
+
+
+# ================================ INGESTION ======================================
+
+# NO TOKEN CONFIGURED -> CLOSED (NOT OPEN) , CONSTANT-TIME COMPARISON OTHERWISE
+def check_ingest_token(token):
+    if not INGEST_TOKEN:
+        raise HTTPException(status_code = 503, detail = "Admin endpoints are disabled (INGEST_TOKEN is not set)")
+    if token is None or not hmac.compare_digest(token.encode(), INGEST_TOKEN.encode()):
+        raise HTTPException(status_code = 401, detail = "Invalid ingest token")
+
+
+# THIS WORKER CANNOT WRITE TO THE INGEST JOURNAL BEFORE IT REPLAYED EVERY ENTRY
+def journal_unavailable(error):
+    return HTTPException(status_code = 503, detail = f"Ingest journal is not replayed on this worker ({error})")
+
+
+# APPEND NEW ARTICLES (WITH THEIR EMBEDDINGS) WITHOUT RESTART
+@app.post("/admin/articles", response_model = schemas.IngestResponse)
+def ingest_articles(request: schemas.IngestRequest, x_ingest_token: str | None = Header(default = None)):
+
+    check_ingest_token(x_ingest_token)
+
+    try:
+        change = ingest_writer.append(pd.DataFrame([article.model_dump(mode = "json") for article in request.articles]),
+                                      np.asarray(request.embeddings, dtype = np.float32))
+    except ValueError as error:
+        raise HTTPException(status_code = 422, detail = str(error))
+    except JournalReplayError as error:
+        raise journal_unavailable(error)
+
+    return schemas.IngestResponse(version = store.current.version, article_ids = change.article_ids if change else [])
+
+
+# RETRACT ARTICLES (REMOVED FROM EVERY FEED AND FROM /news/{article_id})
+@app.post("/admin/articles/retract", response_model = schemas.IngestResponse)
+def retract_articles(request: schemas.RetractRequest, x_ingest_token: str | None = Header(default = None)):
+
+    check_ingest_token(x_ingest_token)
+
+    try:
+        change = ingest_writer.retract(request.article_ids)
+    except JournalReplayError as error:
+        raise journal_unavailable(error)
+
+    return schemas.IngestResponse(version = store.current.version, article_ids = change.article_ids if change else [])
+
+
+# CANDIDATE CACHE COUNTERS (HITS , MISSES , EVICTIONS , ...) OF THIS WORKER
+@app.get("/admin/cache")
+def cache_stats(x_ingest_token: str | None = Header(default = None)):
+
+    check_ingest_token(x_ingest_token)
+    return candidate_cache.info()
+
+
+# TRENDING COUNTERS (VIEWS , PENDING , HEAVY-HITTER CANDIDATES , LAST REFRESH) OF THIS WORKER
+@app.get("/admin/trending")
+def trending_stats(x_ingest_token: str | None = Header(default = None)):
+
+    check_ingest_token(x_ingest_token)
+    return trending.info()
+
+
+# TEXT INDEX OF THE CURRENT SNAPSHOT (DOCUMENTS , TERMS , SEGMENTS , BYTES)
+@app.get("/admin/search")
+def text_index_info(x_ingest_token: str | None = Header(default = None)):
+
+    check_ingest_token(x_ingest_token)
+
+    text_index = store.current.text_index
+    if text_index is None:
+        raise HTTPException(status_code = 503, detail = "Text search is disabled (TEXT_SEARCH=0)")
+    return text_index.info()
+
+
+# TIME SHARDS OF THE CURRENT SNAPSHOT (WINDOWS , ARTICLES PER WINDOW)
+@app.get("/admin/shards")
+def shard_info(x_ingest_token: str | None = Header(default = None)):
+
+    check_ingest_token(x_ingest_token)
+
+    shards = store.current.catalog.shards
+    if shards is None:
+        raise HTTPException(status_code = 503, detail = "Time shards are disabled (SHARD_WINDOW is not set)")
+    return shards.info()
+
+
+# DROP (AND ARCHIVE TO SHARD_ARCHIVE_DIR) EVERY SHARD OLDER THAN max_age_days , ITS ARTICLES ARE RETRACTED
+@app.post("/admin/shards/expire")
+def expire_shards(max_age_days: float = Query(..., gt = 0), x_ingest_token: str | None = Header(default = None)):
+
+    check_ingest_token(x_ingest_token)
+
+    if store.current.catalog.shards is None:
+        raise HTTPException(status_code = 503, detail = "Time shards are disabled (SHARD_WINDOW is not set)")
+
+    try:
+        change = ingest_writer.expire(max_age_days, archive_dir = os.getenv("SHARD_ARCHIVE_DIR"))
+    except JournalReplayError as error:
+        raise journal_unavailable(error)
+
+    return {"version": store.current.version, "retracted": len(change.article_ids) if change else 0,
+            "shards": len(store.current.catalog.shards)}
@@ -0,0 +1,216 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# LATENCY BUCKETS (SECONDS) AND SIZE BUCKETS (CANDIDATES)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+# CUMULATIVE HISTOGRAM PER LABEL SET (PROMETHEUS TEXT FORMAT) , THREAD-SAFE
+class Histogram:
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels = (), buckets = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}    # LABEL VALUES -> [BUCKET COUNTS , SUM , COUNT]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def samples(self):
+
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in sorted(self._series.items())]
+
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket
+                yield f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {count}"
+
+
+class Counter:
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+
+# VALUE READ WHEN /metrics IS SCRAPED (e.g. A RATIO OF TWO COUNTERS)
+class Gauge:
+
+    kind = "gauge"
+
+    def __init__(self, name, help, function):
+        self.name = name
+        self.help = help
+        self.function = function
+
+    def samples(self):
+        yield f"{self.name} {float(self.function())}"
+
+    def reset(self):
+        pass
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name, help, labels = (), buckets = LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def counter(self, name, help, labels = ()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, function):
+        return self.register(Gauge(name, help, function))
+
+    # FORGET EVERY OBSERVATION (e.g. THE WARMUP QUERIES OF A STARTING WORKER)
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+    # PROMETHEUS TEXT EXPOSITION FORMAT 0.0.4
+    def render(self):
+
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+
+        return "\n".join(lines) + "\n"
+
+
+# METRICS OF THIS WORKER PROCESS
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram("recommender_request_seconds", "Request latency per endpoint", labels = ("endpoint", "method", "status"))
+STAGE_SECONDS = REGISTRY.histogram("recommender_stage_seconds", "Time spent in each pipeline stage", labels = ("stage",))
+CANDIDATE_POOL_SIZE = REGISTRY.histogram("recommender_candidate_pool_size", "Candidates retrieved per history", buckets = SIZE_BUCKETS)
+CACHE_REQUESTS = REGISTRY.counter("recommender_candidate_cache_requests_total", "Candidate cache lookups", labels = ("result",))
+REGISTRY.gauge("recommender_candidate_cache_hit_ratio", "Candidate cache hits / lookups since start",
+               lambda: CACHE_REQUESTS.value("hit") / max(CACHE_REQUESTS.value("hit") + CACHE_REQUESTS.value("miss"), 1))
+
+
+# ================================ SPANS ======================================
+
+# STAGE DURATIONS OF THE CURRENT REQUEST , ONLY COLLECTED WHEN THE CLIENT ASKED FOR A PROFILE
+# (A LIST SHARED BY THE CONTEXT COPIES OF THREADPOOL CALLS AND TASKS THAT THE REQUEST STARTS)
+_PROFILE : ContextVar = ContextVar("recommender_profile", default = None)
+
+
+# TIME A STAGE : ALWAYS INTO STAGE_SECONDS , ALSO INTO THE REQUEST PROFILE WHEN ONE IS ACTIVE
+@contextmanager
+def span(stage):
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+
+        profile = _PROFILE.get()
+        if profile is not None:
+            profile.append((stage, elapsed))
+
+
+# Server-Timing HEADER VALUE , REPEATED STAGES (e.g. ONE LLM CALL PER ITEM) ARE SUMMED
+def server_timing(profile):
+
+    totals, counts = {}, {}
+    for stage, elapsed in profile:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+        counts[stage] = counts.get(stage, 0) + 1
+
+    return ", ".join(f'{stage};dur={seconds * 1000:.3f}' + (f';desc="x{counts[stage]}"' if counts[stage] > 1 else "")
+                     for stage, seconds in totals.items())
+
+
+# HTTP MIDDLEWARE : LATENCY PER ROUTE TEMPLATE , AND THE STAGE BREAKDOWN AS A Server-Timing HEADER
+# WHEN THE REQUEST CARRIES `X-Profile: 1` (OPT-IN , NOTHING IS COLLECTED OTHERWISE)
+#   app.middleware("http")(metrics.observe_request)
+async def observe_request(request, call_next):
+
+    profile = [] if request.headers.get("x-profile", "").lower() in ("1", "true", "yes") else None
+    token = _PROFILE.set(profile)
+
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        _PROFILE.reset(token)
+
+        # ROUTE TEMPLATE (/news/{article_id}) , NOT THE RAW PATH , SO THE LABEL SET STAYS SMALL
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(elapsed, getattr(route, "path", "unmatched"), request.method, str(status))
+
+    if profile is not None:
+        response.headers["Server-Timing"] = server_timing(profile + [("total", elapsed)])
+
+    return response
@@ -0,0 +1,213 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from . import storage
+from .catalog import ArticleCatalog, UnknownArticleError
+from .recommender import CandidatePool, freshness_scores
+
+
+# ITEM-TO-ITEM NEIGHBOR GRAPH (TOP-K MOST SIMILAR ARTICLES OF EVERY ARTICLE , PRECOMPUTED)
+#   rows   : INT32 (N x K) CATALOG ROWS , -1 PADDING , MOST SIMILAR FIRST
+#   scores : FLOAT16 (N x K) INNER PRODUCT OF THE NORMALIZED EMBEDDINGS
+# 6 BYTES PER EDGE , RELATED ARTICLES AND NEIGHBOR-BASED CANDIDATES ARE A ROW LOOKUP (NO ANN SEARCH AT REQUEST TIME)
+# A GRAPH IS NEVER MODIFIED IN PLACE : extend() RETURNS A NEW ONE (IT IS SWAPPED TOGETHER WITH ITS CATALOG SNAPSHOT)
+#   THE BASE ARRAYS (MEMORY-MAPPED AND SHARED BY THE WORKERS WHEN LOADED) ARE NEVER COPIED BY AN APPEND : THE LISTS OF APPENDED
+#   ROWS , AND THE NEW LISTS OF EXISTING ROWS A NEW ARTICLE ENTERED , GO TO A SMALL OVERLAY . PAST max_overlay ROWS THE OVERLAY
+#   IS FOLDED INTO A COPY OF THE BASE (ONE O(N x K) COPY PER max_overlay CHANGED ROWS) , THE OFFLINE JOB REBUILDS IT ENTIRELY
+NEIGHBOR_FILES = ("neighbors.i32.npy", "neighbors.f16.npy")
+
+
+class NeighborGraph:
+
+    def __init__(self, rows : np.ndarray, scores : np.ndarray, overlay : dict | None = None, size : int | None = None,
+                 max_overlay : int = 10000):
+        self.rows = rows                  # BASE LISTS , READ-ONLY
+        self.scores = scores
+        self.overlay = overlay or {}      # ROW -> (rows , scores) , WINS OVER THE BASE
+        self.size = len(rows) if size is None else size
+        self.max_overlay = max_overlay
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def k(self):
+        return self.rows.shape[1]
+
+    def nbytes(self):
+        return self.rows.nbytes + self.scores.nbytes + sum(hits.nbytes + sims.nbytes for hits, sims in self.overlay.values())
+
+    # (len(rows) x K) NEIGHBOR ROWS AND SCORES OF `rows` (OVERLAY FIRST , THEN BASE , -1 PADDING)
+    def lists(self, rows):
+
+        rows = np.asarray(rows, dtype = np.int64)
+        out_rows = np.full((len(rows), self.k), -1, dtype = np.int32)
+        out_scores = np.zeros((len(rows), self.k), dtype = np.float16)
+
+        in_base = rows < len(self.rows)
+        out_rows[in_base], out_scores[in_base] = self.rows[rows[in_base]], self.scores[rows[in_base]]
+
+        if self.overlay:
+            for i, row in enumerate(rows.tolist()):
+                entry = self.overlay.get(row)
+                if entry is not None:
+                    out_rows[i], out_scores[i] = entry
+
+        return out_rows, out_scores
+
+    # TOP-K NEIGHBORS OF `rows` (SEARCHED IN BATCHES , SELF AND EMPTY SLOTS DROPPED)
+    @staticmethod
+    def search(catalog : ArticleCatalog, rows, k : int, batch_size : int = 4096):
+
+        rows = np.asarray(rows, dtype = np.int64)
+        out_rows = np.full((len(rows), k), -1, dtype = np.int32)
+        out_scores = np.zeros((len(rows), k), dtype = np.float16)
+
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            scores, found = catalog.search(np.ascontiguousarray(catalog.embeddings[batch]), k + 1)
+
+            for i, (row, hits, sims) in enumerate(zip(batch, found, scores)):
+                keep = (hits >= 0) & (hits != row)
+                hits, sims = hits[keep][:k], sims[keep][:k]
+                out_rows[start + i, :len(hits)] = hits
+                out_scores[start + i, :len(hits)] = sims
+
+        return out_rows, out_scores
+
+    @classmethod
+    def build(cls, catalog : ArticleCatalog, k : int = 20, batch_size : int = 4096):
+        return cls(*cls.search(catalog, np.arange(len(catalog)), k, batch_size))
+
+    # GRAPH FOR A CATALOG THAT GOT `new_rows` APPENDED (O(NEW ROWS x K) PLUS A COPY OF THE OVERLAY'S DICT , NOT OF THE GRAPH)
+    #   NEW ROWS : SEARCHED ; EXISTING ROWS : A NEW ARTICLE ENTERS THEIR LIST WHEN IT BEATS THEIR WORST NEIGHBOR
+    #   (CANDIDATES FOR THAT ARE THE NEW ARTICLE'S OWN NEIGHBORS , SIMILARITY IS SYMMETRIC)
+    def extend(self, catalog : ArticleCatalog, new_rows):
+
+        new_rows = np.asarray(new_rows, dtype = np.int64)
+        if len(new_rows) == 0:
+            return self
+
+        added_rows, added_scores = self.search(catalog, new_rows, self.k)
+
+        # THE LISTS OF THE OLD OVERLAY ARE SHARED WITH THE OLD GRAPH : A CHANGED LIST IS A NEW ARRAY
+        overlay = dict(self.overlay)
+        overlay.update(zip(new_rows.tolist(), zip(added_rows, added_scores)))
+        appended = set(new_rows.tolist())
+
+        for new_row, hits, sims in zip(new_rows.tolist(), added_rows, added_scores):
+            for old_row, sim in zip(hits.tolist(), sims):
+                if old_row < 0 or old_row >= self.size or old_row in appended:
+                    continue
+
+                old_hits, old_sims = overlay[old_row] if old_row in overlay else (self.rows[old_row], self.scores[old_row])
+                if old_hits[-1] >= 0 and old_sims[-1] >= sim:
+                    continue
+
+                # INSERT , KEEP THE LIST SORTED (MOST SIMILAR FIRST)
+                old_hits, old_sims = np.array(old_hits), np.array(old_sims)
+                position = int(np.searchsorted(-old_sims.astype(np.float32), -np.float32(sim)))
+                position = min(position, int((old_hits >= 0).sum()))
+                old_hits[position + 1:], old_sims[position + 1:] = old_hits[position:-1].copy(), old_sims[position:-1].copy()
+                old_hits[position], old_sims[position] = new_row, sim
+                overlay[old_row] = (old_hits, old_sims)
+
+        graph = NeighborGraph(self.rows, self.scores, overlay, size = len(catalog), max_overlay = self.max_overlay)
+        return graph.folded() if len(overlay) > self.max_overlay else graph
+
+    # THE SAME GRAPH AS PLAIN (N x K) ARRAYS WITHOUT AN OVERLAY (A PRIVATE COPY OF THE BASE)
+    def folded(self):
+
+        rows, scores = self.lists(np.arange(self.size))
+        return NeighborGraph(rows, scores, max_overlay = self.max_overlay)
+
+    # (ROWS , SIMILARITY) OF THE ACTIVE NEIGHBORS OF ONE ROW , AT MOST top_k
+    def related(self, catalog : ArticleCatalog, row : int, top_k : int = 10):
+
+        rows, scores = self.lists([row])
+        rows, scores = rows[0], scores[0].astype(np.float32)
+        keep = rows >= 0
+        keep[keep] = catalog.active[rows[keep]]
+
+        return rows[keep][:top_k].astype(np.int64), scores[keep][:top_k]
+
+    def save(self, directory):
+
+        directory = Path(directory)
+        directory.mkdir(parents = True, exist_ok = True)
+
+        graph = self.folded() if self.overlay else self
+        np.save(directory / NEIGHBOR_FILES[0], graph.rows)
+        np.save(directory / NEIGHBOR_FILES[1], graph.scores)
+
+    # MEMORY-MAPPED (extend() WRITES AN OVERLAY , SO THE MAPPED FILES ARE NEVER WRITTEN)
+    @classmethod
+    def load(cls, directory, mmap = True):
+
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        return cls(np.load(directory / NEIGHBOR_FILES[0], mmap_mode = mode), np.load(directory / NEIGHBOR_FILES[1], mmap_mode = mode))
+
+    @staticmethod
+    def exists(directory):
+        return all((Path(directory) / name).exists() for name in NEIGHBOR_FILES)
+
+
+# PERSONALIZATION CANDIDATES FROM THE GRAPH INSTEAD OF AN INDEX SEARCH
+#   UNION OF THE NEIGHBOR LISTS OF THE HISTORY , SCORE = RECENCY-WEIGHTED MEAN SIMILARITY TO THE HISTORY
+#   (SAME DECAY WEIGHTS AS recommender.session_embedding , A MISSING EDGE COUNTS AS 0)
+def neighbor_candidate_pool(article_ids, catalog : ArticleCatalog, graph : NeighborGraph, pool_size = 100,
+                            decay_lambda : float = 0.0001, min_weights : float = 0.01) -> CandidatePool:
+
+    rows, missing = catalog.rows_for(article_ids)
+    if len(rows) == 0:
+        raise UnknownArticleError(missing)
+
+    weights = np.fmax(np.exp(-decay_lambda * catalog.age_days(rows)), min_weights)
+
+    # (CANDIDATE ROW , WEIGHTED SIMILARITY) FOR EVERY EDGE LEAVING THE HISTORY
+    edges, scores = graph.lists(rows)
+    edges = edges.astype(np.int64)
+    contribution = scores.astype(np.float64) * weights[:, None]
+
+    keep = edges >= 0
+    keep[keep] = catalog.active[edges[keep]] & ~np.isin(catalog.ids[edges[keep]], np.asarray(article_ids, dtype = np.int64))
+    candidates, position = np.unique(edges[keep], return_inverse = True)
+    similarity = np.bincount(position, weights = contribution[keep], minlength = len(candidates)) / weights.sum()
+
+    # POOL SIZE , MOST SIMILAR FIRST
+    order = np.argsort(-similarity, kind = "stable")[:pool_size]
+    candidates, similarity = candidates[order], similarity[order]
+
+    # GET LATEST RELEVANT NEWS (TRADE OFF SIMILARITY VS FRESHNESS)
+    candidates, final_score = freshness_scores(catalog, candidates, similarity, similarity_weight = 0.8, freshness_weight = 0.2)
+
+    return CandidatePool(article_ids, catalog.ids[candidates], final_score, -np.inf)
+
+
+# OFFLINE JOB : WRITE THE GRAPH NEXT TO A CATALOG DIRECTORY (app.storage)
+#   python -m app.neighbors --catalog ../catalog --k 20
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Precompute the top-k neighbor graph of a catalog directory")
+    parser.add_argument("--catalog", required = True, help = "catalog directory written by app.storage")
+    parser.add_argument("--k", type = int, default = 20)
+    parser.add_argument("--batch-size", type = int, default = 4096)
+    parser.add_argument("--out", help = "output directory (default : the catalog directory)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    catalog = storage.load_catalog(args.catalog)
+    graph = NeighborGraph.build(catalog, k = args.k, batch_size = args.batch_size)
+    graph.save(args.out or args.catalog)
+
+    print(json.dumps({"articles": len(graph), "k": graph.k, "bytes": graph.nbytes(),
+                      "seconds": round(time.perf_counter() - start, 1)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from . import metrics
+from .catalog import ArticleCatalog, now_epoch_days
+from .recommender import CandidatePool, retrieve_candidates_for_vector, scored_pool
+
+
+# INCREMENTAL USER PROFILE : THE DECAYED RUNNING SUM OF EVERY EMBEDDING THE USER READ , AS OF `as_of` (EPOCH DAYS)
+#   SAME WEIGHTS AS recommender.session_embedding : exp(-decay_lambda * ARTICLE AGE) . MOVING FROM as_of TO now MULTIPLIES
+#   EVERY TERM BY THE SAME exp(-decay_lambda * (now - as_of)) , SO THE DECAY IS APPLIED LAZILY WHEN THE NEXT READ ARRIVES
+#   A READ IS O(dim) , AND THE DIRECTION (WHAT THE SEARCH USES) IS THE session_embedding OF THE WHOLE HISTORY
+#   `seen` KEEPS THE LAST max_seen READ IDS (NOT RECOMMENDED AGAIN) , OLDER READS ONLY LIVE IN THE SUM
+# PROFILES ARE IMMUTABLE , advance() RETURNS A NEW ONE
+class UserProfile:
+
+    def __init__(self, user_id : str, vector : np.ndarray, as_of : float, reads : int = 0, seen = ()):
+        self.user_id = user_id
+        self.vector = np.asarray(vector, dtype = np.float64)
+        self.as_of = float(as_of)
+        self.reads = int(reads)
+        self.seen = tuple(int(article_id) for article_id in seen)
+
+    def advance(self, contribution, article_ids, now, decay_lambda = 0.0001, max_seen = 500):
+
+        vector = self.vector * np.exp(-decay_lambda * max(now - self.as_of, 0.0)) + contribution
+        seen = (self.seen + tuple(article_ids))[-max_seen:] if max_seen else ()
+
+        return UserProfile(self.user_id, vector, max(now, self.as_of), self.reads + len(article_ids), seen)
+
+    # NORMALIZED (1 , dim) FLOAT32 QUERY
+    def unit_vector(self):
+
+        vector = self.vector.astype(np.float32).reshape(1, -1)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def info(self):
+        return {"user_id": self.user_id, "reads": self.reads, "seen": len(self.seen), "as_of_day": self.as_of}
+
+
+# ================================ BACKENDS ======================================
+
+# IN-PROCESS BACKEND (ONE PER WORKER) , LEAST RECENTLY UPDATED PROFILES OUT BEYOND max_profiles
+class MemoryProfileBackend:
+
+    def __init__(self, max_profiles : int = 100000):
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            return self._profiles.get(user_id)
+
+    # ATOMIC READ-MODIFY-WRITE : function(PROFILE OR NONE) -> NEW PROFILE
+    def update(self, user_id, function):
+
+        with self._lock:
+            profile = function(self._profiles.get(user_id))
+            self._profiles[user_id] = profile
+            self._profiles.move_to_end(user_id)
+
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last = False)
+
+        return profile
+
+    def delete(self, user_id):
+        with self._lock:
+            return self._profiles.pop(user_id, None) is not None
+
+    def info(self):
+        with self._lock:
+            return {"backend": "memory", "profiles": len(self._profiles), "max_profiles": self.max_profiles}
+
+
+# SQLITE FILE BACKEND : PROFILES SURVIVE RESTARTS AND ARE SHARED BY EVERY WORKER THAT POINTS AT THE SAME PATH
+# (WAL MODE , ONE CONNECTION PER THREAD , UPDATES IN A BEGIN IMMEDIATE TRANSACTION SO CONCURRENT READS OF ONE USER ARE NOT LOST)
+class SQLiteProfileBackend:
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+        self._connect().execute("CREATE TABLE IF NOT EXISTS profiles (user_id TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+                                "as_of REAL NOT NULL, reads INTEGER NOT NULL, seen BLOB NOT NULL, updated REAL NOT NULL)")
+
+    def _connect(self):
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout = 5.0, isolation_level = None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+
+        return conn
+
+    # CLOSE THIS THREAD'S CONNECTION (REOPENED ON NEXT USE) , A PRELOADING PARENT CALLS IT BEFORE FORKING THE WORKERS
+    def close(self):
+
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _decode(user_id, row):
+        if row is None:
+            return None
+        vector, as_of, reads, seen = row
+        return UserProfile(user_id, np.frombuffer(vector, dtype = np.float64), as_of, reads, np.frombuffer(seen, dtype = np.int64))
+
+    def get(self, user_id):
+        row = self._connect().execute("SELECT vector, as_of, reads, seen FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+        return self._decode(user_id, row)
+
+    def update(self, user_id, function):
+
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT vector, as_of, reads, seen FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+            profile = function(self._decode(user_id, row))
+
+            conn.execute("INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?, ?)",
+                         (user_id, profile.vector.tobytes(), profile.as_of, profile.reads,
+                          np.asarray(profile.seen, dtype = np.int64).tobytes(), time.time()))
+
+        return profile
+
+    def delete(self, user_id):
+        return self._connect().execute("DELETE FROM profiles WHERE user_id = ?", (user_id,)).rowcount > 0
+
+    def info(self):
+        profiles = self._connect().execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "profiles": profiles}
+
+
+# ================================ STORE ======================================
+
+class ProfileStore:
+
+    def __init__(self, backend, decay_lambda : float = 0.0001, min_weights : float = 0.01, max_seen : int = 500):
+        self.backend = backend
+        self.decay_lambda = decay_lambda
+        self.min_weights = min_weights
+        self.max_seen = max_seen
+
+    def get(self, user_id):
+        return self.backend.get(user_id)
+
+    # FOLD NEW READS INTO THE USER'S PROFILE , RETURNS (PROFILE OR NONE , UNKNOWN IDS)
+    #   O(len(article_ids) * dim) : THE OLD HISTORY IS NEVER LOOKED AT AGAIN
+    def record(self, user_id, article_ids, catalog : ArticleCatalog, now = None):
+
+        article_ids = [int(article_id) for article_id in article_ids]
+        rows, missing = catalog.rows_for(article_ids)
+
+        if len(rows) == 0:
+            return self.backend.get(user_id), missing
+
+        with metrics.span("profile_update"):
+            today = now_epoch_days(now)
+            weights = np.fmax(np.exp(-self.decay_lambda * catalog.age_days(rows, now = now)), self.min_weights)
+            contribution = weights @ catalog.embeddings[rows].astype(np.float64)
+            known_ids = catalog.ids[rows].tolist()
+
+            def fold(profile):
+                profile = profile or UserProfile(user_id, np.zeros(catalog.dim), today)
+                return profile.advance(contribution, known_ids, today, decay_lambda = self.decay_lambda, max_seen = self.max_seen)
+
+            return self.backend.update(user_id, fold), missing
+
+    def reset(self, user_id):
+        return self.backend.delete(user_id)
+
+    def info(self):
+        return {**self.backend.info(), "decay_lambda": self.decay_lambda, "max_seen": self.max_seen}
+
+
+# PERSONALIZATION CANDIDATES FROM A STORED PROFILE (NO HISTORY LOOKUP , NO SESSION EMBEDDING)
+def profile_candidate_pool(profile : UserProfile, catalog : ArticleCatalog, pool_size = 100, nprobe = None, ef_search = None,
+                           horizon_days = None, allowed_rows = None) -> CandidatePool:
+
+    rows, similarity = retrieve_candidates_for_vector(profile.unit_vector(), profile.seen, catalog, top_k = pool_size, nprobe = nprobe,
+                                                      ef_search = ef_search, horizon_days = horizon_days, allowed_rows = allowed_rows)
+
+    return scored_pool(profile.seen, catalog, rows, similarity, pool_size)
+
+
+# PROFILE_STORE_PATH SET -> SQLITE FILE (PERSISTENT , SHARED BY THE WORKERS) , IN-PROCESS OTHERWISE
+def profile_store_from_env():
+
+    path = os.getenv("PROFILE_STORE_PATH")
+    backend = SQLiteProfileBackend(path) if path else MemoryProfileBackend(max_profiles = int(os.getenv("PROFILE_MAX_USERS", 100000)))
+
+    return ProfileStore(backend, max_seen = int(os.getenv("PROFILE_SEEN_IDS", 500)))
@@ -1,244 +1,356 @@
 import faiss
 import numpy as np
-import pandas as pd
-from datetime import datetime, timezone
-from sklearn.metrics.pairwise import cosine_similarity
+from datetime import datetime
+
+from . import metrics
+from .catalog import ArticleCatalog, UnknownArticleError
 
 
 # RECOMMEND RELEVANT ARTICLES BASED ON USER HISTORY READ
-def session_embedding(article_ids : list, df : pd.DataFrame, faiss_index = None, decay_lambda : float = 0.0001, min_weights : float = 0.01):
+def session_embedding(article_ids : list, catalog : ArticleCatalog, decay_lambda : float = 0.0001, min_weights : float = 0.01):
+
+    # GET THE ROWS OF ARTICLES THAT USER READ (ONE HASHED LOOKUP , NO COLUMN SCAN)
+    rows, missing = catalog.rows_for(article_ids)
+
+    if len(rows) == 0:
+        raise UnknownArticleError(missing)
+
+    # DETERMINE HOW RELEVANT THE ARTICLES NOW
+    delta_days = catalog.age_days(rows)     # CALCULATING THE DIFFERENCE BETWEEN THE CURRENT TIME AND THE TIME THE NEWS WAS PUBLISHED
+    weights = np.fmax(np.exp(-decay_lambda * delta_days), min_weights)   # GIVE LESS WEIGHT TO OLD ARTICLES , AND MORE WEIGHT TO NEW ARTICLES
+
+    # COMBINING MANY ARTICLES THAT HAVE BEEN READ INTO 1 NEW EMBEDDING VECTOR (BATCHED GATHER + WEIGHTED SUM)
+    new_vectors = (weights.astype(np.float32) @ catalog.embeddings[rows]).reshape(1, -1)
 
-    # GET THE CURRENT TIME
-    now = datetime.now(timezone.utc)
-    vectors = []
+    # NORMALIZE
+    faiss.normalize_L2(new_vectors)
+
+    return new_vectors
 
-    # FOR EACH ARTICLES THAT USER READ
-    for article_id in article_ids:
 
-        # GET AN ARTICLE THAT USER READ
-        article_idx = df.index[df["id"] == article_id].tolist()[0]
+# SESSION VECTORS OF MANY USERS AS ONE MATRIX , RETURNS (VECTORS , VALID MASK , MISSING IDS PER USER)
+def session_embeddings(histories : list, catalog : ArticleCatalog, decay_lambda : float = 0.0001, min_weights : float = 0.01):
 
-        article_date = df.loc[article_idx, "date"]
+    # ONE LOOKUP FOR EVERY ARTICLE OF EVERY USER
+    lengths = np.asarray([len(history) for history in histories], dtype = np.int64)
+    flat_ids = np.fromiter((article_id for history in histories for article_id in history), dtype = np.int64, count = int(lengths.sum()))
+    owners = np.repeat(np.arange(len(histories)), lengths)
 
-        # DETERMINE HOW RELEVANT THE ARTICLES NOW 
-        delta_days = (now - article_date).days  # CALCULATING THE DIFFERENCE BETWEEN THE CURRENT TIME AND THE TIME THE NEWS WAS PUBLISHED
-        weights = np.exp(-decay_lambda * delta_days)     # GIVE LESS WEIGHT TO OLD ARTICLES , AND MORE WEIGHT TO NEW ARTICLES
-        weights = max(weights, min_weights)
+    rows = catalog.lookup(flat_ids)
+    found = rows >= 0
+    rows, owners_found = rows[found], owners[found]
 
-        # 4. GET EMBEDDING FROM FAISS
-        emb = faiss_index.reconstruct(article_idx)
+    missing = [[] for _ in histories]
+    for owner, article_id in zip(owners[~found].tolist(), flat_ids[~found].tolist()):
+        missing[owner].append(article_id)
 
-        # COMBINING MANY ARTICLES THAT HAVE BEEN READ INTO 1 NEW EMBEDDING VECTOR
-        vectors.append(weights * emb)   # CALCULATE ARTICLE RELEVANCE (BASED ON WEIGHT)
-    
-    # SUM ALL READ ARTICLES
-    new_vectors = np.sum(vectors, axis=0).astype(np.float32).reshape(1, -1)
+    # DECAY WEIGHTS AND WEIGHTED SUM PER USER (ROWS ARE GROUPED BY USER , SO ONE reduceat)
+    weights = np.fmax(np.exp(-decay_lambda * catalog.age_days(rows)), min_weights).astype(np.float32)
+    weighted = catalog.embeddings[rows] * weights[:, None]
+
+    counts = np.bincount(owners_found, minlength = len(histories))
+    valid = counts > 0
+
+    vectors = np.zeros((len(histories), catalog.dim), dtype = np.float32)
+    if len(rows):
+        starts = np.r_[0, np.cumsum(counts)[:-1]]
+        vectors[valid] = np.add.reduceat(weighted, starts[valid], axis = 0)
 
     # NORMALIZE
-    faiss.normalize_L2(new_vectors)
+    faiss.normalize_L2(vectors)
 
-    return new_vectors
+    return vectors, valid, missing
+
+
+# SEARCH EVERYTHING , OR ONLY `allowed_rows` (FILTERED FEEDS , SEE filters.ArticleFilter)
+def search_candidates(catalog : ArticleCatalog, user_vectors, k, nprobe = None, ef_search = None, horizon_days = None, allowed_rows = None):
+
+    if allowed_rows is None:
+        return catalog.search(user_vectors, k, nprobe = nprobe, ef_search = ef_search, horizon_days = horizon_days)
+
+    allowed_rows = allowed_rows[catalog.within_horizon(allowed_rows, horizon_days)]
+    return catalog.search_rows(user_vectors, k, allowed_rows, nprobe = nprobe, ef_search = ef_search)
 
 
-# GET TOP-K RELEVANT ARTICLES BASED ON USER HISTORY
-def get_relevant_articles(article_ids, df, faiss_index, top_k = 10):
+# GET TOP-K CANDIDATE ROWS AND THEIR SIMILARITY (ARRAYS ONLY , NO DATAFRAME)
+def retrieve_candidates(article_ids, catalog : ArticleCatalog, top_k = 100, nprobe = None, ef_search = None, horizon_days = None,
+                        allowed_rows = None, decay_lambda = 0.0001):
 
     # AGGREGATE NEW EMBEDDING BASED USER HISTORY
-    user_vectors = session_embedding(article_ids, df, faiss_index)
+    with metrics.span("session_embedding"):
+        user_vectors = session_embedding(article_ids, catalog, decay_lambda = decay_lambda)
+
+    return retrieve_candidates_for_vector(user_vectors, article_ids, catalog, top_k = top_k, nprobe = nprobe, ef_search = ef_search,
+                                          horizon_days = horizon_days, allowed_rows = allowed_rows)
+
+
+# TOP-K CANDIDATES OF A READY (1 , dim) USER VECTOR , ARTICLES IN `read_ids` ARE NOT RECOMMENDED AGAIN
+def retrieve_candidates_for_vector(user_vectors, read_ids, catalog : ArticleCatalog, top_k = 100, nprobe = None, ef_search = None,
+                                   horizon_days = None, allowed_rows = None):
 
     # SEARCH ALL SIMILAR EMBEDDINGS ON FAISS INDEX
-    scores, index = faiss_index.search(user_vectors, top_k + len(article_ids))
+    k = top_k + len(read_ids)
+    with metrics.span("faiss_search"):
+        scores, index = search_candidates(catalog, user_vectors, k, nprobe, ef_search, horizon_days, allowed_rows)
+    rows, similarity = index[0], scores[0]
+
+    # DROP EMPTY SLOTS (FAISS RETURNS -1 WHEN IT HAS LESS THAN k RESULTS) , RETRACTED , READ AND TOO OLD ARTICLES
+    keep = rows >= 0
+    keep[keep] = catalog.active[rows[keep]] & ~np.isin(catalog.ids[rows[keep]], np.asarray(read_ids, dtype = np.int64)) \
+                 & catalog.within_horizon(rows[keep], horizon_days)
+
+    return rows[keep][:top_k], similarity[keep][:top_k]
+
+
+# CANDIDATES FOR MANY USERS WITH A SINGLE FAISS SEARCH , NONE FOR USERS WITHOUT ANY KNOWN ARTICLE
+def retrieve_candidates_batch(histories : list, catalog : ArticleCatalog, top_k = 100, nprobe = None, ef_search = None, horizon_days = None,
+                              allowed_rows = None, decay_lambda = 0.0001):
+
+    with metrics.span("session_embedding"):
+        user_vectors, valid, missing = session_embeddings(histories, catalog, decay_lambda = decay_lambda)
+
+    pools = [None] * len(histories)
+    if not valid.any():
+        return pools, missing
+
+    # ONE SEARCH CALL FOR ALL USERS (FAISS PARALLELIZES OVER QUERY ROWS)
+    k = top_k + max(len(history) for history in histories)
+    with metrics.span("faiss_search"):
+        scores, index = search_candidates(catalog, user_vectors[valid], k, nprobe, ef_search, horizon_days, allowed_rows)
+
+    for row, user in enumerate(np.flatnonzero(valid)):
+        rows, similarity = index[row], scores[row]
+
+        keep = rows >= 0
+        keep[keep] = catalog.active[rows[keep]] & ~np.isin(catalog.ids[rows[keep]], np.asarray(histories[user], dtype = np.int64)) \
+                     & catalog.within_horizon(rows[keep], horizon_days)
+        pools[user] = (rows[keep][:top_k], similarity[keep][:top_k])
+
+    return pools, missing
+
+
+# ================================ ARRAY RERANKER ======================================
+# RERANK STAGES ON CANDIDATE ROW INDICES AND SCORES.
+# EVERY STAGE RETURNS POSITIONS INTO ITS INPUT , THE RESPONSE FRAME IS BUILT ONCE AT THE END.
+
+RESULT_COLUMNS = ["id", "title", "source", "image", "url", "date", "final_score", "topic_id", "category", "confidence", "summary"]
+
 
-    # ADD SIMILARITY FEATURES INTO DATAFRAME
-    results = df.iloc[index[0]].copy()
-    results["similarity"] = scores[0]
+# SIMILARITY VS FRESHNESS SCORE , SORTED DESCENDING
+def freshness_scores(catalog : ArticleCatalog, rows, similarity, similarity_weight = 0.5, freshness_weight = 0.5, decay_lambda = 0.001):
 
-    # REMOVE READ ARTICLES FROM RECOMMENDATION
-    results = results[~results["id"].isin(article_ids)]
-    top_relevance = results.head(top_k)
-    
-    return top_relevance
+    with metrics.span("freshness"):
+        freshness = np.exp(-decay_lambda * catalog.age_days(rows))
+        final_score = similarity_weight * similarity + freshness_weight * freshness
 
-# FUNCTION TO CONTROL THE LATEST RELEVANT NEWS
-def freshness_recommendation(df, similarity_weight = 0.5, freshness_weight = 0.5, decay_lambda = 0.001):
+        order = np.argsort(-final_score, kind = "stable")
+    return rows[order], final_score[order]
 
-    # GET CURRENT DATE
-    now = datetime.now(timezone.utc)
-    df = df.copy()
 
-    # CALCULATING THE DIFFERENCE BETWEEN THE CURRENT TIME AND THE TIME THE NEWS WAS PUBLISHED  (current date - news published date)
-    df['freshness'] = df['date'].apply(lambda d: np.exp(-decay_lambda * (now - d).days))
+# FIRST top_k POSITIONS WHOSE SOURCE HAS NOT YET APPEARED max_source TIMES
+def source_diversity_positions(source_codes, max_source = 2, top_k = 10):
 
-    # AGGREGATE SIMILARITY WITH FRESHNESS SCORE (SO THAT THE LATEST NEWS IS MORE RELEVANT)
-    df['final_score'] = similarity_weight * df['similarity'] + freshness_weight * df['freshness']
+    # RUNNING COUNT OF EACH SOURCE (0 FOR ITS FIRST ARTICLE , 1 FOR THE SECOND , ...)
+    order = np.argsort(source_codes, kind = "stable")
+    sorted_codes = source_codes[order]
+    group_start = np.r_[0, np.flatnonzero(np.diff(sorted_codes)) + 1]
+    group_size = np.diff(np.r_[group_start, len(sorted_codes)])
 
-    # SORT BY DESCENDING
-    df_fresh = df.sort_values(by = 'final_score', ascending = False)
+    occurrence = np.empty(len(source_codes), dtype = np.int64)
+    occurrence[order] = np.arange(len(sorted_codes)) - np.repeat(group_start, group_size)
 
-    return df_fresh
+    return np.flatnonzero(occurrence < max_source)[:top_k]
 
 
-# FUNGSI UNTUK MEMBATASI SUMBER ARTIKEL YG SERING MUNCUL
-# Limiting frequently appearing news sources (to ensure more diverse news sources)
-def source_diversity(df, max_source = 2, top_k = 10):
+# GREEDY MMR ON A PRE-GATHERED EMBEDDING BLOCK
+def mmr_positions(embeddings, final_score, lambda_div = 0.3, top_k = 10):
 
-    selected = []
-    source_count = {}
+    if len(final_score) == 0:
+        return np.empty(0, dtype = np.int64)
 
-    # FOR EACH SAMPLE
-    for _, row in df.iterrows():
-        src = row['source']
+    # COSINE SIMILARITY OF EVERY PAIR , ONE MATRIX PRODUCT
+    unit = embeddings / np.maximum(np.linalg.norm(embeddings, axis = 1, keepdims = True), 1e-12)
+    pair_sims = unit @ unit.T
 
-        
-        # IF THE NEWS SOURCE HAS NOT EXCEEDED max_source
-        if source_count.get(src, 0) < max_source:
-            selected.append(row)
-            source_count[src] = source_count.get(src, 0) + 1
+    selected = [0]
+    penalty = pair_sims[0].copy()   # MAX SIMILARITY TO ANY SELECTED ARTICLE
 
-        # IF SOURCE HAS EXCEEDED max_source
+    for position in range(1, len(final_score)):
         if len(selected) >= top_k:
             break
 
-    return pd.DataFrame(selected)
+        if final_score[position] - lambda_div * penalty[position] > 0:
+            selected.append(position)
+            np.maximum(penalty, pair_sims[position], out = penalty)
 
+    return np.asarray(selected, dtype = np.int64)
 
-def stochastic_rerank(df: pd.DataFrame, top_k: int = 10, temperature: float = 0.2, seed: int | None = None):
 
-    rng = np.random.default_rng(seed)
+# SOFTMAX SAMPLING WITHOUT REPLACEMENT , SORTED BY SCORE
+def stochastic_positions(final_score, top_k = 10, temperature = 0.2, seed = None):
+
+    if len(final_score) == 0:
+        return np.empty(0, dtype = np.int64)
 
-    scores = df["final_score"].values.astype(np.float64)
+    rng = np.random.default_rng(seed)
 
-    # softmax with temperature
-    scores = scores / temperature
+    scores = np.asarray(final_score, dtype = np.float64) / temperature
     exp_scores = np.exp(scores - scores.max())
     probs = exp_scores / exp_scores.sum()
 
-    selected_idx = rng.choice(len(df), 
-                              size=min(top_k, len(df)),
-                              replace=False,
-                              p=probs)
-    
-    return df.iloc[selected_idx].sort_values("final_score", ascending=False).reset_index(drop=True)
-    
+    selected = rng.choice(len(final_score), size = min(top_k, len(final_score)), replace = False, p = probs)
 
-def mmr_rerank(df: pd.DataFrame, faiss_index, lambda_div: float = 0.3, top_k: int = 10):
+    return selected[np.argsort(-final_score[selected], kind = "stable")]
 
-    selected_rows = []
-    selected_embs = []
 
-    for idx, row in df.iterrows():
-        emb = faiss_index.reconstruct(idx)
+# SESSION-LEVEL RANDOMNESS (ANTI CACHE MONOTON) , CHANGES EVERY MINUTE
+def session_seed(article_ids):
+    return abs(hash(tuple(article_ids)) + int(datetime.now().timestamp() // 60))
 
-        if not selected_embs:
-            selected_rows.append(row)
-            selected_embs.append(emb)
-        else:
-            sims = cosine_similarity(
-                [emb],
-                np.array(selected_embs)
-            )[0]
 
-            penalty = sims.max()
-            mmr_score = row["final_score"] - lambda_div * penalty
+# SOURCE DIVERSITY -> MMR -> STOCHASTIC SAMPLING ON A POOL ALREADY SCORED AND SORTED BY freshness_scores
+def rerank_scored(catalog : ArticleCatalog, rows, final_score, top_k = 10, temperature = 0.1, lambda_div = 0.1, max_source = 5, seed = None):
 
-            if mmr_score > 0:
-                selected_rows.append(row)
-                selected_embs.append(emb)
+    # LIMIT SOURCE OF NEWS THAT APPEAR FREQUENTLY
+    with metrics.span("source_diversity"):
+        keep = source_diversity_positions(catalog.source_codes[rows], max_source = max_source, top_k = top_k)
+    rows, final_score = rows[keep], final_score[keep]
 
-        if len(selected_rows) >= top_k:
-            break
+    # MMR DIVERSITY
+    with metrics.span("mmr"):
+        keep = mmr_positions(catalog.embeddings[rows], final_score, lambda_div = lambda_div, top_k = 50)
+    rows, final_score = rows[keep], final_score[keep]
 
-    return pd.DataFrame(selected_rows).reset_index(drop=True)
-    
-# FINAL PIPELINE (RE-RANKER)
-def news_recommender(article_ids, df, faiss_index, top_k = 10, **params):
+    # STOCHASTIC SAMPLING
+    with metrics.span("sampling"):
+        keep = stochastic_positions(final_score, top_k = top_k, temperature = temperature, seed = seed)
 
-    # UNPACK PARAMS
-    temperature = params.pop("temperature", 0.1)
-    lambda_div  = params.pop("lambda_div", 0.1)
-    max_source  = params.pop("max_source", 5)
+    return rows[keep], final_score[keep]
 
 
-    # GET RELEVANT NEWS
-    top_relevant = get_relevant_articles(article_ids, df, faiss_index, top_k = 100)
+# FULL RERANK ON ARRAYS , RETURNS (ROWS , FINAL SCORES)
+def rerank_candidates(catalog : ArticleCatalog, rows, similarity, top_k = 10, temperature = 0.1, lambda_div = 0.1, max_source = 5, seed = None):
 
     # GET LATEST RELEVANT NEWS (TRADE OFF SIMILARITY VS FRESHNESS)
-    reranked = freshness_recommendation(top_relevant, similarity_weight = 0.8, freshness_weight = 0.2)
+    rows, final_score = freshness_scores(catalog, rows, similarity, similarity_weight = 0.8, freshness_weight = 0.2)
 
-    # LIMIT SOURCE OF NEWS THAT APPEAR FREQUENTLY
-    diversified = source_diversity(reranked, max_source = max_source, top_k = top_k)
+    return rerank_scored(catalog, rows, final_score, top_k = top_k, temperature = temperature,
+                         lambda_div = lambda_div, max_source = max_source, seed = seed)
 
-    # MMR DIVERSITY
-    diversified = mmr_rerank(diversified, faiss_index, lambda_div = lambda_div, top_k=50)
 
-    # 5. session-level randomness (ANTI CACHE MONOTON)
-    session_seed = abs(hash(tuple(article_ids)) + int(datetime.now().timestamp() // 60))
+# RESPONSE FRAME FOR THE FINAL ROWS
+def build_results(catalog : ArticleCatalog, rows, final_score):
 
-    # 6. STOCHASTIC SAMPLING
-    final_rank = stochastic_rerank(diversified, top_k = top_k, temperature = temperature, seed = session_seed)
+    with metrics.span("build_results"):
+        results = catalog.df.iloc[rows].reset_index(drop = True)
+        results["final_score"] = final_score
 
+        return results[RESULT_COLUMNS]
 
-    return final_rank[["id", "title", "source", "image", "url", "date", "final_score", "topic_id", "category", "confidence", 'summary']]
 
+# DETERMINISTIC FIRST STAGE OF THE PIPELINE (FAISS HITS + FRESHNESS) , THE PART WORTH CACHING
+#   ids ARE ARTICLE IDS (NOT ROWS) SO A POOL STAYS VALID ACROSS SNAPSHOTS AND WORKERS , ARRAYS ARE READ-ONLY
+class CandidatePool:
 
+    def __init__(self, history, ids, final_score, candidate_floor):
+        self.history = tuple(history)
+        self.ids = np.asarray(ids, dtype = np.int64)
+        self.final_score = np.asarray(final_score, dtype = np.float64)
+        self.candidate_floor = float(candidate_floor)   # LOWEST SIMILARITY THAT MADE THE POOL
 
-# ================================ ANOTHER RECOMMENDATION ======================================
+        self.ids.flags.writeable = False
+        self.final_score.flags.writeable = False
 
-# START COLD RECOMMENDATION FRIENDLY
-def home_feed_news(df, user_id : str, top_k = 10):
+    def __len__(self):
+        return len(self.ids)
 
-    # GET CURRENT TIME
-    now = datetime.now(timezone.utc)
-    df = df.copy()
 
-    seed = abs(hash(user_id)) % (2**32)
-    rng = np.random.default_rng(seed)
+def candidate_pool(article_ids, catalog : ArticleCatalog, pool_size = 100, nprobe = None, ef_search = None, horizon_days = None,
+                   allowed_rows = None, decay_lambda = 0.0001) -> CandidatePool:
 
-    w_freshness = rng.random()
-    w_confidence = 1.0 - w_freshness
+    # GET RELEVANT NEWS
+    rows, similarity = retrieve_candidates(article_ids, catalog, top_k = pool_size, nprobe = nprobe, ef_search = ef_search,
+                                           horizon_days = horizon_days, allowed_rows = allowed_rows, decay_lambda = decay_lambda)
 
-    df["days_diff"] = df["date"].apply(lambda d: max((now - d).days, 0))
-    df["freshness"] = 1.0 / np.log1p(df["days_diff"] + 1)
+    return scored_pool(article_ids, catalog, rows, similarity, pool_size)
 
-    # AGGREGATE 
-    noise = rng.normal(0, 0.05, size=len(df))
-    df["score"] = ((df["freshness"] * w_freshness) * (df["confidence"] * w_confidence)) * (1 + noise)
 
+# CANDIDATE POOLS OF MANY USERS WITH A SINGLE FAISS SEARCH (THE POOLS candidate_pool BUILDS ONE BY ONE) ,
+# RETURNS ONE (POOL OR NONE , MISSING IDS) PAIR PER USER
+def candidate_pool_batch(histories : list, catalog : ArticleCatalog, pool_size = 100, nprobe = None, ef_search = None, horizon_days = None,
+                         allowed_rows = None, decay_lambda = 0.0001):
 
-    return df.sort_values("score", ascending=False).head(top_k)
+    hits, missing = retrieve_candidates_batch(histories, catalog, top_k = pool_size, nprobe = nprobe, ef_search = ef_search,
+                                              horizon_days = horizon_days, allowed_rows = allowed_rows, decay_lambda = decay_lambda)
 
-# LATEST NEWS RECOMMENDATION
-def latest_news(df, top_k = None):
+    return [(None if found is None else scored_pool(history, catalog, *found, pool_size), unknown)
+            for history, found, unknown in zip(histories, hits, missing)]
 
-    if top_k is None:
-        new_news = df.sort_values(by = 'date', ascending = False)   # --> MUNCULKAN SEMUA BERITA JIKA TOP-K NONE
-    else:    
-        new_news = df.sort_values(by = 'date', ascending = False).head(top_k)  # AMBIL TOP-K BERITA TERBARU
 
-    return new_news
+# FRESHNESS-SCORED POOL OF RETRIEVED CANDIDATES
+def scored_pool(history, catalog : ArticleCatalog, rows, similarity, pool_size = 100, candidate_floor = None) -> CandidatePool:
 
+    metrics.CANDIDATE_POOL_SIZE.observe(len(rows))
 
-# TRENDING RECOMMENDATION
-#def trending_feed(df, top_k = 10):
-#    now = datetime.now(timezone.utc)
-#    df = df.copy()
+    # A NEW ARTICLE LESS SIMILAR THAN THE WORST CANDIDATE CANNOT CHANGE THIS POOL
+    if candidate_floor is None:
+        candidate_floor = float(similarity.min()) if len(similarity) >= pool_size else -np.inf
 
-#    df["freshness"] = df["date"].apply(lambda d: np.exp(-0.002 * (now - d).days))
-#    df["score"] = 0.7 * df["confidence"] + 0.3 * df["freshness"]
+    # GET LATEST RELEVANT NEWS (TRADE OFF SIMILARITY VS FRESHNESS)
+    rows, final_score = freshness_scores(catalog, rows, similarity, similarity_weight = 0.8, freshness_weight = 0.2)
 
-#    return df.sort_values("score", ascending=False).head(top_k)
+    return CandidatePool(history, catalog.ids[rows], final_score, candidate_floor)
 
 
+# CHEAP SECOND STAGE , RUN PER REQUEST : A FRESH RESULT FRAME EVERY TIME (CACHED POOLS ARE NEVER MUTATED)
+def recommend_from_pool(pool : CandidatePool, catalog : ArticleCatalog, top_k = 10, temperature = 0.1, lambda_div = 0.1, max_source = 5):
 
-# RECOMMENDATION BASED ON CATEGORY
-def category_feed(df, category, top_k=10):
-    filtered = df[df["category"].str.lower() == category.lower()]
-    return home_feed_news(filtered, top_k)
+    # ARTICLES RETRACTED SINCE THE POOL WAS BUILT ARE DROPPED
+    rows = catalog.lookup(pool.ids)
+    keep = rows >= 0
 
+    rows, final_score = rerank_scored(catalog, rows[keep], pool.final_score[keep], top_k = top_k, temperature = temperature,
+                                      lambda_div = lambda_div, max_source = max_source, seed = session_seed(pool.history))
 
-# RECOMMENDATION BASED ON SOURCE
-def source_feed(df, source, user_id,  top_k = 10):
+    return build_results(catalog, rows, final_score)
 
-    filtered = df[df['source'].str.lower() == source.lower()]
 
-    return home_feed_news(filtered, user_id, top_k = top_k)
\ No newline at end of file
+# FINAL PIPELINE (RE-RANKER)
+def news_recommender(article_ids, catalog : ArticleCatalog, top_k = 10, **params):
+
+    # UNPACK PARAMS
+    temperature = params.pop("temperature", 0.1)
+    lambda_div  = params.pop("lambda_div", 0.1)
+    max_source  = params.pop("max_source", 5)
+    nprobe      = params.pop("nprobe", None)      # ANN TUNING (IVF INDEXES)
+    ef_search   = params.pop("ef_search", None)   # ANN TUNING (HNSW INDEXES)
+    horizon     = params.pop("horizon_days", None) # ONLY ARTICLES OF THE LAST n DAYS (TIME SHARDS WHEN AVAILABLE)
+    allowed     = params.pop("allowed_rows", None) # ONLY THESE ROWS (FILTERED FEEDS)
+
+    # FAISS HITS + FRESHNESS -> SOURCE DIVERSITY -> MMR -> STOCHASTIC SAMPLING
+    pool = candidate_pool(article_ids, catalog, nprobe = nprobe, ef_search = ef_search, horizon_days = horizon, allowed_rows = allowed)
+
+    return recommend_from_pool(pool, catalog, top_k = top_k, temperature = temperature, lambda_div = lambda_div, max_source = max_source)
+
+
+
+# FINAL PIPELINE FOR MANY USERS , RETURNS ONE (RESULTS OR NONE , MISSING IDS) PAIR PER USER
+def news_recommender_batch(histories, catalog : ArticleCatalog, top_k = 10, **params):
+
+    # UNPACK PARAMS
+    temperature = params.pop("temperature", 0.1)
+    lambda_div  = params.pop("lambda_div", 0.1)
+    max_source  = params.pop("max_source", 5)
+    nprobe      = params.pop("nprobe", None)
+    ef_search   = params.pop("ef_search", None)
+    horizon     = params.pop("horizon_days", None)
+    allowed     = params.pop("allowed_rows", None)
+    pool_size   = params.pop("pool_size", 100)
+
+    # CANDIDATE POOLS OF EVERY USER AT ONCE , THEN THE SAME PER-USER RERANK AS news_recommender
+    pools = candidate_pool_batch(histories, catalog, pool_size = pool_size, nprobe = nprobe, ef_search = ef_search,
+                                 horizon_days = horizon, allowed_rows = allowed)
+
+    return [(None if pool is None else recommend_from_pool(pool, catalog, top_k = top_k, temperature = temperature, lambda_div = lambda_div,
+                                                           max_source = max_source), unknown)
+            for pool, unknown in pools]
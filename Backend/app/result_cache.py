@@ -0,0 +1,276 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from .recommender import CandidatePool
+
+
+# CANDIDATE POOL CACHE (FIRST LEVEL OF THE PERSONALIZATION CACHE)
+#   KEY   : (SORTED HISTORY TUPLE , SEARCH SETTINGS ...) , top_k IS NOT PART OF IT (THE POOL DOES NOT DEPEND ON IT)
+#   VALUE : recommender.CandidatePool , STORED AS BYTES (SO EVERY BACKEND HAS THE SAME SIZE ACCOUNTING)
+#   VERSION : THE SNAPSHOT VERSION THE POOL WAS BUILT ON , A WORKER STILL BEHIND IT (INGEST JOURNAL NOT REPLAYED YET)
+#             MISSES INSTEAD OF READING A POOL WITH ARTICLES IT DOES NOT HAVE . OLDER POOLS STAY VALID UNTIL INVALIDATED
+# THE SECOND LEVEL (recommender.recommend_from_pool) IS CHEAP AND RUNS PER REQUEST , SO SAMPLING STAYS STOCHASTIC
+# BOTH BACKENDS : LRU WITHIN A BYTE BUDGET , TTL , HIT / MISS / EVICTION COUNTERS (PER PROCESS)
+
+
+# POOL <-> BYTES : [floor f8 , len(history) i8 , len(ids) i8] + history i8[] + ids i8[] + final_score f8[]
+def encode_pool(pool : CandidatePool) -> bytes:
+
+    header = np.asarray([pool.candidate_floor], dtype = np.float64).tobytes() + \
+             np.asarray([len(pool.history), len(pool.ids)], dtype = np.int64).tobytes()
+
+    return header + np.asarray(pool.history, dtype = np.int64).tobytes() + pool.ids.tobytes() + pool.final_score.tobytes()
+
+
+def decode_pool(blob : bytes) -> CandidatePool:
+
+    floor = np.frombuffer(blob, dtype = np.float64, count = 1)[0]
+    n_history, n_ids = np.frombuffer(blob, dtype = np.int64, count = 2, offset = 8)
+
+    offset = 24
+    history = np.frombuffer(blob, dtype = np.int64, count = n_history, offset = offset)
+    offset += 8 * n_history
+    ids = np.frombuffer(blob, dtype = np.int64, count = n_ids, offset = offset)
+    offset += 8 * n_ids
+    final_score = np.frombuffer(blob, dtype = np.float64, count = n_ids, offset = offset)
+
+    return CandidatePool(history.tolist(), ids, final_score, floor)
+
+
+#   (HISTORY , nprobe , ef_search [, horizon_days , filter]) <-> "1,2,3|16|64[|7|s:...]"
+#   EVERY SEARCH SETTING IS AN INT , NONE OR A STRING (PERCENT-ENCODED AFTER "s:")
+def encode_key(key) -> str:
+    history, *settings = key
+    return "|".join([",".join(map(str, history))] + [_encode_setting(value) for value in settings])
+
+
+def decode_key(text : str):
+    history, *settings = text.split("|")
+    return (tuple(int(x) for x in history.split(",") if x), *(_decode_setting(value) for value in settings))
+
+
+def _encode_setting(value):
+    return "s:" + quote(value, safe = "") if isinstance(value, str) else str(value)
+
+
+def _decode_setting(text):
+    if text.startswith("s:"):
+        return unquote(text[2:])
+    return None if text == "None" else int(text)
+
+
+class CacheStats:
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0     # DROPPED TO STAY WITHIN THE BYTE BUDGET
+        self.expired = 0       # DROPPED BECAUSE OF THE TTL
+        self.invalidated = 0   # DROPPED BY INGESTION
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+# IN-PROCESS BACKEND (ONE PER WORKER)
+class MemoryCandidateCache:
+
+    def __init__(self, max_bytes : int = 32 * 2**20, ttl : float = 300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries = OrderedDict()    # KEY -> (EXPIRES , BLOB , VERSION) , LEAST RECENTLY USED FIRST
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version : int | None = None):
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or (version is not None and entry[2] > version):
+                self.stats.misses += 1
+                return None
+
+            if entry[0] < time.time():
+                self._remove(key)
+                self.stats.expired += 1
+                self.stats.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            blob = entry[1]
+
+        return decode_pool(blob)
+
+    def put(self, key, pool : CandidatePool, version : int = 0):
+
+        blob = encode_pool(pool)
+        if len(blob) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.time() + self.ttl, blob, version)
+            self._bytes += len(blob)
+
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats.evictions += 1
+
+    def _remove(self, key):
+        _, blob, _ = self._entries.pop(key)
+        self._bytes -= len(blob)
+
+    # (KEY , POOL) OF EVERY LIVE ENTRY (USED BY INGESTION INVALIDATION)
+    def entries(self):
+        now = time.time()
+        with self._lock:
+            items = [(key, blob) for key, (expires, blob, _) in self._entries.items() if expires >= now]
+        return [(key, decode_pool(blob)) for key, blob in items]
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+                    self.stats.invalidated += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def info(self):
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._entries), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "ttl": self.ttl, **self.stats.as_dict()}
+
+
+# SQLITE FILE BACKEND , SHARED BY EVERY WORKER THAT POINTS AT THE SAME PATH (WAL MODE , ONE CONNECTION PER THREAD)
+class SQLiteCandidateCache:
+
+    def __init__(self, path, max_bytes : int = 32 * 2**20, ttl : float = 300):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS candidates "
+                         "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, expires REAL NOT NULL, used REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS candidates_used ON candidates (used)")
+
+            # FILES CREATED BEFORE THE VERSION COLUMN
+            if "version" not in [column[1] for column in conn.execute("PRAGMA table_info(candidates)")]:
+                conn.execute("ALTER TABLE candidates ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self):
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout = 5.0, isolation_level = None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+
+        return conn
+
+    # CLOSE THIS THREAD'S CONNECTION (REOPENED ON NEXT USE) , A PRELOADING PARENT CALLS IT BEFORE FORKING THE WORKERS
+    def close(self):
+
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def get(self, key, version : int | None = None):
+
+        conn, now = self._connect(), time.time()
+        row = conn.execute("SELECT value, expires, version FROM candidates WHERE key = ?", (encode_key(key),)).fetchone()
+
+        if row is None or (version is not None and row[2] > version):
+            self.stats.misses += 1
+            return None
+
+        if row[1] < now:
+            conn.execute("DELETE FROM candidates WHERE key = ?", (encode_key(key),))
+            self.stats.expired += 1
+            self.stats.misses += 1
+            return None
+
+        conn.execute("UPDATE candidates SET used = ? WHERE key = ?", (now, encode_key(key)))
+        self.stats.hits += 1
+
+        return decode_pool(row[0])
+
+    def put(self, key, pool : CandidatePool, version : int = 0):
+
+        blob = encode_pool(pool)
+        if len(blob) > self.max_bytes:
+            return
+
+        conn, now = self._connect(), time.time()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR REPLACE INTO candidates (key, value, size, expires, used, version) VALUES (?, ?, ?, ?, ?, ?)",
+                         (encode_key(key), blob, len(blob), now + self.ttl, now, version))
+
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM candidates").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            # EXPIRED ENTRIES FIRST , THEN LEAST RECENTLY USED UNTIL WITHIN BUDGET
+            total -= conn.execute("SELECT COALESCE(SUM(size), 0) FROM candidates WHERE expires < ?", (now,)).fetchone()[0]
+            self.stats.expired += conn.execute("DELETE FROM candidates WHERE expires < ?", (now,)).rowcount
+
+            victims = []
+            for victim, size in conn.execute("SELECT key, size FROM candidates ORDER BY used"):
+                if total <= self.max_bytes:
+                    break
+                victims.append((victim,))
+                total -= size
+
+            conn.executemany("DELETE FROM candidates WHERE key = ?", victims)
+            self.stats.evictions += len(victims)
+
+    def entries(self):
+        rows = self._connect().execute("SELECT key, value FROM candidates WHERE expires >= ?", (time.time(),)).fetchall()
+        return [(decode_key(key), decode_pool(value)) for key, value in rows]
+
+    def discard(self, keys):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self.stats.invalidated += sum(conn.execute("DELETE FROM candidates WHERE key = ?", (encode_key(key),)).rowcount
+                                          for key in keys)
+
+    def clear(self):
+        self._connect().execute("DELETE FROM candidates")
+
+    def info(self):
+        entries, size = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM candidates").fetchone()
+        return {"backend": "sqlite", "path": self.path, "entries": entries, "bytes": size,
+                "max_bytes": self.max_bytes, "ttl": self.ttl, **self.stats.as_dict()}
+
+
+# RESULT_CACHE_PATH SET -> SQLITE FILE SHARED BY THE WORKERS , IN-PROCESS OTHERWISE
+def candidate_cache_from_env():
+
+    max_bytes = int(os.getenv("RESULT_CACHE_BYTES", 32 * 2**20))
+    ttl = float(os.getenv("RESULT_CACHE_TTL", 300))
+    path = os.getenv("RESULT_CACHE_PATH")
+
+    if path:
+        return SQLiteCandidateCache(path, max_bytes = max_bytes, ttl = ttl)
+    return MemoryCandidateCache(max_bytes = max_bytes, ttl = ttl)
@@ -1,10 +1,25 @@
 import pandas as pd
-from pydantic import BaseModel, HttpUrl
-from typing import List, Optional
+from pydantic import BaseModel, Field, HttpUrl, model_validator
+from datetime import date, datetime
+from typing import Any, Dict, List, Literal, Optional
+
+# REQUEST BOUNDS : ANYTHING OUTSIDE IS A 422 , NOT A 500 FROM A NEGATIVE SLICE OR A HUGE SEARCH
+MAX_TOP_K = 100
+MAX_NPROBE = 4096
+MAX_EF_SEARCH = 4096
 
 class RecommendationRequest(BaseModel):
     article_ids: List[int]
-    top_k: int = 10
+    top_k: int = Field(10, ge = 1, le = MAX_TOP_K)
+    nprobe: Optional[int] = Field(None, ge = 1, le = MAX_NPROBE)            # ANN TUNING FOR IVF INDEXES (ENDPOINT DEFAULT IF EMPTY)
+    ef_search: Optional[int] = Field(None, ge = 1, le = MAX_EF_SEARCH)      # ANN TUNING FOR HNSW INDEXES (ENDPOINT DEFAULT IF EMPTY)
+    mode: Optional[Literal["ann", "neighbors", "interests"]] = None   # CANDIDATES FROM AN INDEX SEARCH (DEFAULT) , THE NEIGHBOR GRAPH
+                                                                      # OR ONE SEARCH PER INTEREST CLUSTER OF THE HISTORY
+    horizon_days: Optional[int] = Field(None, ge = 1)    # ONLY ARTICLES OF THE LAST n DAYS (ENDPOINT DEFAULT IF EMPTY)
+    categories: Optional[List[str]] = None               # ONLY THESE CATEGORIES (CASE-INSENSITIVE)
+    sources: Optional[List[str]] = None                  # ONLY THESE SOURCES (CASE-INSENSITIVE)
+    date_from: Optional[date] = None                     # PUBLISHED ON OR AFTER THIS DAY
+    date_to: Optional[date] = None                       # PUBLISHED ON OR BEFORE THIS DAY
 
 class RecommendationItem(BaseModel):
     id: int
@@ -24,9 +39,88 @@ class RecommendationResponse(BaseModel):
 
     top_k: int
     results: List[RecommendationItem]
+    unknown_ids: Optional[List[int]] = None
+
+
+class UserHistory(BaseModel):
+    user_id: str
+    article_ids: List[int]
+
+class BatchRecommendationRequest(BaseModel):
+    users: List[UserHistory]
+    top_k: int = Field(10, ge = 1, le = MAX_TOP_K)
+    nprobe: Optional[int] = Field(None, ge = 1, le = MAX_NPROBE)
+    ef_search: Optional[int] = Field(None, ge = 1, le = MAX_EF_SEARCH)
+    mode: Optional[Literal["ann", "neighbors", "interests"]] = None   # SAME CANDIDATE MODES AS RecommendationRequest
+    horizon_days: Optional[int] = Field(None, ge = 1)
+    categories: Optional[List[str]] = None     # SAME FILTERS FOR EVERY USER OF THE BATCH
+    sources: Optional[List[str]] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+# PERSONALIZATION FROM A STORED PROFILE : ONLY THE ARTICLES READ SINCE THE LAST CALL ARE SENT
+class ProfileRecommendationRequest(BaseModel):
+    user_id: str = Field(..., min_length = 1, max_length = 128)
+    new_article_ids: List[int] = []        # FOLDED INTO THE PROFILE BEFORE RANKING (EMPTY = RANK THE CURRENT PROFILE)
+    top_k: int = Field(10, ge = 1, le = MAX_TOP_K)
+    nprobe: Optional[int] = Field(None, ge = 1, le = MAX_NPROBE)
+    ef_search: Optional[int] = Field(None, ge = 1, le = MAX_EF_SEARCH)
+    horizon_days: Optional[int] = Field(None, ge = 1)
+    categories: Optional[List[str]] = None
+    sources: Optional[List[str]] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+class UserRecommendation(BaseModel):
+    user_id: str
+    top_k: int
+    results: List[RecommendationItem]
+    unknown_ids: Optional[List[int]] = None
+
+class BatchRecommendationResponse(BaseModel):
+    results: List[UserRecommendation]
 
 
 class RandomNewsResponse(BaseModel):
     cursor: int
     is_end: bool
-    result: RecommendationItem
\ No newline at end of file
+    seed: int
+    result: Optional[RecommendationItem] = None
+    results: List[RecommendationItem] = []
+
+
+# ONE INGESTED ARTICLE : EVERY FIELD A FEED RESPONSE NEEDS IS REQUIRED , SO A PARTIAL ROW NEVER REACHES A SNAPSHOT
+#   (ALSO APPLIED TO DROP DIRECTORY BATCHES BY app.ingest.prepare_articles)
+class IngestArticle(BaseModel):
+    id: int
+    title: str = Field(..., min_length = 1)
+    source: str = Field(..., min_length = 1)
+    url: HttpUrl
+    category: str = Field(..., min_length = 1)
+    date: datetime
+    topic_id: int
+    image: Optional[HttpUrl] = None
+    confidence: Optional[float] = Field(None, ge = 0, le = 1)
+    summary: Optional[str] = None
+    content: Optional[str] = None          # BODY , MOVED TO THE BODY STORE
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class IngestRequest(BaseModel):
+    articles: List[IngestArticle] = Field(..., min_length = 1)
+    embeddings: List[List[float]]         # ONE VECTOR PER ARTICLE , SAME ORDER (DIMENSION CHECKED AGAINST THE CATALOG)
+
+    @model_validator(mode = "after")
+    def one_vector_per_article(self):
+        if len(self.embeddings) != len(self.articles):
+            raise ValueError(f"{len(self.articles)} articles but {len(self.embeddings)} embeddings")
+        if len({len(vector) for vector in self.embeddings}) > 1:
+            raise ValueError("every embedding needs the same dimension")
+        return self
+
+class RetractRequest(BaseModel):
+    article_ids: List[int]
+
+class IngestResponse(BaseModel):
+    version: int
+    article_ids: List[int]
@@ -0,0 +1,129 @@
+import argparse
+import importlib
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+
+import uvicorn
+
+from . import startup as startup_module
+
+
+# PRE-FORKING LAUNCHER : THE APP MODULE IS IMPORTED (LOADED , INDEXED , WARMED UP) ONCE IN THIS PARENT PROCESS , THEN
+# `workers` PROCESSES ARE fork()ED FROM IT AND SERVE THE SAME LISTENING SOCKET
+#   THE CATALOG FRAME , EMBEDDINGS , FAISS INDEX , NEIGHBOR GRAPH AND TEXT INDEX ARE SHARED COPY-ON-WRITE (NEVER WRITTEN AFTER LOAD)
+#   A WORKER THAT DIES IS RE-FORKED FROM THE LOADED PARENT , READY IN THE TIME IT TAKES TO START ITS THREADS
+#   (`uvicorn --workers N` SPAWNS FRESH INTERPRETERS INSTEAD , EACH ONE RELOADS EVERYTHING)
+#   WITH MORE THAN ONE WORKER , INGESTION GOES THROUGH A SHARED JOURNAL (INGEST_JOURNAL_DIR) SO EVERY WORKER SERVES THE SAME
+#   CATALOG (SEE ingest.IngestJournal) , AND TRENDING VIEW COUNTS ARE SUMMED IN A SHARED FILE (TRENDING_PATH) SO EVERY WORKER
+#   SERVES THE SAME TRENDING FEED . BOTH DEFAULT TO A TEMPORARY DIRECTORY . OTHER COUNTERS (/metrics , /admin/cache STATS)
+#   STAY PER WORKER
+#
+#   python -m app.serve app.main_HF:app --host 0.0.0.0 --port 7860 --workers 4
+
+
+def load_app(target : str):
+
+    module_name, _, attribute = target.partition(":")
+    module = importlib.import_module(module_name)
+
+    return getattr(module, attribute or "app"), getattr(module, "startup", None)
+
+
+# ONE WORKER : UVICORN ON THE INHERITED SOCKET (ITS LIFESPAN RUNS THE APP'S PER-WORKER HOOKS) , NEVER RETURNS
+def run_worker(app, sock, log_level : str):
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    code = 0
+    try:
+        server = uvicorn.Server(uvicorn.Config(app, lifespan = "on", log_level = log_level))
+        server.run(sockets = [sock])
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def serve(target : str, host : str, port : int, workers : int, log_level : str = "info"):
+
+    startup_module.PRELOADING = True
+    os.environ["WEB_CONCURRENCY"] = str(workers)     # FAISS THREADS PER WORKER = CORES / WORKERS
+    if workers > 1 and not (os.getenv("INGEST_JOURNAL_DIR") and os.getenv("TRENDING_PATH")):
+        shared = tempfile.mkdtemp(prefix = "serve-shared-")
+        os.environ.setdefault("INGEST_JOURNAL_DIR", os.path.join(shared, "journal"))
+        os.environ.setdefault("TRENDING_PATH", os.path.join(shared, "trending.sqlite"))
+    app, startup = load_app(target)
+
+    if startup is not None:
+        startup.prepare_fork()
+
+    sock = socket.create_server((host, port), backlog = 2048)
+    children = {}     # PID -> FORK TIME
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            run_worker(app, sock, log_level)
+        children[pid] = time.time()
+
+    for _ in range(workers):
+        spawn()
+    print(f"[serve] {target} on {host}:{port} , workers {sorted(children)}", flush = True)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # RE-FORK WORKERS THAT EXIT , UNTIL ASKED TO STOP (A WORKER THAT DIES RIGHT AFTER ITS START IS RE-FORKED AFTER A PAUSE)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+
+        forked = children.pop(pid, None)
+        if forked is None or stopping:
+            continue
+
+        print(f"[serve] worker {pid} exited with status {status} , forking a new one", flush = True)
+        if time.time() - forked < 5:
+            time.sleep(1)
+        if not stopping:
+            spawn()
+
+    sock.close()
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Load the app once , then fork workers that share it copy-on-write")
+    parser.add_argument("app", nargs = "?", default = "app.main_HF:app", help = "module:attribute of the ASGI app")
+    parser.add_argument("--host", default = "0.0.0.0")
+    parser.add_argument("--port", type = int, default = int(os.getenv("PORT", 7860)))
+    parser.add_argument("--workers", type = int, default = int(os.getenv("WEB_CONCURRENCY", 1)))
+    parser.add_argument("--log-level", default = "info")
+    args = parser.parse_args(argv)
+
+    serve(args.app, args.host, args.port, max(args.workers, 1), log_level = args.log_level)
+
+
+if __name__ == "__main__":
+    main()
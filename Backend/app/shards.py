@@ -0,0 +1,188 @@
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from . import ann_index
+from .catalog import now_epoch_days
+
+
+# TIME-PARTITIONED SEARCH INDEX
+#   ONE SMALL INDEX PER PUBLICATION WINDOW (7-DAY WEEK OR CALENDAR MONTH) FOR THE LAST `live_days` DAYS
+#   A SEARCH WITH A RECENCY HORIZON ONLY TOUCHES THE WINDOWS INSIDE IT AND MERGES THEIR TOP-K
+#   OLDER ARTICLES STAY REACHABLE THROUGH THE CATALOG'S FULL INDEX (SEARCHES WITHOUT A HORIZON)
+# SHARDS ARE IMMUTABLE : extend() / drop_before() RETURN A NEW ShardedIndex THAT SHARES THE UNTOUCHED SHARDS
+WINDOWS = ("week", "month")
+
+
+# WINDOW KEY OF EVERY EPOCH DAY (-1 FOR MISSING DATES) , AND [START , END) DAYS OF A KEY
+def window_keys(epoch_days, window = "week"):
+
+    days = np.asarray(epoch_days, dtype = np.float64)
+    known = ~np.isnan(days)
+    keys = np.full(len(days), -1, dtype = np.int64)
+
+    whole_days = np.floor(days[known]).astype(np.int64)
+    if window == "week":
+        keys[known] = whole_days // 7
+    else:
+        keys[known] = whole_days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+    return keys
+
+
+def window_bounds(key, window = "week"):
+
+    if window == "week":
+        return int(key) * 7, int(key) * 7 + 7
+
+    start = np.datetime64(int(key), "M")
+    return int(start.astype("datetime64[D]").astype(np.int64)), int((start + 1).astype("datetime64[D]").astype(np.int64))
+
+
+class Shard:
+
+    def __init__(self, key, start_day, end_day, rows, days, index):
+        self.key = key
+        self.start_day = start_day    # [start_day , end_day) IN EPOCH DAYS
+        self.end_day = end_day
+        self.rows = rows              # SHARD ID -> CATALOG ROW
+        self.days = days              # EPOCH DAYS OF THOSE ROWS (FOR THE EXACT HORIZON CUT)
+        self.index = index
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class ShardedIndex:
+
+    def __init__(self, shards, window = "week", live_from : float = 0.0, kind = "flat"):
+
+        if window not in WINDOWS:
+            raise ValueError(f"unknown shard window {window!r}, expected one of {WINDOWS}")
+
+        self.shards = shards            # KEY -> Shard
+        self.window = window
+        self.live_from = live_from      # EPOCH DAY FROM WHICH EVERY DATED ARTICLE IS IN A SHARD
+        self.kind = kind
+
+    def __len__(self):
+        return len(self.shards)
+
+    def _build_shard(self, key, rows, catalog):
+
+        start_day, end_day = window_bounds(key, self.window)
+        embeddings = np.ascontiguousarray(catalog.embeddings[rows], dtype = np.float32)
+        return Shard(key, start_day, end_day, rows, catalog.epoch_days[rows], ann_index.build_index(embeddings, kind = self.kind))
+
+    # WINDOWS OF THE LAST `live_days` DAYS (THE OLDEST ONE IS INCLUDED WHOLE)
+    @classmethod
+    def build(cls, catalog, window = "week", live_days : float = 90, kind = "flat", now = None):
+
+        keys = window_keys(catalog.epoch_days, window)
+        first_key = window_keys([now_epoch_days(now) - live_days], window)[0]
+        live_from = window_bounds(first_key, window)[0]
+
+        sharded = cls({}, window = window, live_from = live_from, kind = kind)
+
+        rows = np.flatnonzero((keys >= first_key) & catalog.active)
+        order = np.argsort(keys[rows], kind = "stable")
+        rows = rows[order]
+        live_keys, starts = np.unique(keys[rows], return_index = True)
+
+        for key, group in zip(live_keys, np.split(rows, starts[1:])):
+            sharded.shards[int(key)] = sharded._build_shard(int(key), group, catalog)
+
+        return sharded
+
+    # SHARDS FOR A CATALOG THAT GOT `new_rows` APPENDED (ONLY THE WINDOWS THEY FALL IN ARE COPIED)
+    def extend(self, catalog, new_rows):
+
+        new_rows = np.asarray(new_rows, dtype = np.int64)
+        keys = window_keys(catalog.epoch_days[new_rows], self.window)
+        live = catalog.epoch_days[new_rows] >= self.live_from
+
+        shards = dict(self.shards)
+        for key in np.unique(keys[live]).tolist():
+            rows = new_rows[live & (keys == key)]
+            shard = shards.get(key)
+
+            if shard is None:
+                shards[key] = self._build_shard(key, rows, catalog)
+                continue
+
+            index = faiss.deserialize_index(faiss.serialize_index(shard.index))
+            index.add(np.ascontiguousarray(catalog.embeddings[rows], dtype = np.float32))
+            shards[key] = Shard(key, shard.start_day, shard.end_day, np.concatenate([shard.rows, rows]),
+                                np.concatenate([shard.days, catalog.epoch_days[rows]]), index)
+
+        return ShardedIndex(shards, window = self.window, live_from = self.live_from, kind = self.kind)
+
+    # DROP EVERY WINDOW THAT ENDS BEFORE `before_day` (OPTIONALLY WRITE IT TO archive_dir FIRST)
+    # RETURNS (NEW ShardedIndex , KEYS THAT WERE DROPPED)
+    def drop_before(self, before_day : float, archive_dir = None):
+
+        dropped = [key for key, shard in self.shards.items() if shard.end_day <= before_day]
+
+        if archive_dir is not None:
+            archive_dir = Path(archive_dir)
+            archive_dir.mkdir(parents = True, exist_ok = True)
+            for key in dropped:
+                shard = self.shards[key]
+                faiss.write_index(shard.index, str(archive_dir / f"{self.window}-{key}.faiss"))
+                np.save(archive_dir / f"{self.window}-{key}.rows.npy", shard.rows)
+
+        shards = {key: shard for key, shard in self.shards.items() if key not in dropped}
+        return ShardedIndex(shards, window = self.window, live_from = max(self.live_from, before_day), kind = self.kind), dropped
+
+    # TRUE WHEN EVERY ARTICLE OF THE LAST `horizon_days` DAYS IS IN A SHARD
+    def covers(self, horizon_days, now = None):
+        return now_epoch_days(now) - horizon_days >= self.live_from
+
+    # SAME SHAPE AS faiss SEARCH (SCORES , CATALOG ROWS) , ONLY ARTICLES PUBLISHED IN THE LAST `horizon_days` DAYS
+    # active : OPTIONAL BOOLEAN MASK OVER CATALOG ROWS , ROWS OUTSIDE IT ARE NEVER RETURNED (EVERY QUERY STILL GETS k HITS)
+    def search(self, queries, k, horizon_days, nprobe = None, ef_search = None, now = None, active = None):
+
+        cutoff = now_epoch_days(now) - horizon_days
+        queries = np.ascontiguousarray(queries, dtype = np.float32)
+
+        all_scores = [np.full((len(queries), 0), -np.inf, dtype = np.float32)]
+        all_rows = [np.full((len(queries), 0), -1, dtype = np.int64)]
+
+        for shard in self.shards.values():
+            if shard.end_day <= cutoff or len(shard) == 0:
+                continue
+
+            # THE OLDEST SHARD IS PARTLY OUTSIDE THE HORIZON , RETRACTED ROWS STAY IN THEIR SHARD : ASK FOR AS MANY EXTRA HITS
+            # AS THE SHARD HAS HIDDEN ROWS
+            hidden = shard.days < cutoff if shard.start_day < cutoff else None
+            if active is not None:
+                hidden = ~active[shard.rows] if hidden is None else hidden | ~active[shard.rows]
+            extra = 0 if hidden is None else int(hidden.sum())
+
+            scores, ids = ann_index.search(shard.index, queries, min(k + extra, len(shard)), nprobe = nprobe, ef_search = ef_search)
+            found = ids >= 0
+
+            if extra:
+                found[found] = ~hidden[ids[found]]
+
+            all_scores.append(np.where(found, scores, -np.inf).astype(np.float32))
+            all_rows.append(np.where(found, shard.rows[np.where(found, ids, 0)], -1))
+
+        scores, rows = np.concatenate(all_scores, axis = 1), np.concatenate(all_rows, axis = 1)
+
+        # MERGE : TOP-K OF EVERY QUERY ACROSS SHARDS , PADDED LIKE faiss (-1 , -inf)
+        order = np.argsort(-scores, axis = 1, kind = "stable")[:, :k]
+        scores, rows = np.take_along_axis(scores, order, axis = 1), np.take_along_axis(rows, order, axis = 1)
+
+        if rows.shape[1] < k:
+            pad = k - rows.shape[1]
+            scores = np.pad(scores, ((0, 0), (0, pad)), constant_values = -np.inf)
+            rows = np.pad(rows, ((0, 0), (0, pad)), constant_values = -1)
+
+        return scores, rows
+
+    def info(self):
+        return {"window": self.window, "kind": self.kind, "live_from_day": float(self.live_from),
+                "shards": [{"key": key, "start_day": shard.start_day, "end_day": shard.end_day, "articles": len(shard)}
+                           for key, shard in sorted(self.shards.items())]}
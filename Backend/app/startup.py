@@ -0,0 +1,107 @@
+import gc
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from . import metrics
+
+
+# SET BY app.serve BEFORE IT IMPORTS THE APP : THIS PROCESS IS A PARENT THAT LOADS ONCE AND fork()S THE WORKERS
+PRELOADING = False
+
+
+# STARTUP OF ONE APP MODULE : TIMED PHASES (LOAD , INDEXES , WARMUP) , THEN THE PER-WORKER HOOKS
+#   THE PHASES RUN ONCE , AT IMPORT : IN EACH WORKER UNDER PLAIN UVICORN , ONCE IN THE PARENT UNDER `python -m app.serve`
+#   THE WORKER HOOKS (THREADS , FAISS THREADS) RUN IN EVERY WORKER PROCESS FROM THE LIFESPAN , AFTER THE fork()
+#   LIVE  : THE PROCESS ANSWERS
+#   READY : THE WARMUP FINISHED AND THIS WORKER RAN ITS HOOKS
+class Startup:
+
+    def __init__(self, name : str):
+        self.name = name
+        self.phases = []            # (PHASE , SECONDS) IN ORDER
+        self.warm = False
+        self.worker_seconds = None
+        self.preloading = PRELOADING
+        self.preloaded = False      # LOADED IN A PARENT PROCESS AND INHERITED THROUGH fork()
+        self._worker_pid = None
+        self._worker_hooks = []
+        self._fork_hooks = []
+        self._lock = threading.Lock()
+
+    def log(self, message):
+        print(f"[startup] {self.name} pid={os.getpid()} {message}", flush = True)
+
+    @contextmanager
+    def phase(self, name : str):
+
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+
+        self.phases.append((name, elapsed))
+        self.log(f"{name} {elapsed:.3f}s")
+
+    # THE WARMUP QUERIES RAN : THEIR STAGE TIMINGS AND CACHE COUNTERS ARE NOT TRAFFIC , SO THE METRICS START EMPTY
+    def mark_warm(self):
+        metrics.REGISTRY.reset()
+        self.warm = True
+        self.log(f"loaded in {sum(seconds for _, seconds in self.phases):.3f}s")
+
+    # function() IN EVERY WORKER PROCESS (USABLE AS A DECORATOR)
+    def on_worker(self, function):
+        self._worker_hooks.append(function)
+        return function
+
+    # function() IN THE PRELOADING PARENT RIGHT BEFORE IT FORKS (e.g. CLOSE A DATABASE CONNECTION)
+    def before_fork(self, function):
+        self._fork_hooks.append(function)
+        return function
+
+    # ONCE PER PROCESS , FROM THE LIFESPAN
+    def start_worker(self):
+
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+
+            start = time.perf_counter()
+            for hook in self._worker_hooks:
+                hook()
+
+            self._worker_pid = os.getpid()
+            self.worker_seconds = time.perf_counter() - start
+            self.log(f"worker started in {self.worker_seconds:.3f}s (preloaded = {self.preloaded})")
+
+    # CALLED BY app.serve IN THE PARENT : NOTHING THAT CANNOT CROSS A fork() STAYS OPEN , AND EVERYTHING LOADED SO FAR IS
+    # MOVED TO THE PERMANENT GC GENERATION , SO COLLECTIONS IN THE WORKERS NEVER WRITE TO (AND COPY) THE SHARED PAGES
+    def prepare_fork(self):
+
+        for hook in self._fork_hooks:
+            hook()
+
+        # A THREAD ALIVE HERE DOES NOT EXIST IN THE WORKERS (AND MAY HOLD A LOCK THEY INHERIT)
+        threads = [thread.name for thread in threading.enumerate() if thread is not threading.main_thread()]
+        if threads:
+            self.log(f"forking with running threads {threads}")
+
+        gc.collect()
+        gc.freeze()
+        self.preloaded = True
+
+    @property
+    def ready(self):
+        return self.warm and self._worker_pid == os.getpid()
+
+    def info(self):
+        return {"status": "ready" if self.ready else "starting", "app": self.name, "pid": os.getpid(), "preloaded": self.preloaded,
+                "phases": {name: round(seconds, 3) for name, seconds in self.phases},
+                "load_seconds": round(sum(seconds for _, seconds in self.phases), 3),
+                "worker_seconds": None if self.worker_seconds is None else round(self.worker_seconds, 3)}
+
+    # FastAPI(lifespan = startup.lifespan)
+    @asynccontextmanager
+    async def lifespan(self, app):
+        self.start_worker()
+        yield
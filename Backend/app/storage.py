@@ -0,0 +1,174 @@
+import argparse
+import json
+import shutil
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from . import ann_index
+from .body_store import RANKING_COLUMNS, BODY_FILE, ArticleBodyStore
+from .catalog import ArticleCatalog
+
+
+# ON-DISK CATALOG DIRECTORY (WRITTEN ONCE OFFLINE , OPENED READ-ONLY BY EVERY WORKER)
+#   manifest.json   : ROW COUNT , EMBEDDING DIM , COLUMN LIST , FORMAT VERSION
+#   metadata.arrow  : ARROW IPC FILE (UNCOMPRESSED) , DATE COLUMNS PRE-PARSED TO INT64 NANOSECONDS UTC
+#   embeddings.f32  : RAW FLOAT32 MATRIX (ROWS x DIM) , OPENED WITH np.memmap
+#   index.faiss     : SEARCH INDEX , OPENED WITH FAISS MMAP IO FLAGS
+#   bodies.*        : ARTICLE BODIES (app.body_store) , KEPT OUT OF metadata.arrow
+# ALL FILES ARE MEMORY-MAPPED , SO N WORKERS SHARE THE SAME PAGES THROUGH THE OS PAGE CACHE
+FORMAT_VERSION = 1
+DATE_COLUMNS = ["date", "created_at", "updated_at"]
+NAT = np.iinfo(np.int64).min
+
+MMAP_IO_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+# DATETIME COLUMN -> INT64 NANOSECONDS SINCE EPOCH (UTC) , NaT -> INT64 MIN
+def dates_to_int64(values : pd.Series) -> np.ndarray:
+
+    dates = pd.to_datetime(values, errors = "coerce", utc = True)
+    return dates.dt.as_unit("ns").to_numpy(dtype = "datetime64[ns]").view(np.int64)
+
+
+# INT64 NANOSECONDS -> TZ-AWARE DATETIME COLUMN (NO STRING PARSING)
+def int64_to_dates(values : np.ndarray) -> pd.Series:
+    return pd.Series(pd.DatetimeIndex(np.asarray(values, dtype = np.int64).view("datetime64[ns]")).tz_localize("UTC"))
+
+
+# WRITE A CATALOG DIRECTORY FROM A FRAME AND ITS (FLAT) FAISS INDEX
+def export_catalog(df : pd.DataFrame, faiss_index, out_dir, search_index_path = None, index_kind = None):
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents = True, exist_ok = True)
+    df = df.reset_index(drop = True)
+
+    # ARTICLE BODIES , READ LAZILY BY /news/{article_id}
+    if "content" in df:
+        ArticleBodyStore.build(out_dir, df["id"].to_numpy(), df["content"].tolist())
+
+    # METADATA (ONLY THE RANKING COLUMNS , DATES AS INT64)
+    columns = {}
+    for col in df.columns:
+        if col not in RANKING_COLUMNS:
+            continue
+        columns[col] = pa.array(dates_to_int64(df[col])) if col in DATE_COLUMNS else pa.array(df[col], from_pandas = True)
+    table = pa.table(columns)
+
+    with pa.OSFile(str(out_dir / "metadata.arrow"), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    # EXACT EMBEDDINGS
+    embeddings = write_embeddings(faiss_index.reconstruct_n(0, faiss_index.ntotal), out_dir / "embeddings.f32")
+
+    # SEARCH INDEX (A PREBUILT ANN INDEX , ONE BUILT HERE e.g. sq_int8 CODES , OR THE FLAT ONE)
+    if search_index_path:
+        shutil.copyfile(search_index_path, out_dir / "index.faiss")
+    elif index_kind:
+        faiss.write_index(ann_index.build_index(embeddings, kind = index_kind), str(out_dir / "index.faiss"))
+    else:
+        faiss.write_index(faiss_index, str(out_dir / "index.faiss"))
+
+    manifest = {"format_version": FORMAT_VERSION,
+                "rows": len(df),
+                "dim": int(embeddings.shape[1]),
+                "columns": list(table.column_names),
+                "date_columns": [col for col in DATE_COLUMNS if col in table.column_names],
+                "bodies": "content" in df}
+    (out_dir / "manifest.json").write_text(json.dumps(manifest, indent = 2))
+
+    return manifest
+
+
+# RAW FLOAT32 MATRIX FILE , RETURNED AS A READ-ONLY MEMORY MAP (PAGES ARE READ ON DEMAND AND SHARED BY WORKERS)
+def write_embeddings(embeddings : np.ndarray, path):
+
+    embeddings = np.ascontiguousarray(embeddings, dtype = np.float32)
+    embeddings.tofile(path)
+    return np.memmap(path, dtype = np.float32, mode = "r", shape = embeddings.shape)
+
+
+# READ THE METADATA TABLE FROM THE MEMORY MAP
+#   STRING COLUMNS STAY ARROW-BACKED (ZERO-COPY VIEWS OF THE MAPPED FILE) , DATES ARE REBUILT FROM INT64
+def load_metadata(path, date_columns = DATE_COLUMNS) -> pd.DataFrame:
+
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        if name in date_columns:
+            columns[name] = int64_to_dates(column.to_numpy())
+        elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            columns[name] = pd.Series(pd.arrays.ArrowExtensionArray(column))
+        else:
+            columns[name] = column.to_pandas()
+
+    return pd.DataFrame(columns, copy = False)
+
+
+# OPEN A CATALOG DIRECTORY (NOTHING IS PARSED , NOTHING BIG IS COPIED)
+def load_catalog(catalog_dir, nprobe = None, ef_search = None, mmap = True) -> ArticleCatalog:
+
+    catalog_dir = Path(catalog_dir)
+    manifest = json.loads((catalog_dir / "manifest.json").read_text())
+
+    if manifest["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"catalog format {manifest['format_version']} is not supported (expected {FORMAT_VERSION})")
+
+    df = load_metadata(catalog_dir / "metadata.arrow", manifest["date_columns"])
+
+    embeddings = np.memmap(catalog_dir / "embeddings.f32", dtype = np.float32, mode = "r",
+                           shape = (manifest["rows"], manifest["dim"]))
+
+    search_index = ann_index.load_index(catalog_dir / "index.faiss", nprobe = nprobe, ef_search = ef_search,
+                                        io_flags = MMAP_IO_FLAGS if mmap else 0)
+
+    return ArticleCatalog(df, search_index, embeddings = embeddings)
+
+
+# ARTICLE BODY STORE OF A CATALOG DIRECTORY (NONE FOR CATALOGS EXPORTED WITHOUT BODIES)
+def load_body_store(catalog_dir, cache_size : int = 1024):
+
+    catalog_dir = Path(catalog_dir)
+    return ArticleBodyStore(catalog_dir, cache_size = cache_size) if (catalog_dir / BODY_FILE).exists() else None
+
+
+# CONVERTER
+#   python -m app.storage --csv ../news-dataset/labeled_data.csv --faiss ../news_embeddings.faiss --out ../catalog
+#   python -m app.storage --hf --out ../catalog
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Convert the news dataset + FAISS index into a memory-mapped catalog directory")
+    parser.add_argument("--csv", help = "labeled news csv")
+    parser.add_argument("--faiss", help = "flat FAISS index with the exact embeddings")
+    parser.add_argument("--hf", action = "store_true", help = "download both from the SandKing/News-Recommendation dataset")
+    parser.add_argument("--search-index", help = "prebuilt ANN index to serve instead of the flat one (see app.ann_index)")
+    parser.add_argument("--index-kind", choices = ann_index.INDEX_KINDS, help = "build this index kind instead (e.g. sq_int8 , pq)")
+    parser.add_argument("--out", required = True)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+
+    if args.hf:
+        from datasets import load_dataset
+        from huggingface_hub import hf_hub_download
+
+        df = load_dataset(path = "SandKing/News-Recommendation", data_files = "labeled_news.csv", split = "train").to_pandas()
+        faiss_path = hf_hub_download(repo_id = "SandKing/News-Recommendation", filename = "news_embeddings.faiss", repo_type = "dataset")
+    else:
+        if not (args.csv and args.faiss):
+            parser.error("--csv and --faiss are required unless --hf is given")
+        df = pd.read_csv(args.csv)
+        faiss_path = args.faiss
+
+    manifest = export_catalog(df, faiss.read_index(faiss_path), args.out, search_index_path = args.search_index, index_kind = args.index_kind)
+    print(f"wrote {manifest['rows']} articles (dim {manifest['dim']}) to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
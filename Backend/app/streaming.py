@@ -0,0 +1,75 @@
+import json
+
+import numpy as np
+import pandas as pd
+from fastapi.responses import StreamingResponse
+
+
+# STREAMED RESPONSES (NDJSON OR SERVER-SENT EVENTS)
+#   {"type": "items" , "top_k": n , "results": [...] , "unknown_ids": [...]}   RANKED LIST , SENT FIRST
+#   {"type": "reason" , "rank": i , "id": ... , "reason": "..."}               ONE PER ITEM , AS EACH EXPLANATION COMPLETES
+#   {"type": "done"}
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+# RESULT FRAME -> LIST OF PLAIN DICTS , NO PER-ROW PYDANTIC VALIDATION (VALUES COME FROM OUR OWN CATALOG)
+#   ONE BULK CONVERSION PER COLUMN : ARROW COLUMNS THROUGH to_pylist , NUMPY COLUMNS THROUGH tolist
+#   DATES AS THEIR str() (SAME TEXT AS .astype(str)) , NaN / NaT / NULL -> None
+def records(results : pd.DataFrame):
+
+    columns = []
+    for col in results.columns:
+        values = results[col]
+
+        if isinstance(values.dtype, pd.ArrowDtype):
+            column = values.array.__arrow_array__().to_pylist()
+
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            column = [None if value is pd.NaT else str(value) for value in values]
+
+        else:
+            column = values.to_numpy().tolist()
+            if values.dtype.kind in "fO" and values.hasnans:
+                column = [None if missing else value for value, missing in zip(column, values.isna().tolist())]
+
+        columns.append(column)
+
+    names = list(results.columns)
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def _default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def encode_event(payload, stream_format = "ndjson"):
+
+    data = json.dumps(payload, ensure_ascii = False, separators = (",", ":"), default = _default)
+
+    if stream_format == "sse":
+        return f"event: {payload['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+def items_event(results : pd.DataFrame, unknown_ids = None):
+    return {"type": "items", "top_k": len(results), "results": records(results), "unknown_ids": unknown_ids or None}
+
+
+# WRAP AN (ASYNC) ITERATOR OF EVENT PAYLOADS , A "done" EVENT IS APPENDED
+def stream_events(events, stream_format = "ndjson"):
+
+    async def body():
+        if hasattr(events, "__aiter__"):
+            async for payload in events:
+                yield encode_event(payload, stream_format)
+        else:
+            for payload in events:
+                yield encode_event(payload, stream_format)
+
+        yield encode_event({"type": "done"}, stream_format)
+
+    # NO PROXY BUFFERING , OTHERWISE THE FIRST EVENT ARRIVES TOGETHER WITH THE LAST ONE
+    return StreamingResponse(body(), media_type = STREAM_FORMATS[stream_format],
+                             headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,301 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+from .catalog import ArticleCatalog
+
+
+# ================================ TOKENIZER ======================================
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")   # LETTERS AND DIGITS , "anak-anak" -> "anak" "anak"
+
+STOPWORDS = frozenset("""
+ada adalah agar akan akhirnya aku amat anda antara apa apabila apakah atau bagaimana bagi bahkan bahwa banyak baru
+beberapa begitu belum berbagai bisa boleh bukan cukup dalam dan dapat dari daripada demi dengan di dia dong hal hanya
+harus hingga ia ialah ini itu jadi jika juga kalau kami kamu karena ke kemudian kepada ketika kita lagi lain lalu lebih
+maka mana masih mereka meski namun nanti oleh pada para pernah pula saat saja sambil sampai sang sangat saya se sebagai
+sebelum sedang sehingga sejak selain sementara semua serta setelah sudah supaya tak tanpa telah tentang tersebut tetapi
+tidak untuk waktu yaitu yakni yang
+""".split())
+
+SUFFIXES = ("kan", "an")
+PREFIXES = ("memper", "diper", "meng", "meny", "peng", "peny", "mem", "men", "pem", "pen", "per", "ber", "ter", "di", "ke")
+RECODE = {"meny": "s", "peny": "s", "mem": "p", "pem": "p", "men": "t", "pen": "t"}   # NASAL PREFIX + VOWEL : THE ROOT LOST ITS CONSONANT
+MIN_STEM = 4           # NOTHING IS CUT BELOW 4 LETTERS
+MIN_PREFIXED_STEM = 5  # PREFIXES ARE CUT MORE CAREFULLY ("berita" , "menteri" , "menang" STAY WHOLE)
+
+
+# LIGHT INDONESIAN STEMMER (CONFIX RULES WITHOUT A ROOT DICTIONARY) : "-nya" , THEN "-kan" / "-an" , THEN ONE PREFIX
+#   NOT ALWAYS THE LINGUISTIC ROOT , BUT QUERIES AND ARTICLES GO THROUGH THE SAME RULES SO THEIR FORMS MEET
+#   ("pertandingan" , "bertanding" -> "tanding" ; "pemerintahan" -> "perintah" ; "kesehatan" -> "sehat" ; "menulis" -> "tulis")
+@lru_cache(maxsize = 500000)
+def stem(word : str) -> str:
+
+    if not word.isalpha():
+        return word
+
+    if word.endswith("nya") and len(word) - 3 >= MIN_STEM:
+        word = word[:-3]
+
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            word = word[:-len(suffix)]
+            break
+
+    for prefix in PREFIXES:
+        if word.startswith(prefix) and len(word) > len(prefix):
+            rest = word[len(prefix):]
+            rest = RECODE[prefix] + rest if prefix in RECODE and rest[0] in "aiueo" else rest
+            return rest if len(rest) >= MIN_PREFIXED_STEM else word
+
+    return word
+
+
+def tokenize(text) -> list:
+
+    if not isinstance(text, str) or not text:
+        return []
+
+    # "Café" -> "cafe" , FULL-WIDTH DIGITS -> ASCII
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    return [stem(word) for word in TOKEN_PATTERN.findall(text) if word not in STOPWORDS and len(word) > 1]
+
+
+# ================================ INDEX ======================================
+
+# GATHER THE CSR RANGES [starts , starts + lengths) AS ONE INDEX ARRAY , RETURNS (POSITIONS , OWNER OF EACH POSITION)
+def csr_gather(starts, lengths):
+
+    owners = np.repeat(np.arange(len(starts)), lengths)
+    firsts = np.cumsum(lengths) - lengths
+    return np.repeat(starts, lengths) + (np.arange(int(lengths.sum())) - np.repeat(firsts, lengths)), owners
+
+
+# ONE IMMUTABLE SEGMENT OVER THE CATALOG ROWS [first_row , first_row + n_docs)
+#   POSTINGS : term -> (rows , BM25 TF PART) SORTED BY TF PART DESCENDING (IMPACT ORDER , EARLY TERMINATION READS PREFIXES)
+#   FORWARD  : doc -> (terms , BM25 TF PART) FOR THE EXACT SCORE OF A FEW CANDIDATES
+#   THE IDF IS APPLIED AT QUERY TIME , SO A NEW SEGMENT NEVER RESCORES THE OLD ONES
+class TextSegment:
+
+    def __init__(self, first_row, n_docs, term_offsets, posting_rows, posting_parts, doc_offsets, doc_terms, doc_parts, doc_freq):
+        self.first_row = first_row
+        self.n_docs = n_docs
+        self.term_offsets = term_offsets     # int64 (vocabulary + 1)
+        self.posting_rows = posting_rows     # int32 CATALOG ROWS
+        self.posting_parts = posting_parts   # float16 (BM25 TF PARTS LIE IN [0 , k1 + 1])
+        self.doc_offsets = doc_offsets       # int64 (n_docs + 1)
+        self.doc_terms = doc_terms           # int32
+        self.doc_parts = doc_parts           # float16
+        self.doc_freq = doc_freq             # int64 PER TERM ID (VOCABULARY AT BUILD TIME)
+
+    @classmethod
+    def build(cls, first_row, titles, summaries, vocabulary : dict, avgdl = None, k1 = 1.2, b = 0.75, title_weight = 2.0):
+
+        # (DOC , TERM , WEIGHT) TRIPLES , TITLE TERMS COUNT title_weight TIMES
+        docs, terms, weights = [], [], []
+        for doc, (title, summary) in enumerate(zip(titles, summaries)):
+            for weight, tokens in ((title_weight, tokenize(title)), (1.0, tokenize(summary))):
+                for token in tokens:
+                    docs.append(doc)
+                    terms.append(vocabulary.setdefault(token, len(vocabulary)))
+                    weights.append(weight)
+
+        n_docs, n_terms = len(titles), len(vocabulary)
+        docs = np.asarray(docs, dtype = np.int64)
+        terms = np.asarray(terms, dtype = np.int64)
+
+        # TF PER (DOC , TERM) : KEYS SORTED DOC-MAJOR , WHICH IS ALREADY THE FORWARD INDEX ORDER
+        keys, inverse = np.unique(docs * n_terms + terms, return_inverse = True)
+        tf = np.bincount(inverse, weights = np.asarray(weights, dtype = np.float64), minlength = len(keys))
+        pair_docs, pair_terms = keys // max(n_terms, 1), keys % max(n_terms, 1)
+
+        doc_length = np.bincount(pair_docs, weights = tf, minlength = n_docs)
+        avgdl = avgdl or (float(doc_length.mean()) if doc_length.sum() > 0 else 1.0)
+        parts = (tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_length[pair_docs] / avgdl))).astype(np.float16)
+
+        doc_offsets = np.searchsorted(pair_docs, np.arange(n_docs + 1)).astype(np.int64)
+
+        order = np.lexsort((-parts, pair_terms))
+        term_offsets = np.searchsorted(pair_terms[order], np.arange(n_terms + 1)).astype(np.int64)
+
+        segment = cls(first_row, n_docs, term_offsets, (pair_docs[order] + first_row).astype(np.int32), parts[order],
+                      doc_offsets, pair_terms.astype(np.int32), parts, np.diff(term_offsets))
+        return segment, avgdl
+
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.term_offsets, self.posting_rows, self.posting_parts,
+                                              self.doc_offsets, self.doc_terms, self.doc_parts, self.doc_freq))
+
+    # EXACT SCORES OF CATALOG ROWS OF THIS SEGMENT (query_terms SORTED , weights ALIGNED)
+    def score_rows(self, rows, query_terms, weights):
+
+        local = np.asarray(rows, dtype = np.int64) - self.first_row
+        starts = self.doc_offsets[local]
+        positions, owners = csr_gather(starts, self.doc_offsets[local + 1] - starts)
+
+        terms = self.doc_terms[positions]
+        slot = np.minimum(np.searchsorted(query_terms, terms), len(query_terms) - 1)
+        hit = query_terms[slot] == terms
+
+        return np.bincount(owners[hit], weights = self.doc_parts[positions[hit]].astype(np.float64) * weights[slot[hit]], minlength = len(local))
+
+    # TOP-K ACTIVE ROWS WITH EARLY TERMINATION (THRESHOLD ALGORITHM OVER IMPACT-ORDERED PREFIXES)
+    #   READ A PREFIX OF EVERY LIST (DOUBLING) . PARTIAL SUMS ARE LOWER BOUNDS , AN UNSEEN DOC SCORES AT MOST
+    #   bound = SUM OF weight x NEXT PART OF EACH LIST . STOP AS SOON AS THE k-TH PARTIAL >= bound , THEN RESCORE EXACTLY
+    #   THE SEEN DOCS THAT COULD STILL REACH IT (partial + bound >= k-TH)
+    def top_k(self, query_terms, weights, k, active):
+
+        lists = [(self.term_offsets[term], self.term_offsets[term + 1], weight)
+                 for term, weight in zip(query_terms.tolist(), weights.tolist()) if term < len(self.term_offsets) - 1]
+        lists = [(start, end, weight) for start, end, weight in lists if end > start]
+        if not lists or k <= 0:
+            return np.zeros(0, dtype = np.int64), np.zeros(0)
+
+        depth = max(4 * k, 64)
+        while True:
+            seen_rows, seen_scores, bound = [], [], 0.0
+            for start, end, weight in lists:
+                stop = min(start + depth, end)
+                seen_rows.append(self.posting_rows[start:stop])
+                seen_scores.append(self.posting_parts[start:stop].astype(np.float64) * weight)
+                if stop < end:
+                    bound += weight * float(self.posting_parts[stop])
+
+            rows, inverse = np.unique(np.concatenate(seen_rows), return_inverse = True)
+            partial = np.bincount(inverse, weights = np.concatenate(seen_scores), minlength = len(rows))
+
+            alive = active[rows]
+            rows, partial = rows[alive].astype(np.int64), partial[alive]
+
+            if bound == 0.0:                                   # EVERY LIST READ : PARTIAL SUMS ARE EXACT
+                keep = np.argsort(-partial, kind = "stable")[:k]
+                return rows[keep], partial[keep]
+
+            if len(rows) >= k:
+                kth = np.partition(partial, len(partial) - k)[len(partial) - k]
+                if kth >= bound:
+                    break
+            depth *= 2
+
+        candidates = rows[partial + bound >= kth]
+        exact = self.score_rows(candidates, query_terms, weights)
+        keep = np.argsort(-exact, kind = "stable")[:k]
+        return candidates[keep], exact[keep]
+
+
+# BM25 INDEX OVER title + summary OF THE CATALOG : A BASE SEGMENT + ONE SMALL SEGMENT PER INGESTED BATCH
+# IMMUTABLE LIKE THE SNAPSHOT THAT HOLDS IT , extend() RETURNS A NEW INDEX (SEGMENTS ARE SHARED , NOT COPIED)
+class TextIndex:
+
+    def __init__(self, segments, vocabulary, avgdl, k1 = 1.2, b = 0.75, title_weight = 2.0, max_segments = 8):
+        self.segments = segments
+        self.vocabulary = vocabulary       # TERM -> ID , ONLY GROWS (IDS OF AN OLDER INDEX STAY VALID)
+        self.avgdl = avgdl                 # OF THE BASE SEGMENT , REUSED BY LATER SEGMENTS SO THEIR SCORES STAY COMPARABLE
+        self.k1, self.b, self.title_weight = k1, b, title_weight
+        self.max_segments = max_segments
+
+        self.n_docs = sum(segment.n_docs for segment in segments)
+        self.doc_freq = np.zeros(len(vocabulary), dtype = np.int64)
+        for segment in segments:
+            self.doc_freq[:len(segment.doc_freq)] += segment.doc_freq
+
+    @staticmethod
+    def _texts(catalog : ArticleCatalog, rows):
+        frame = catalog.df.iloc[rows]
+        return frame["title"].tolist(), (frame["summary"].tolist() if "summary" in frame else [""] * len(rows))
+
+    @classmethod
+    def build(cls, catalog : ArticleCatalog, k1 = 1.2, b = 0.75, title_weight = 2.0):
+
+        vocabulary = {}
+        segment, avgdl = TextSegment.build(0, *cls._texts(catalog, np.arange(len(catalog))), vocabulary, k1 = k1, b = b,
+                                           title_weight = title_weight)
+        return cls([segment], vocabulary, avgdl, k1, b, title_weight)
+
+    # INDEX FOR A CATALOG THAT GAINED `rows` (APPENDED AT THE END) , MORE THAN max_segments -> THE SMALL ONES ARE MERGED
+    def extend(self, catalog : ArticleCatalog, rows):
+
+        rows = np.asarray(rows, dtype = np.int64)
+        segments = list(self.segments)
+
+        if len(segments) >= self.max_segments:
+            merged = np.arange(segments[1].first_row, int(rows[0]))
+            segments = segments[:1] + ([self._segment(catalog, merged)] if len(merged) else [])
+
+        segments.append(self._segment(catalog, rows))
+        return TextIndex(segments, self.vocabulary, self.avgdl, self.k1, self.b, self.title_weight, self.max_segments)
+
+    def _segment(self, catalog, rows):
+        return TextSegment.build(int(rows[0]), *self._texts(catalog, rows), self.vocabulary, avgdl = self.avgdl, k1 = self.k1,
+                                 b = self.b, title_weight = self.title_weight)[0]
+
+    # SORTED QUERY TERM IDS AND THEIR WEIGHTS (IDF x COUNT IN THE QUERY) , UNKNOWN TERMS ARE DROPPED
+    def query_terms(self, query : str):
+
+        # (TERMS ADDED BY A NEWER INDEX ARE NOT IN THIS ONE)
+        ids = [term for term in (self.vocabulary.get(token, -1) for token in tokenize(query)) if 0 <= term < len(self.doc_freq)]
+        terms, counts = np.unique(np.asarray(ids, dtype = np.int64), return_counts = True)
+
+        doc_freq = self.doc_freq[terms]
+        idf = np.log(1.0 + (self.n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        return terms, idf * counts
+
+    # TOP-K (ROWS , BM25) OVER EVERY SEGMENT , RETRACTED ROWS SKIPPED
+    def search(self, query : str, catalog : ArticleCatalog, top_k = 10):
+
+        terms, weights = self.query_terms(query)
+        if len(terms) == 0:
+            return np.zeros(0, dtype = np.int64), np.zeros(0)
+
+        found = [segment.top_k(terms, weights, top_k, catalog.active) for segment in self.segments]
+        rows = np.concatenate([rows for rows, _ in found])
+        scores = np.concatenate([scores for _, scores in found])
+
+        keep = np.argsort(-scores, kind = "stable")[:top_k]
+        return rows[keep], scores[keep]
+
+    # EXACT BM25 OF ANY CATALOG ROWS (0 FOR ROWS WITHOUT A QUERY TERM)
+    def score_rows(self, query : str, rows):
+
+        terms, weights = self.query_terms(query)
+        rows = np.asarray(rows, dtype = np.int64)
+        scores = np.zeros(len(rows))
+        if len(terms) == 0:
+            return scores
+
+        for segment in self.segments:
+            inside = (rows >= segment.first_row) & (rows < segment.first_row + segment.n_docs)
+            if inside.any():
+                scores[inside] = segment.score_rows(rows[inside], terms, weights)
+        return scores
+
+    # HYBRID : THE BEST `seeds` LEXICAL HITS (BM25-WEIGHTED MEAN EMBEDDING) ARE THE QUERY OF A FAISS SEARCH ,
+    # CANDIDATES OF BOTH ARE SCORED alpha x BM25 / MAX BM25 + (1 - alpha) x COSINE TO THAT VECTOR
+    #   FINDS ARTICLES ABOUT THE SAME STORY THAT USE OTHER WORDS , THE LEXICAL MATCH STILL DOMINATES WITH alpha >= 0.5
+    def hybrid_search(self, query : str, catalog : ArticleCatalog, top_k = 10, alpha = 0.5, seeds = 5, pool = 50,
+                      nprobe = None, ef_search = None):
+
+        rows, scores = self.search(query, catalog, top_k = max(pool, top_k))
+        if len(rows) == 0:
+            return rows, scores
+
+        vector = (scores[:seeds] @ catalog.embeddings[rows[:seeds]].astype(np.float64)).astype(np.float32).reshape(1, -1)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+
+        _, found = catalog.search(vector, max(pool, top_k), nprobe = nprobe, ef_search = ef_search)
+        found = found[0][found[0] >= 0]
+        found = found[catalog.active[found]]
+
+        candidates = np.union1d(rows, found)
+        lexical = self.score_rows(query, candidates)
+        semantic = np.clip(catalog.embeddings[candidates] @ vector[0], 0.0, None)
+        blended = alpha * lexical / max(float(lexical.max()), 1e-12) + (1 - alpha) * semantic
+
+        keep = np.argsort(-blended, kind = "stable")[:top_k]
+        return candidates[keep], blended[keep]
+
+    def info(self):
+        return {"documents": self.n_docs, "terms": len(self.vocabulary), "segments": [segment.n_docs for segment in self.segments],
+                "bytes": sum(segment.nbytes() for segment in self.segments), "avgdl": self.avgdl}
@@ -0,0 +1,302 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from collections import deque
+
+import numpy as np
+
+from .feeds import mix64, top_k_positions
+
+
+# TIME-DECAYED COUNT-MIN SKETCH (depth x width FLOATS , FIXED MEMORY WHATEVER THE NUMBER OF ARTICLES)
+#   FORWARD DECAY : A VIEW AT TIME t ADDS exp(rate * (t - base)) , AN ESTIMATE IS THE MIN OVER THE ROWS TIMES exp(-rate * (now - base))
+#   SO NOTHING IS TOUCHED WHEN TIME PASSES , rebase() SCALES THE TABLE BACK BEFORE THE WEIGHTS GET TOO LARGE
+#   ESTIMATES NEVER UNDERCOUNT , THEY OVERCOUNT BY AT MOST ~e / width OF THE TOTAL DECAYED VIEWS
+class DecayedCountMinSketch:
+
+    def __init__(self, width : int = 2**16, depth : int = 4, half_life : float = 6 * 3600, seed : int = 0, now : float | None = None):
+        self.width = width
+        self.depth = depth
+        self.rate = math.log(2) / half_life
+        self.base = time.time() if now is None else now
+        self.table = np.zeros((depth, width), dtype = np.float64)
+
+        self.seeds = mix64(np.uint64(seed) + np.arange(1, depth + 1, dtype = np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+
+    # (depth , n) COLUMNS OF THE IDS
+    def _columns(self, article_ids):
+
+        keys = np.asarray(article_ids, dtype = np.int64).astype(np.uint64)
+        with np.errstate(over = "ignore"):
+            hashed = mix64(keys[None, :] ^ self.seeds[:, None])
+        return (hashed % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, article_ids, timestamps):
+
+        weights = np.exp(self.rate * (np.asarray(timestamps, dtype = np.float64) - self.base))
+        for row, columns in enumerate(self._columns(article_ids)):
+            np.add.at(self.table[row], columns, weights)
+
+    # ESTIMATES IN THE SKETCH'S OWN (FORWARD-DECAYED) UNITS : COMPARABLE WITH EACH OTHER WHATEVER WHEN THEY WERE READ
+    def scaled_estimate(self, article_ids):
+        return self.table[np.arange(self.depth)[:, None], self._columns(article_ids)].min(axis = 0)
+
+    # DECAYED VIEW COUNTS AT `now`
+    def estimate(self, article_ids, now : float | None = None):
+        return self.scaled_estimate(article_ids) * self.decay(now)
+
+    def decay(self, now : float | None = None):
+        return math.exp(-self.rate * ((time.time() if now is None else now) - self.base))
+
+    # MOVE `base` TO `now` , RETURNS THE FACTOR THAT SCALED THE TABLE (HOLDERS OF SCALED ESTIMATES APPLY IT TOO)
+    def rebase(self, now : float | None = None):
+
+        now = time.time() if now is None else now
+        factor = self.decay(now)
+        self.table *= factor
+        self.base = now
+        return factor
+
+    def nbytes(self):
+        return self.table.nbytes
+
+
+# ONE MATERIALIZED TRENDING LIST : ARTICLE IDS (NOT ROWS , SO IT STAYS VALID ACROSS SNAPSHOTS) AND DECAYED VIEWS , BEST FIRST
+class TrendingList:
+
+    def __init__(self, ids, views):
+        self.ids = np.asarray(ids, dtype = np.int64)
+        self.views = np.asarray(views, dtype = np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+EMPTY_LIST = TrendingList([], [])
+
+
+# SKETCH AND HEAVY-HITTER CANDIDATES IN AN SQLITE FILE SHARED BY EVERY WORKER (TRENDING_PATH)
+#   COUNT-MIN SKETCHES WITH THE SAME SHAPE AND SEEDS ADD UP , SO A WORKER'S FOLD ADDS ITS PENDING VIEWS TO THE SHARED TABLE IN
+#   ONE TRANSACTION AND READS BACK THE VIEWS OF ALL THE WORKERS : EVERY WORKER RANKS THE SAME COUNTS
+class SharedTrendingState:
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sketch (id INTEGER PRIMARY KEY CHECK (id = 0), base REAL NOT NULL, "
+                         "views INTEGER NOT NULL, counts BLOB NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS candidates (id INTEGER PRIMARY KEY)")
+
+    def _connect(self):
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout = 5.0, isolation_level = None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            self._local.conn = conn
+
+        return conn
+
+    # CLOSE THIS THREAD'S CONNECTION (REOPENED ON NEXT USE) , A PRELOADING PARENT CALLS IT BEFORE FORKING THE WORKERS
+    def close(self):
+
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ADD (ids , timestamps) TO THE SHARED SKETCH , LOAD IT INTO `sketch` , RETURNS ({CANDIDATE ID: SCALED ESTIMATE} , TOTAL VIEWS)
+    def fold(self, sketch : DecayedCountMinSketch, ids, timestamps, capacity : int):
+
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+
+            row = conn.execute("SELECT base, views, counts FROM sketch").fetchone()
+            views = 0
+            if row is not None:
+                sketch.base, views = row[0], row[1]
+                sketch.table = np.frombuffer(row[2], dtype = np.float64).reshape(sketch.depth, sketch.width).copy()
+
+            if len(ids):
+                if sketch.rate * (timestamps.max() - sketch.base) > 20:
+                    sketch.rebase(float(timestamps.max()))
+                sketch.add(ids, timestamps)
+                views += len(ids)
+
+                conn.execute("INSERT OR REPLACE INTO sketch VALUES (0, ?, ?, ?)", (sketch.base, views, sketch.table.tobytes()))
+                conn.executemany("INSERT OR IGNORE INTO candidates VALUES (?)", [(article_id,) for article_id in np.unique(ids).tolist()])
+
+            candidates = np.asarray([article_id for article_id, in conn.execute("SELECT id FROM candidates")], dtype = np.int64)
+            estimates = sketch.scaled_estimate(candidates) if len(candidates) else np.zeros(0)
+
+            # AMORTIZED PRUNE , AS IN THE IN-PROCESS TRACKER
+            if len(candidates) > 2 * capacity:
+                keep = top_k_positions(estimates, capacity)
+                dropped = np.setdiff1d(candidates, candidates[keep])
+                conn.executemany("DELETE FROM candidates WHERE id = ?", [(article_id,) for article_id in dropped.tolist()])
+                candidates, estimates = candidates[keep], estimates[keep]
+
+        return dict(zip(candidates.tolist(), estimates.tolist())), views
+
+
+# POPULARITY OF ARTICLES FROM THE VIEWS THIS WORKER SERVES (OR EVERY WORKER , WITH A SharedTrendingState)
+#   record() IS A deque.append (NO LOCK , NO HASHING) , THE BACKGROUND REFRESH FOLDS THE PENDING VIEWS INTO THE SKETCH ,
+#   KEEPS THE `capacity` HEAVIEST ARTICLES AS HEAVY-HITTER CANDIDATES AND MATERIALIZES THE TOP `top_n` PER CATEGORY
+#   ARTICLES WITHOUT ENOUGH VIEWS ARE PADDED WITH THE CONFIDENCE + FRESHNESS BASELINE (views = 0) SO A NEW WORKER SERVES A FULL FEED
+class TrendingTracker:
+
+    def __init__(self, sketch : DecayedCountMinSketch, capacity : int = 2000, top_n : int = 100, max_pending : int = 100000,
+                 shared : SharedTrendingState | None = None):
+        self.sketch = sketch
+        self.capacity = capacity
+        self.top_n = top_n
+        self.shared = shared
+
+        self._pending = deque(maxlen = max_pending)   # OLDEST VIEWS ARE DROPPED IF THE REFRESH FALLS THIS FAR BEHIND
+        self._candidates = {}                         # ARTICLE ID -> SCALED ESTIMATE
+        self._baseline = (None, None, None)           # (CATALOG , DAY , {CATEGORY: ROWS}) OF THE PADDING LISTS
+        self._lock = threading.Lock()
+
+        self.overall = EMPTY_LIST
+        self.by_category = {}
+        self.refreshed_at = None
+        self.views = 0
+
+    # COUNT VIEWS (CALLED ON THE REQUEST PATH)
+    def record(self, article_ids, now : float | None = None):
+        if len(article_ids):
+            self._pending.append((time.time() if now is None else now, list(article_ids)))
+
+    # PENDING VIEWS -> SKETCH + HEAVY-HITTER CANDIDATES
+    def _fold(self):
+
+        batches = []
+        while self._pending:
+            batches.append(self._pending.popleft())
+        if not batches and self.shared is None:
+            return 0
+
+        ids = np.fromiter((article_id for _, batch in batches for article_id in batch), dtype = np.int64)
+        timestamps = np.repeat(np.asarray([stamp for stamp, _ in batches], dtype = np.float64), [len(batch) for _, batch in batches])
+
+        # SHARED : THE OTHER WORKERS' VIEWS ARRIVE EVEN WHEN THIS ONE HAS NONE PENDING
+        if self.shared is not None:
+            self._candidates, self.views = self.shared.fold(self.sketch, ids, timestamps, self.capacity)
+            return len(ids)
+
+        # KEEP THE FORWARD-DECAY WEIGHTS SMALL (exp(20) ~ 5e8 , FLOAT64 STAYS EXACT ENOUGH)
+        if self.sketch.rate * (timestamps.max() - self.sketch.base) > 20:
+            factor = self.sketch.rebase(float(timestamps.max()))
+            self._candidates = {article_id: estimate * factor for article_id, estimate in self._candidates.items()}
+
+        self.sketch.add(ids, timestamps)
+
+        unique = np.unique(ids)
+        self._candidates.update(zip(unique.tolist(), self.sketch.scaled_estimate(unique).tolist()))
+
+        # AMORTIZED PRUNE : GROW TO 2 x capacity , THEN KEEP THE capacity HEAVIEST
+        if len(self._candidates) > 2 * self.capacity:
+            keys = np.fromiter(self._candidates, dtype = np.int64, count = len(self._candidates))
+            values = np.fromiter(self._candidates.values(), dtype = np.float64, count = len(self._candidates))
+            keep = top_k_positions(values, self.capacity)
+            self._candidates = dict(zip(keys[keep].tolist(), values[keep].tolist()))
+
+        self.views += len(ids)
+        return len(ids)
+
+    # TOP top_n ROWS PER CATEGORY BY THE OLD trending_feed SCORE (0.7 CONFIDENCE + 0.3 FRESHNESS) , ONCE PER CATALOG AND DAY
+    def _padding(self, snapshot, now):
+
+        catalog, feeds = snapshot.catalog, snapshot.feeds
+        day = int(now // 86400)
+        if self._baseline[0] is catalog and self._baseline[1] == day:
+            return self._baseline[2]
+
+        score = 0.7 * np.nan_to_num(feeds.confidence) + 0.3 * np.exp(-0.002 * np.maximum(catalog.age_days(), 0))
+        score = np.nan_to_num(score, nan = -np.inf)
+
+        padding = {None: feeds.all_rows[top_k_positions(score[feeds.all_rows], self.top_n)]}
+        for category, rows in feeds.by_category.items():
+            padding[category] = rows[top_k_positions(score[rows], self.top_n)]
+
+        self._baseline = (catalog, day, padding)
+        return padding
+
+    # FOLD + MATERIALIZE AGAINST THE SNAPSHOT (BACKGROUND THREAD , OR DIRECTLY IN TESTS / BENCHMARKS)
+    def refresh(self, snapshot, now : float | None = None):
+
+        now = time.time() if now is None else now
+        catalog = snapshot.catalog
+
+        with self._lock:
+            self._fold()
+
+            ids = np.fromiter(self._candidates, dtype = np.int64, count = len(self._candidates))
+            views = self.sketch.estimate(ids, now) if len(ids) else np.zeros(0)
+
+            # UNKNOWN / RETRACTED IDS NEVER TREND
+            rows = catalog.lookup(ids)
+            known = rows >= 0
+            rows, views = rows[known], views[known]
+
+            order = np.argsort(-views, kind = "stable")
+            rows, views = rows[order], views[order]
+            categories = catalog.df["category"].iloc[rows].astype("string").str.lower().to_numpy(dtype = object, na_value = None)
+
+            padding = self._padding(snapshot, now)
+
+            def ranked(selected, padding_rows):
+                trending_ids = catalog.ids[rows[selected]][:self.top_n]
+                filler = catalog.ids[padding_rows]
+                filler = filler[~np.isin(filler, trending_ids)][:self.top_n - len(trending_ids)]
+                return TrendingList(np.concatenate([trending_ids, filler]),
+                                    np.concatenate([views[selected][:self.top_n], np.zeros(len(filler))]))
+
+            self.overall = ranked(np.ones(len(rows), dtype = bool), padding[None])
+            self.by_category = {category: ranked(categories == category, category_rows)
+                                for category, category_rows in padding.items() if category is not None}
+            self.refreshed_at = now
+
+    # MATERIALIZED LIST OF A CATEGORY (OR OF EVERYTHING) , THE REQUEST ONLY SLICES IT
+    def feed(self, category : str | None = None, top_k : int = 10):
+
+        ranked = self.overall if category is None else self.by_category.get(category.lower(), EMPTY_LIST)
+        return ranked.ids[:top_k], ranked.views[:top_k]
+
+    # REFRESH EVERY `interval` SECONDS AGAINST THE STORE'S CURRENT SNAPSHOT
+    def start(self, store, interval : float = 30):
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh(store.current)
+                except Exception:
+                    traceback.print_exc()
+
+        thread = threading.Thread(target = loop, name = "trending-refresher", daemon = True)
+        thread.start()
+        return thread
+
+    def info(self):
+        return {"views": self.views, "pending": len(self._pending), "candidates": len(self._candidates),
+                "categories": len(self.by_category), "top_n": self.top_n, "sketch_bytes": self.sketch.nbytes(),
+                "half_life_hours": math.log(2) / self.sketch.rate / 3600, "refreshed_at": self.refreshed_at,
+                "shared": None if self.shared is None else self.shared.path}
+
+
+# TRENDING_PATH SET -> COUNTS SHARED BY THE WORKERS THROUGH AN SQLITE FILE , PER WORKER OTHERWISE
+def trending_from_env():
+
+    sketch = DecayedCountMinSketch(width = int(os.getenv("TRENDING_SKETCH_WIDTH", 2**16)),
+                                   half_life = float(os.getenv("TRENDING_HALF_LIFE_HOURS", 6)) * 3600)
+    path = os.getenv("TRENDING_PATH")
+
+    return TrendingTracker(sketch, capacity = int(os.getenv("TRENDING_CANDIDATES", 2000)), top_n = int(os.getenv("TRENDING_TOP_N", 100)),
+                           shared = SharedTrendingState(path) if path else None)
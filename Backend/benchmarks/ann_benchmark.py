@@ -0,0 +1,109 @@
+# ANN INDEX BENCHMARK : RECALL@K AGAINST THE EXACT FLAT INDEX , QUERY LATENCY (P50 / P99) AND INDEX MEMORY
+# COMPRESSED KINDS (sq_fp16 , sq_int8 , pq , ivf_pq) ARE ALSO MEASURED WITH EXACT RESCORING OF THE TOP --rescore HITS
+#
+#   python -m benchmarks.ann_benchmark --source ../news_embeddings.faiss
+#   python -m benchmarks.ann_benchmark --synthetic 200000 --dim 384
+#   python -m benchmarks.ann_benchmark --kinds flat sq_fp16 sq_int8 pq --rescore 100 200
+import argparse
+import itertools
+import time
+
+import faiss
+import numpy as np
+
+from app import ann_index
+from benchmarks.synthetic import synthetic_embeddings
+
+
+# SESSION-LIKE QUERIES : NORMALIZED MEAN OF A FEW RANDOM ARTICLES
+def session_queries(embeddings, n_queries, history = 5, seed = 1):
+
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(embeddings), (n_queries, history))
+    queries = embeddings[rows].mean(axis = 1).astype(np.float32)
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def recall_at_k(found, truth):
+    hits = [len(np.intersect1d(f[f >= 0], t)) for f, t in zip(found, truth)]
+    return float(np.mean(hits)) / truth.shape[1]
+
+
+# SEARCH , THEN OPTIONALLY RESCORE THE TOP `rescore` HITS WITH THE EXACT VECTORS (WHAT ArticleCatalog.search DOES)
+def search(index, embeddings, queries, k, rescore = 0, **params):
+
+    scores, found = ann_index.search(index, queries, max(k, rescore), **params)
+    return ann_index.rescore(embeddings, queries, found, k) if rescore else (scores[:, :k], found[:, :k])
+
+
+# ONE QUERY AT A TIME (WHAT /feed/personalization DOES)
+def latency_ms(index, embeddings, queries, k, rescore = 0, **params):
+
+    timings = []
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        search(index, embeddings, queries[i:i + 1], k, rescore, **params)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Benchmark ANN index variants against exact search")
+    parser.add_argument("--source", help = "flat FAISS index with the real embeddings")
+    parser.add_argument("--synthetic", type = int, default = 100000, help = "number of synthetic articles when --source is not given")
+    parser.add_argument("--dim", type = int, default = 384)
+    parser.add_argument("--queries", type = int, default = 500)
+    parser.add_argument("--k", type = int, default = 100)
+    parser.add_argument("--kinds", nargs = "+", default = list(ann_index.INDEX_KINDS), choices = ann_index.INDEX_KINDS)
+    parser.add_argument("--nprobe", type = int, nargs = "+", default = [4, 16, 64])
+    parser.add_argument("--ef-search", type = int, nargs = "+", default = [64, 128, 256])
+    parser.add_argument("--rescore", type = int, nargs = "+", default = [100], help = "exact rescoring depths for compressed kinds")
+    parser.add_argument("--threads", type = int, default = 1, help = "FAISS OpenMP threads")
+    args = parser.parse_args(argv)
+
+    faiss.omp_set_num_threads(args.threads)
+
+    if args.source:
+        source = faiss.read_index(args.source)
+        embeddings = source.reconstruct_n(0, source.ntotal)
+    else:
+        embeddings = synthetic_embeddings(args.synthetic, args.dim)
+
+    queries = session_queries(embeddings, args.queries)
+    print(f"{len(embeddings)} vectors , dim {embeddings.shape[1]} , {len(queries)} queries , k={args.k}")
+
+    # GROUND TRUTH FROM THE EXACT INDEX
+    flat = ann_index.build_index(embeddings, "flat")
+    _, truth = flat.search(queries, args.k)
+
+    print(f"{'kind':<10}{'param':<16}{'rescore':>8}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}{'memory MiB':>12}{'B/vector':>10}{'build s':>10}")
+
+    for kind in args.kinds:
+
+        start = time.perf_counter()
+        index = flat if kind == "flat" else ann_index.build_index(embeddings, kind)
+        build_seconds = time.perf_counter() - start
+        memory = ann_index.index_memory_bytes(index)
+        rescores = [0] + (args.rescore if kind in ann_index.LOSSY_KINDS else [])
+
+        if kind in ("ivf_flat", "ivf_pq"):
+            sweep = [("nprobe", value) for value in args.nprobe]
+        elif kind == "hnsw":
+            sweep = [("ef_search", value) for value in args.ef_search]
+        else:
+            sweep = [(None, None)]
+
+        for (name, value), rescore in itertools.product(sweep, rescores):
+            params = {name: value} if name else {}
+            _, found = search(index, embeddings, queries, args.k, rescore, **params)
+            p50, p99 = latency_ms(index, embeddings, queries, args.k, rescore, **params)
+            label = f"{name}={value}" if name else "-"
+            print(f"{kind:<10}{label:<16}{rescore or '-':>8}{recall_at_k(found, truth):>10.3f}{p50:>10.3f}{p99:>10.3f}"
+                  f"{memory / 2**20:>12.1f}{memory / len(embeddings):>10.1f}{build_seconds:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# EXPLANATION LATENCY (OFFLINE , FAKE LLM BACKEND) : SERIAL CALLS (OLD get_reason) VS CONCURRENT FAN-OUT VS ONE BATCHED PROMPT
+#
+#   python -m benchmarks.llm_benchmark --latency 0.5 --top-k 10 --concurrency 4
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from app import llm
+from app import recommender
+from benchmarks.synthetic import synthetic_catalog, synthetic_histories
+
+
+# OLD PATH : ONE BLOCKING CALL PER ROW , USER CONTEXT REBUILT EVERY TIME
+async def serial(client, catalog, history, recommendation):
+
+    reasons = []
+    for _, row in recommendation.iterrows():
+        prompt = llm.build_explanation_prompt(llm.build_user_context(history, catalog), llm.build_candidate_context(row))
+        reasons.append(await client.generate(prompt))
+
+    return reasons
+
+
+async def run(mode, args, catalog, requests):
+
+    client = llm.FakeClient(latency = args.latency)
+    service = llm.ExplanationService(client, concurrency = args.concurrency, timeout = args.latency * 10, batched = mode == "batched")
+
+    timings, missing = [], 0
+    for history, recommendation in requests:
+        start = time.perf_counter()
+        if mode == "serial":
+            reasons = await serial(client, catalog, history, recommendation)
+        else:
+            reasons = await service.explain(history, recommendation, catalog)
+        timings.append((time.perf_counter() - start) * 1000)
+        missing += sum(reason is None for reason in reasons)
+
+    return np.asarray(timings), client, missing
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Benchmark /recommendation/reason explanation generation with a fake LLM")
+    parser.add_argument("--articles", type = int, default = 20000)
+    parser.add_argument("--requests", type = int, default = 5)
+    parser.add_argument("--top-k", type = int, default = 10)
+    parser.add_argument("--latency", type = float, default = 0.5, help = "seconds per fake LLM call")
+    parser.add_argument("--concurrency", type = int, default = 4)
+    args = parser.parse_args(argv)
+
+    catalog = synthetic_catalog(args.articles, 64)
+    histories = synthetic_histories(catalog, args.requests, max_len = 20)
+    requests = [(history, recommender.news_recommender(history, catalog, top_k = args.top_k)) for history in histories]
+
+    print(f"{args.requests} requests x {args.top_k} candidates , fake latency {args.latency * 1000:.0f} ms , concurrency {args.concurrency}")
+    print(f"{'mode':<12}{'p50 ms':>10}{'max ms':>10}{'calls':>8}{'peak':>6}{'missing':>9}")
+    for mode in ("serial", "concurrent", "batched"):
+        timings, client, missing = asyncio.run(run(mode, args, catalog, requests))
+        print(f"{mode:<12}{np.percentile(timings, 50):>10.1f}{timings.max():>10.1f}{client.calls:>8}{client.peak_in_flight:>6}{missing:>9}")
+
+
+if __name__ == "__main__":
+    main()
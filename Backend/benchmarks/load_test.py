@@ -0,0 +1,147 @@
+# LOAD TEST AGAINST A LOCAL UVICORN INSTANCE : THROUGHPUT AND TAIL LATENCY OF /feed/personalization
+#
+#   python -m benchmarks.load_test --concurrency 1 8 32 --duration 20
+#   python -m benchmarks.load_test --compare-batching --faiss-threads 1
+#   python -m benchmarks.load_test --url http://127.0.0.1:7860      (EXISTING SERVER , NOTHING IS SPAWNED)
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def request_json(url, payload = None, timeout = 30):
+
+    data = None if payload is None else json.dumps(payload).encode()
+    request = urllib.request.Request(url, data = data, headers = {"Content-Type": "application/json"})
+
+    with urllib.request.urlopen(request, timeout = timeout) as response:
+        return json.loads(response.read())
+
+
+def wait_until_up(url, timeout = 600):
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            request_json(url + "/health/ready", timeout = 2)
+            return
+        except Exception:
+            time.sleep(0.5)
+
+    raise TimeoutError(f"server at {url} did not come up in {timeout}s")
+
+
+# START `uvicorn <app>` (OR THE PRE-FORKING `python -m app.serve <app>`) WITH EXTRA ENVIRONMENT VARIABLES
+def spawn_server(app, port, workers, env, preload = False):
+
+    launcher = ["app.serve"] if preload else ["uvicorn"]
+    command = [sys.executable, "-m", *launcher, app, "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(command, env = {**os.environ, **env})
+
+
+# `concurrency` CLIENTS SEND RANDOM HISTORIES AS FAST AS THEY CAN FOR `duration` SECONDS
+def run_level(url, article_ids, concurrency, duration, history_len, top_k):
+
+    deadline = time.time() + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        latencies, errors = [], 0
+
+        while time.time() < deadline:
+            payload = {"article_ids": rng.sample(article_ids, history_len), "top_k": top_k}
+            start = time.perf_counter()
+            try:
+                request_json(url + "/feed/personalization", payload)
+                latencies.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                errors += 1
+
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = concurrency) as pool:
+        outputs = list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.concatenate([np.asarray(latency) for latency, _ in outputs]) if outputs else np.empty(0)
+    errors = sum(error for _, error in outputs)
+
+    return {"concurrency": concurrency,
+            "requests": int(len(latencies)),
+            "errors": errors,
+            "throughput": len(latencies) / elapsed,
+            "p50": float(np.percentile(latencies, 50)) if len(latencies) else float("nan"),
+            "p95": float(np.percentile(latencies, 95)) if len(latencies) else float("nan"),
+            "p99": float(np.percentile(latencies, 99)) if len(latencies) else float("nan")}
+
+
+def run_scenario(name, url, args):
+
+    # VALID IDS FROM THE SERVER ITSELF
+    latest = request_json(url + f"/feed/latest?top_k={args.id_pool}")
+    article_ids = [item["id"] for item in latest["results"]]
+
+    print(f"\n[{name}] {len(article_ids)} candidate ids , history length {args.history_len}")
+    print(f"{'clients':>8}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+
+    for concurrency in args.concurrency:
+        row = run_level(url, article_ids, concurrency, args.duration, args.history_len, args.top_k)
+        print(f"{row['concurrency']:>8}{row['requests']:>10}{row['errors']:>8}{row['throughput']:>10.1f}"
+              f"{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}")
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Concurrent load test of the personalization endpoint")
+    parser.add_argument("--url", help = "test an already running server instead of spawning one")
+    parser.add_argument("--app", default = "app.main_HF:app")
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--workers", type = int, default = 1)
+    parser.add_argument("--faiss-threads", type = int, default = None)
+    parser.add_argument("--preload", action = "store_true", help = "start the workers with `python -m app.serve` (load once , fork)")
+    parser.add_argument("--concurrency", type = int, nargs = "+", default = [1, 8, 32])
+    parser.add_argument("--duration", type = float, default = 15)
+    parser.add_argument("--history-len", type = int, default = 20)
+    parser.add_argument("--id-pool", type = int, default = 2000)
+    parser.add_argument("--top-k", type = int, default = 10)
+    parser.add_argument("--compare-batching", action = "store_true", help = "run once without and once with SEARCH_BATCHING")
+    parser.add_argument("--batch-window-ms", type = float, default = 2.0)
+    parser.add_argument("--batch-max", type = int, default = 64)
+    args = parser.parse_args(argv)
+
+    if args.url:
+        run_scenario(args.url, args.url.rstrip("/"), args)
+        return
+
+    scenarios = [("batching off", {"SEARCH_BATCHING": "0"})]
+    if args.compare_batching:
+        scenarios.append(("batching on", {"SEARCH_BATCHING": "1",
+                                          "SEARCH_BATCH_WINDOW_MS": str(args.batch_window_ms),
+                                          "SEARCH_BATCH_MAX": str(args.batch_max)}))
+
+    for name, env in scenarios:
+        env = {**env, "WEB_CONCURRENCY": str(args.workers)}
+        if args.faiss_threads is not None:
+            env["FAISS_THREADS"] = str(args.faiss_threads)
+
+        url = f"http://127.0.0.1:{args.port}"
+        server = spawn_server(args.app, args.port, args.workers, env, preload = args.preload)
+        try:
+            wait_until_up(url)
+            run_scenario(f"{name} , {args.workers} worker(s) , FAISS_THREADS={env.get('FAISS_THREADS', 'auto')}", url, args)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
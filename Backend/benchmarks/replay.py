@@ -0,0 +1,402 @@
+# OFFLINE REPLAY BENCHMARK : RANKING QUALITY VS LATENCY OF EVERY FEED
+#   A CATALOG (SYNTHETIC , 10K - 5M ARTICLES , OR AN EXPORTED CATALOG_DIR) AND A STREAM OF READING HISTORIES
+#   (SYNTHETIC TOPICAL READERS OR A RECORDED .jsonl) ARE REPLAYED THROUGH EVERY FEED FUNCTION , OR AN HTTP ENDPOINT
+#   THE LAST ARTICLE OF EACH HISTORY IS HELD OUT , THE REST IS THE REQUEST
+#
+#   python -m benchmarks.replay --articles 100000 --users 500 --out base.json
+#   python -m benchmarks.replay --articles 1000000 --dim 128 --index-kind hnsw --lambda-div 0.5 --out hnsw.json
+#   python -m benchmarks.replay --catalog-dir ../catalog --histories histories.jsonl --feeds personalization neighbors
+#   python -m benchmarks.replay --catalog-dir ../catalog --histories histories.jsonl --url http://127.0.0.1:7860
+#   python -m benchmarks.replay --compare base.json hnsw.json          (EXIT CODE 1 ON A REGRESSION)
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+from app import ann_index
+from app import recommender
+from app import storage
+from app.catalog import UnknownArticleError
+from app.feeds import FeedPools
+from app.interests import INTEREST_POOL_SIZE, MAX_INTERESTS, interest_candidate_pool, retrieve_interest_candidates
+from app.neighbors import NeighborGraph, neighbor_candidate_pool
+from benchmarks.synthetic import synthetic_catalog, topical_histories
+
+
+FEEDS = ("personalization", "batch", "neighbors", "interests", "home", "latest", "category", "source", "random")
+DEFAULT_FEEDS = ("personalization", "batch", "home", "latest", "category", "random")
+
+# METRICS WHERE HIGHER IS BETTER / LOWER IS BETTER (FOR --compare)
+QUALITY_METRICS = ("hit_rate", "candidate_recall", "interest_candidate_recall", "ann_recall", "intra_list_diversity", "source_diversity", "category_coverage")
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+# [1, 2, 3] OR {"article_ids": [1, 2, 3]} PER LINE , OLDEST READ FIRST
+def load_histories(path):
+
+    histories = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                histories.append(record["article_ids"] if isinstance(record, dict) else record)
+
+    return histories
+
+
+# (REQUEST HISTORY , HELD-OUT NEXT READ OR NONE)
+def split_holdout(histories):
+    return [(history[:-1], history[-1]) if len(history) >= 2 else (history, None) for history in histories]
+
+
+def peak_rss_mib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2**20 if platform.system() == "Darwin" else 2**10)
+
+
+def latency_summary(timings_ms, wall_seconds, requests):
+
+    timings_ms = np.asarray(timings_ms)
+    if len(timings_ms) == 0:
+        return {"requests": 0}
+
+    return {"requests": int(requests), "throughput_per_sec": requests / max(wall_seconds, 1e-9),
+            "p50_ms": float(np.percentile(timings_ms, 50)), "p95_ms": float(np.percentile(timings_ms, 95)),
+            "p99_ms": float(np.percentile(timings_ms, 99)), "mean_ms": float(timings_ms.mean())}
+
+
+# QUALITY OF ONE RESULT LIST (CATALOG ROWS)
+def list_quality(catalog, rows, target_row):
+
+    rows = rows[rows >= 0]
+    if len(rows) == 0:
+        return None
+
+    unit = catalog.embeddings[rows]
+    unit = unit / np.maximum(np.linalg.norm(unit, axis = 1, keepdims = True), 1e-12)
+    pairs = unit @ unit.T
+    n = len(rows)
+
+    return {"hit_rate": None if target_row is None else float(target_row in rows),
+            "intra_list_diversity": float(1.0 - (pairs.sum() - n) / (n * (n - 1))) if n > 1 else 0.0,
+            "source_diversity": len(np.unique(catalog.source_codes[rows])) / n,
+            "category_coverage": catalog.df["category"].iloc[rows].nunique() / n,
+            "mean_age_days": float(np.nanmean(catalog.age_days(rows))),
+            "fresh_7d_share": float(np.mean(catalog.age_days(rows) < 7)),
+            "results": n}
+
+
+def mean_quality(qualities):
+
+    qualities = [quality for quality in qualities if quality is not None]
+    if not qualities:
+        return {}
+
+    summary = {}
+    for name in qualities[0]:
+        values = [quality[name] for quality in qualities if quality[name] is not None]
+        if values:
+            summary[name] = float(np.mean(values))
+    return summary
+
+
+# TIME `function(i)` FOR EVERY REQUEST , function RETURNS THE RESULT ROWS
+def replay(function, requests, catalog):
+
+    timings, qualities, errors = [], [], 0
+    wall = time.perf_counter()
+
+    for i, (history, target) in enumerate(requests):
+        start = time.perf_counter()
+        try:
+            rows = function(i, history)
+        except UnknownArticleError:
+            errors += 1
+            continue
+        timings.append((time.perf_counter() - start) * 1000)
+
+        target_row = None if target is None else catalog.row_of(target)
+        qualities.append(list_quality(catalog, np.asarray(rows, dtype = np.int64), target_row))
+
+    return {**latency_summary(timings, time.perf_counter() - wall, len(timings)), **mean_quality(qualities), "errors": errors}
+
+
+# FRACTION OF THE EXACT TOP pool_size (SAME USER VECTOR , SAME EXCLUSIONS) THAT THE INDEX RETURNED
+def ann_recall(catalog, requests, pool_size, decay_lambda, users, search):
+
+    recalls = []
+    for history, _ in requests[:users]:
+        try:
+            found, _ = recommender.retrieve_candidates(history, catalog, top_k = pool_size, decay_lambda = decay_lambda, **search)
+        except UnknownArticleError:
+            continue
+
+        query = recommender.session_embedding(history, catalog, decay_lambda = decay_lambda)[0]
+        sims = np.asarray(catalog.embeddings @ query, dtype = np.float32)
+        sims[~catalog.active] = -np.inf
+        sims[catalog.rows_for(history)[0]] = -np.inf
+
+        exact = np.argpartition(-sims, pool_size - 1)[:pool_size]
+        recalls.append(len(np.intersect1d(found, exact)) / pool_size)
+
+    return float(np.mean(recalls)) if recalls else None
+
+
+# FRACTION OF HELD-OUT NEXT READS THAT MADE THE CANDIDATE POOL (CEILING OF THE RERANKER'S HIT RATE)
+#   retrieve(history) -> CANDIDATE ROWS
+def candidate_recall(catalog, requests, retrieve):
+
+    hits = []
+    for history, target in requests:
+        if target is None:
+            continue
+        try:
+            rows = retrieve(history)
+        except UnknownArticleError:
+            continue
+        hits.append(catalog.row_of(target) in rows)
+
+    return float(np.mean(hits)) if hits else None
+
+
+def feed_functions(catalog, feeds, args):
+
+    params = {"temperature": args.temperature, "lambda_div": args.lambda_div, "max_source": args.max_source}
+    categories = sorted(feeds.by_category)
+    sources = sorted(feeds.by_source)
+
+    def rows_of(results):
+        return catalog.lookup(results["id"].to_numpy())
+
+    def personalization(i, history):
+        pool = recommender.candidate_pool(tuple(sorted(history)), catalog, pool_size = args.pool_size, decay_lambda = args.decay_lambda,
+                                          nprobe = args.nprobe, ef_search = args.ef_search)
+        return rows_of(recommender.recommend_from_pool(pool, catalog, top_k = args.top_k, **params))
+
+    def home(i, history):
+        return feeds.frame(feeds.home_feed(f"user-{i}", top_k = args.top_k)).pipe(rows_of)
+
+    def latest(i, history):
+        return feeds.frame(feeds.latest(args.top_k)).pipe(rows_of)
+
+    def category(i, history):
+        return feeds.frame(feeds.category_feed(categories[i % len(categories)], f"user-{i}", args.top_k)).pipe(rows_of)
+
+    def source(i, history):
+        return feeds.frame(feeds.source_feed(sources[i % len(sources)], f"user-{i}", args.top_k)).pipe(rows_of)
+
+    def random(i, history):
+        return feeds.frame(feeds.random_page(i, 0, args.top_k)).pipe(rows_of)
+
+    functions = {"personalization": personalization, "home": home, "latest": latest, "category": category,
+                 "source": source, "random": random}
+
+    if "neighbors" in args.feeds:
+        start = time.perf_counter()
+        graph = NeighborGraph.build(catalog, k = args.neighbor_k)
+        print(f"neighbor graph (k={args.neighbor_k}) built in {time.perf_counter() - start:.1f}s", file = sys.stderr)
+
+        def neighbors(i, history):
+            pool = neighbor_candidate_pool(tuple(sorted(history)), catalog, graph, pool_size = args.pool_size, decay_lambda = args.decay_lambda)
+            return rows_of(recommender.recommend_from_pool(pool, catalog, top_k = args.top_k, **params))
+
+        functions["neighbors"] = neighbors
+
+    def interests(i, history):
+        pool = interest_candidate_pool(tuple(sorted(history)), catalog, pool_size = args.interest_pool_size, max_interests = args.max_interests,
+                                       decay_lambda = args.decay_lambda, nprobe = args.nprobe, ef_search = args.ef_search)
+        return rows_of(recommender.recommend_from_pool(pool, catalog, top_k = args.top_k, **params))
+
+    functions["interests"] = interests
+
+    return functions
+
+
+# news_recommender_batch IN CHUNKS OF --batch-size USERS (LATENCY PER CHUNK , THROUGHPUT IN USERS / S)
+def replay_batch(catalog, requests, args):
+
+    params = {"temperature": args.temperature, "lambda_div": args.lambda_div, "max_source": args.max_source}
+    timings, qualities = [], []
+    wall = time.perf_counter()
+
+    for start in range(0, len(requests), args.batch_size):
+        chunk = requests[start:start + args.batch_size]
+
+        begin = time.perf_counter()
+        outputs = recommender.news_recommender_batch([tuple(sorted(history)) for history, _ in chunk], catalog, top_k = args.top_k,
+                                                     nprobe = args.nprobe, ef_search = args.ef_search, pool_size = args.pool_size, **params)
+        timings.append((time.perf_counter() - begin) * 1000)
+
+        for (history, target), (results, _) in zip(chunk, outputs):
+            if results is not None:
+                target_row = None if target is None else catalog.row_of(target)
+                qualities.append(list_quality(catalog, catalog.lookup(results["id"].to_numpy()), target_row))
+
+    summary = {**latency_summary(timings, time.perf_counter() - wall, len(timings)), **mean_quality(qualities)}
+    summary["throughput_per_sec"] = len(requests) / max(time.perf_counter() - wall, 1e-9)   # USERS / S
+    return summary
+
+
+# REPLAY AGAINST A RUNNING SERVER (SAME CATALOG EXPECTED FOR THE QUALITY METRICS) , STAGES FROM Server-Timing
+def replay_endpoint(catalog, requests, args):
+
+    timings, qualities, stages, errors = [], [], {}, 0
+    wall = time.perf_counter()
+
+    for history, target in requests:
+        payload = json.dumps({"article_ids": list(history), "top_k": args.top_k}).encode()
+        request = urllib.request.Request(args.url.rstrip("/") + "/feed/personalization", data = payload,
+                                         headers = {"Content-Type": "application/json", "X-Profile": "1"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout = 30) as response:
+                body, timing = json.loads(response.read()), response.headers.get("Server-Timing", "")
+        except Exception:
+            errors += 1
+            continue
+        timings.append((time.perf_counter() - start) * 1000)
+
+        for entry in filter(None, (part.strip() for part in timing.split(","))):
+            name, _, rest = entry.partition(";dur=")
+            stages.setdefault(name, []).append(float(rest.split(";")[0]))
+
+        rows = catalog.lookup([item["id"] for item in body.get("results", [])])
+        target_row = None if target is None else catalog.row_of(target)
+        qualities.append(list_quality(catalog, rows, target_row))
+
+    return {**latency_summary(timings, time.perf_counter() - wall, len(timings)), **mean_quality(qualities), "errors": errors,
+            "stages_mean_ms": {name: float(np.mean(values)) for name, values in stages.items()}}
+
+
+def print_report(report):
+
+    columns = ("requests", "throughput_per_sec", "p50_ms", "p95_ms", "p99_ms", "hit_rate", "intra_list_diversity",
+               "source_diversity", "category_coverage", "mean_age_days", "peak_rss_mib")
+    print(f"{'feed':<18}" + "".join(f"{column[:12]:>13}" for column in columns))
+
+    for name, result in report["feeds"].items():
+        cells = [result.get(column) for column in columns]
+        print(f"{name:<18}" + "".join(f"{'-':>13}" if cell is None else f"{cell:>13.4g}" for cell in cells))
+
+    for name, size in (("ann_recall", "pool_size"), ("candidate_recall", "pool_size"), ("interest_candidate_recall", "interest_pool_size")):
+        if report.get(name) is not None:
+            print(f"{name} @ {report['config'][size]} : {report[name]:.4f}")
+
+
+# COMPARE TWO REPORTS : LATENCY UP BY MORE THAN latency_tolerance (RELATIVE) AND latency_floor_ms (ABSOLUTE , SUB-MS JITTER
+# IS NOT A REGRESSION) , OR QUALITY DOWN BY MORE THAN quality_tolerance (ABSOLUTE) IS A REGRESSION
+def compare(base, new, latency_tolerance = 0.10, quality_tolerance = 0.02, latency_floor_ms = 0.5):
+
+    regressions = []
+    print(f"{'feed':<18}{'metric':<24}{'base':>12}{'new':>12}{'change':>10}")
+
+    rows = [(None, name) for name in ("ann_recall", "candidate_recall", "interest_candidate_recall")]
+    rows += [(feed, metric) for feed in base["feeds"] if feed in new["feeds"] for metric in LATENCY_METRICS + QUALITY_METRICS + ("mean_age_days",)]
+
+    for feed, metric in rows:
+        old_value = base.get(metric) if feed is None else base["feeds"][feed].get(metric)
+        new_value = new.get(metric) if feed is None else new["feeds"][feed].get(metric)
+        if old_value is None or new_value is None:
+            continue
+
+        if metric in LATENCY_METRICS:
+            change = (new_value - old_value) / max(old_value, 1e-9)
+            worse = change > latency_tolerance and new_value - old_value > latency_floor_ms
+            text = f"{change:+.1%}"
+        else:
+            change = new_value - old_value
+            worse = metric in QUALITY_METRICS and change < -quality_tolerance
+            text = f"{change:+.4f}"
+
+        print(f"{feed or '-':<18}{metric:<24}{old_value:>12.4g}{new_value:>12.4g}{text:>10}" + ("  REGRESSION" if worse else ""))
+        if worse:
+            regressions.append((feed, metric))
+
+    return regressions
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Replay reading histories through every feed : quality vs latency , with regression compare")
+    parser.add_argument("--articles", type = int, default = 100000, help = "synthetic catalog size (10k - 5M)")
+    parser.add_argument("--dim", type = int, default = 384)
+    parser.add_argument("--index-kind", default = "flat", choices = ann_index.INDEX_KINDS, help = "search index of the synthetic catalog")
+    parser.add_argument("--catalog-dir", help = "exported catalog (python -m app.storage) instead of a synthetic one")
+    parser.add_argument("--histories", help = ".jsonl of recorded histories instead of synthetic topical readers")
+    parser.add_argument("--users", type = int, default = 500)
+    parser.add_argument("--feeds", nargs = "+", default = list(DEFAULT_FEEDS), choices = FEEDS)
+    parser.add_argument("--url", help = "also replay against POST <url>/feed/personalization")
+    parser.add_argument("--top-k", type = int, default = 10)
+    parser.add_argument("--pool-size", type = int, default = 100)
+    parser.add_argument("--temperature", type = float, default = 0.2)
+    parser.add_argument("--lambda-div", type = float, default = 0.3)
+    parser.add_argument("--max-source", type = int, default = 5)
+    parser.add_argument("--decay-lambda", type = float, default = 0.0001)
+    parser.add_argument("--nprobe", type = int, default = None, help = "IVF lists probed (index default when omitted)")
+    parser.add_argument("--ef-search", type = int, default = None, help = "HNSW search depth (index default when omitted)")
+    parser.add_argument("--batch-size", type = int, default = 256, help = "users per news_recommender_batch call")
+    parser.add_argument("--neighbor-k", type = int, default = 20)
+    parser.add_argument("--max-interests", type = int, default = MAX_INTERESTS, help = "interest clusters per history (interests feed)")
+    parser.add_argument("--interest-pool-size", type = int, default = INTEREST_POOL_SIZE, help = "candidate pool of the interests feed")
+    parser.add_argument("--recall-users", type = int, default = 100, help = "users checked against exact search for ann_recall")
+    parser.add_argument("--out", help = "write the report as JSON")
+    parser.add_argument("--compare", nargs = 2, metavar = ("BASE", "NEW"), help = "compare two JSON reports and exit")
+    parser.add_argument("--latency-tolerance", type = float, default = 0.10)
+    parser.add_argument("--quality-tolerance", type = float, default = 0.02)
+    parser.add_argument("--latency-floor-ms", type = float, default = 0.5)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            regressions = compare(json.load(f), json.load(g), args.latency_tolerance, args.quality_tolerance, args.latency_floor_ms)
+        print(f"{len(regressions)} regression(s)")
+        sys.exit(1 if regressions else 0)
+
+    start = time.perf_counter()
+    if args.catalog_dir:
+        catalog = storage.load_catalog(args.catalog_dir)
+    else:
+        catalog = synthetic_catalog(args.articles, args.dim, index_kind = args.index_kind)
+    feeds = FeedPools(catalog)
+    print(f"catalog of {len(catalog)} articles ready in {time.perf_counter() - start:.1f}s ({peak_rss_mib():.0f} MiB peak RSS)", file = sys.stderr)
+
+    histories = load_histories(args.histories) if args.histories else topical_histories(catalog, args.users)
+    requests = split_holdout(histories)
+
+    report = {"config": {key: value for key, value in vars(args).items() if key not in ("compare", "out")} | {"articles": len(catalog)},
+              "feeds": {}}
+
+    search = {"nprobe": args.nprobe, "ef_search": args.ef_search}
+    report["ann_recall"] = ann_recall(catalog, requests, args.pool_size, args.decay_lambda, args.recall_users, search)
+    report["candidate_recall"] = candidate_recall(
+        catalog, requests, lambda history: recommender.retrieve_candidates(history, catalog, top_k = args.pool_size, decay_lambda = args.decay_lambda,
+                                                                           **search)[0])
+
+    if "interests" in args.feeds:
+        report["interest_candidate_recall"] = candidate_recall(
+            catalog, requests, lambda history: retrieve_interest_candidates(history, catalog, pool_size = args.interest_pool_size,
+                                                                            max_interests = args.max_interests, decay_lambda = args.decay_lambda,
+                                                                            **search)[0])
+
+    functions = feed_functions(catalog, feeds, args)
+    for name in args.feeds:
+        result = replay_batch(catalog, requests, args) if name == "batch" else replay(functions[name], requests, catalog)
+        report["feeds"][name] = {**result, "peak_rss_mib": peak_rss_mib()}
+
+    if args.url:
+        report["feeds"]["endpoint"] = {**replay_endpoint(catalog, requests, args), "peak_rss_mib": peak_rss_mib()}
+
+    print_report(report)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent = 2)
+
+
+if __name__ == "__main__":
+    main()
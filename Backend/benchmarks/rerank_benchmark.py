@@ -0,0 +1,124 @@
+# RERANK STAGE MICRO-BENCHMARK : DATAFRAME STAGES (OLD) VS ARRAY STAGES (news_recommender)
+#
+#   python -m benchmarks.rerank_benchmark --articles 100000 --users 300
+import argparse
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from app import recommender
+from benchmarks.synthetic import synthetic_catalog, synthetic_histories
+
+
+PARAMS = {"top_k": 10, "temperature": 0.2, "lambda_div": 0.3, "max_source": 5}
+
+
+# OLD PIPELINE (ROW-BY-ROW DATAFRAME STAGES , REMOVED FROM app.recommender) , KEPT HERE AS THE BASELINE :
+#   freshness -> source diversity -> mmr -> stochastic sampling
+def frame_rerank(catalog, rows, similarity, seed):
+
+    candidates = catalog.df.iloc[rows].copy()
+    candidates["similarity"] = similarity
+
+    reranked = frame_freshness(candidates, similarity_weight = 0.8, freshness_weight = 0.2)
+    diversified = frame_source_diversity(reranked, max_source = PARAMS["max_source"], top_k = PARAMS["top_k"])
+    diversified = frame_mmr(diversified, catalog.embeddings, lambda_div = PARAMS["lambda_div"], top_k = 50)
+    final_rank = frame_stochastic(diversified, top_k = PARAMS["top_k"], temperature = PARAMS["temperature"], seed = seed)
+
+    return final_rank["id"].tolist()
+
+
+def frame_freshness(df, similarity_weight = 0.5, freshness_weight = 0.5, decay_lambda = 0.001):
+
+    now = datetime.now(timezone.utc)
+    df = df.copy()
+    df["freshness"] = df["date"].apply(lambda d: np.exp(-decay_lambda * (now - d).days))
+    df["final_score"] = similarity_weight * df["similarity"] + freshness_weight * df["freshness"]
+
+    return df.sort_values(by = "final_score", ascending = False)
+
+
+def frame_source_diversity(df, max_source = 2, top_k = 10):
+
+    selected, source_count = [], {}
+    for _, row in df.iterrows():
+        if source_count.get(row["source"], 0) < max_source:
+            selected.append(row)
+            source_count[row["source"]] = source_count.get(row["source"], 0) + 1
+        if len(selected) >= top_k:
+            break
+
+    return pd.DataFrame(selected)
+
+
+def frame_mmr(df, embeddings, lambda_div = 0.3, top_k = 10):
+
+    selected_rows, selected_embs = [], []
+    for idx, row in df.iterrows():
+        emb = embeddings[idx] / max(np.linalg.norm(embeddings[idx]), 1e-12)
+
+        if not selected_embs or row["final_score"] - lambda_div * (np.asarray(selected_embs) @ emb).max() > 0:
+            selected_rows.append(row)
+            selected_embs.append(emb)
+        if len(selected_rows) >= top_k:
+            break
+
+    return pd.DataFrame(selected_rows).reset_index(drop = True)
+
+
+def frame_stochastic(df, top_k = 10, temperature = 0.2, seed = None):
+
+    rng = np.random.default_rng(seed)
+    scores = df["final_score"].values.astype(np.float64) / temperature
+    probs = np.exp(scores - scores.max())
+    probs /= probs.sum()
+
+    selected = rng.choice(len(df), size = min(top_k, len(df)), replace = False, p = probs)
+    return df.iloc[selected].sort_values("final_score", ascending = False).reset_index(drop = True)
+
+
+def array_rerank(catalog, rows, similarity, seed):
+
+    rows, final_score = recommender.rerank_candidates(catalog, rows, similarity, seed = seed, **PARAMS)
+    return recommender.build_results(catalog, rows, final_score)["id"].tolist()
+
+
+def timed(function, catalog, pools):
+
+    timings, outputs = [], []
+    for seed, (rows, similarity) in enumerate(pools):
+        start = time.perf_counter()
+        outputs.append(function(catalog, rows, similarity, seed))
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return np.asarray(timings), outputs
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description = "Benchmark the rerank stage of news_recommender")
+    parser.add_argument("--articles", type = int, default = 50000)
+    parser.add_argument("--dim", type = int, default = 384)
+    parser.add_argument("--users", type = int, default = 200)
+    args = parser.parse_args(argv)
+
+    catalog = synthetic_catalog(args.articles, args.dim)
+    histories = synthetic_histories(catalog, args.users)
+
+    # SAME 100-CANDIDATE POOLS FOR BOTH IMPLEMENTATIONS (FAISS IS NOT PART OF THIS BENCHMARK)
+    pools = [recommender.retrieve_candidates(history, catalog, top_k = 100) for history in histories]
+
+    frame_ms, frame_ids = timed(frame_rerank, catalog, pools)
+    array_ms, array_ids = timed(array_rerank, catalog, pools)
+
+    same = sum(a == b for a, b in zip(frame_ids, array_ids))
+    print(f"{len(pools)} candidate pools , identical output for {same}/{len(pools)} (fixed seeds)")
+    print(f"{'stage':<12}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for name, timings in (("dataframe", frame_ms), ("arrays", array_ms)):
+        print(f"{name:<12}{np.percentile(timings, 50):>10.3f}{np.percentile(timings, 99):>10.3f}{timings.mean():>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
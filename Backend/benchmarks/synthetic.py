@@ -0,0 +1,96 @@
+# SYNTHETIC CATALOGS FOR BENCHMARKS (SAME COLUMNS AS labeled_news.csv)
+import faiss
+import numpy as np
+import pandas as pd
+
+from app import ann_index
+from app.catalog import ArticleCatalog
+
+
+CATEGORIES = ["Politik", "Ekonomi", "Olahraga", "Teknologi", "Hiburan", "Kesehatan", "Otomotif", "Internasional"]
+SOURCES    = ["Kompas", "Tempo", "CNN Indonesia", "CNBC Indonesia", "Kumparan", "Detik", "Antara", "Liputan6"]
+WORDS      = ("pemerintah presiden ekonomi inflasi bank harga sepak bola timnas liga teknologi ponsel aplikasi "
+              "film artis konser banjir jakarta pemilu partai menteri saham rupiah kesehatan rumah sakit mobil "
+              "listrik dunia perang ekspor impor pajak").split()
+
+
+# CLUSTERED RANDOM UNIT VECTORS (NEWS EMBEDDINGS ARE TOPICAL , NOT UNIFORM)
+#   FILLED IN BLOCKS (SAME VALUES AS ONE BIG DRAW) SO MILLIONS OF ROWS DO NOT NEED A SECOND FULL-SIZE NOISE MATRIX
+def synthetic_embeddings(n, dim, n_topics = 200, seed = 0, return_topics = False, block = 1 << 18):
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    topics = rng.integers(0, n_topics, n)
+
+    embeddings = np.empty((n, dim), dtype = np.float32)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        embeddings[start:stop] = centers[topics[start:stop]] + 0.6 * rng.standard_normal((stop - start, dim)).astype(np.float32)
+        faiss.normalize_L2(embeddings[start:stop])
+
+    return (embeddings, topics) if return_topics else embeddings
+
+
+# ARTICLE METADATA , DATES SPREAD OVER THE LAST `days` DAYS
+def synthetic_frame(n, days = 365, seed = 0):
+
+    rng = np.random.default_rng(seed)
+    now = pd.Timestamp.now(tz = "UTC")
+    dates = now - pd.to_timedelta(rng.integers(0, days * 86400, n), unit = "s")
+    title_words = rng.integers(0, len(WORDS), (n, 6))
+    words = np.asarray(WORDS)
+    titles = [" ".join(words[row]).title() for row in title_words]
+
+    return pd.DataFrame({
+        "id": np.arange(1, n + 1, dtype = np.int64),
+        "title": titles,
+        "source": np.asarray(SOURCES)[rng.integers(0, len(SOURCES), n)],
+        "image": [f"https://img.example.com/{i}.jpg" for i in range(n)],
+        "url": [f"https://news.example.com/{i}" for i in range(n)],
+        "date": dates,
+        "created_at": dates,
+        "updated_at": dates,
+        "content": titles,
+        "topic_id": rng.integers(0, 50, n),
+        "category": np.asarray(CATEGORIES)[rng.integers(0, len(CATEGORIES), n)],
+        "confidence": rng.random(n),
+        "summary": titles,
+    })
+
+
+# topic_id IS THE EMBEDDING CLUSTER , SO TOPICAL HISTORIES (BELOW) HAVE A LEARNABLE NEXT ARTICLE
+def synthetic_catalog(n, dim = 384, seed = 0, index_kind = "flat"):
+
+    embeddings, topics = synthetic_embeddings(n, dim, seed = seed, return_topics = True)
+    index = ann_index.build_index(embeddings, kind = index_kind)
+
+    frame = synthetic_frame(n, seed = seed)
+    frame["topic_id"] = topics
+
+    return ArticleCatalog(frame, index, embeddings = embeddings)
+
+
+# READING HISTORIES AS LISTS OF ARTICLE IDS
+def synthetic_histories(catalog, n_users, min_len = 1, max_len = 50, seed = 1):
+
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(min_len, max_len + 1, n_users)
+    return [catalog.ids[rng.integers(0, len(catalog), length)].tolist() for length in lengths]
+
+
+# READERS WITH 1-3 FAVOURITE TOPICS (topic_id) , EACH READ PICKED FROM ONE OF THEM , OLDEST READ FIRST
+#   THE LAST ARTICLE IS THE HELD-OUT "NEXT READ" OF THE REPLAY BENCHMARK
+def topical_histories(catalog, n_users, min_len = 2, max_len = 50, seed = 1):
+
+    rng = np.random.default_rng(seed)
+    topic_rows = {int(topic): rows for topic, rows in catalog.df.groupby("topic_id").indices.items()}
+    topic_ids = np.asarray(sorted(topic_rows))
+
+    histories = []
+    for length in rng.integers(min_len, max_len + 1, n_users):
+        favourites = rng.choice(topic_ids, size = min(len(topic_ids), rng.integers(1, 4)), replace = False)
+        rows = np.asarray([rng.choice(topic_rows[int(rng.choice(favourites))]) for _ in range(length)], dtype = np.int64)
+        rows = rows[np.argsort(catalog.epoch_days[rows], kind = "stable")]
+        histories.append(catalog.ids[rows].tolist())
+
+    return histories
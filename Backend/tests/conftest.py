@@ -0,0 +1,43 @@
+# SHARED FIXTURES : A SMALL SYNTHETIC CATALOG (benchmarks.synthetic) AND THE main_HF APP SERVING IT FROM A CATALOG_DIR
+import os
+
+import faiss
+import pytest
+
+from app import neighbors, storage
+from benchmarks.synthetic import synthetic_catalog
+
+
+CATALOG_ROWS = 2000
+CATALOG_DIM = 32
+INGEST_TOKEN = "test-ingest-token"
+
+
+@pytest.fixture
+def catalog():
+    return synthetic_catalog(CATALOG_ROWS, dim = CATALOG_DIM, seed = 0)
+
+
+@pytest.fixture(scope = "session")
+def catalog_dir(tmp_path_factory):
+
+    catalog = synthetic_catalog(CATALOG_ROWS, dim = CATALOG_DIM, seed = 0)
+    flat = faiss.IndexFlatIP(CATALOG_DIM)
+    flat.add(catalog.embeddings)
+
+    out_dir = tmp_path_factory.mktemp("catalog")
+    storage.export_catalog(catalog.df, flat, out_dir)
+    neighbors.main(["--catalog", str(out_dir), "--k", "10"])      # THE OFFLINE GRAPH BUILD , LOADED BY THE APP
+    return out_dir
+
+
+# THE APP MODULE LOADS AT IMPORT , SO IT IS IMPORTED ONCE PER SESSION WITH THE TEST ENVIRONMENT
+@pytest.fixture(scope = "session")
+def client(catalog_dir):
+
+    os.environ.update({"CATALOG_DIR": str(catalog_dir), "INGEST_TOKEN": INGEST_TOKEN, "WARMUP_QUERIES": "2"})
+    from fastapi.testclient import TestClient
+    from app.main_HF import app
+
+    with TestClient(app) as client:
+        yield client
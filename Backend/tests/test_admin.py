@@ -0,0 +1,29 @@
+import pytest
+
+from conftest import INGEST_TOKEN
+
+
+ADMIN = [("get", "/admin/cache"), ("get", "/admin/trending"), ("get", "/admin/search"), ("get", "/admin/shards"),
+         ("post", "/admin/shards/expire?max_age_days=30"), ("post", "/admin/articles/retract")]
+
+
+@pytest.mark.parametrize("method, path", ADMIN)
+@pytest.mark.parametrize("headers", [{}, {"X-Ingest-Token": "wrong"}])
+def test_admin_needs_the_token(client, method, path, headers):
+    response = getattr(client, method)(path, headers = headers, **({"json": {"article_ids": [1]}} if method == "post" else {}))
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize("method, path", ADMIN)
+def test_admin_is_closed_without_a_configured_token(client, monkeypatch, method, path):
+
+    import app.main_HF as main_HF
+    monkeypatch.setattr(main_HF, "INGEST_TOKEN", None)
+
+    response = getattr(client, method)(path, headers = {"X-Ingest-Token": INGEST_TOKEN},
+                                       **({"json": {"article_ids": [1]}} if method == "post" else {}))
+    assert response.status_code == 503
+
+
+def test_admin_accepts_the_token(client):
+    assert client.get("/admin/cache", headers = {"X-Ingest-Token": INGEST_TOKEN}).status_code == 200
@@ -0,0 +1,37 @@
+from app.body_store import INDEX_FILE, LOG_FILE, ArticleBodyStore
+
+
+def test_appends_go_to_the_log_until_compaction(tmp_path):
+
+    store = ArticleBodyStore.build(tmp_path, [1, 2], ["satu", "dua"])
+    store.compact_rows = 3
+    index_version = (tmp_path / INDEX_FILE).stat().st_mtime_ns
+
+    store.append([3, 4], ["tiga", "empat"])
+    assert (tmp_path / INDEX_FILE).stat().st_mtime_ns == index_version
+    assert (tmp_path / LOG_FILE).stat().st_size == 2 * 24
+    assert [store.get(article_id) for article_id in (1, 3, 4)] == ["satu", "tiga", "empat"]
+
+    store.append([2, 5], ["dua lagi", "lima"])           # THIRD LOG RECORD -> FOLDED INTO THE INDEX
+    assert (tmp_path / INDEX_FILE).stat().st_mtime_ns != index_version and not store._recent
+    assert store.get(2) == "dua lagi" and store.get(5) == "lima" and len(store) == 6
+
+
+def test_processes_sharing_a_directory_see_each_others_bodies(tmp_path):
+
+    writer = ArticleBodyStore.build(tmp_path, [1], ["satu"])
+    writer.compact_rows = 2
+    reader = ArticleBodyStore(tmp_path)
+
+    writer.append([2], ["dua"])
+    assert reader.get(2) is None
+    reader.refresh()
+    assert reader.get(2) == "dua"
+
+    writer.append([1, 3], ["satu lagi", "tiga"])         # COMPACTED BY THE WRITER
+    reader.refresh()
+    assert [reader.get(article_id) for article_id in (1, 2, 3)] == ["satu lagi", "dua", "tiga"]
+
+    reader.append([4], ["empat"])
+    writer.refresh()
+    assert writer.get(4) == "empat" and ArticleBodyStore(tmp_path).get(4) == "empat"
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+
+def test_category_feed_only_returns_that_category(client):
+
+    results = client.get("/feed/category/politik?user_id=u1&top_k=10").json()["results"]
+    assert len(results) == 10
+    assert {item["category"] for item in results} == {"Politik"}
+
+
+def test_source_feed_only_returns_that_source(client):
+
+    results = client.get("/feed/source/kompas?user_id=u1&top_k=5").json()["results"]
+    assert len(results) == 5
+    assert {item["source"] for item in results} == {"Kompas"}
+
+
+def test_home_feed_ranks_only_the_bounded_pool(catalog):
+
+    from app.feeds import FeedPools
+
+    feeds = FeedPools(catalog, pool_size = 50)
+    base = np.nan_to_num(feeds.freshness * feeds.confidence, nan = -np.inf)
+
+    assert len(feeds.home_pool) == 50
+    assert base[feeds.home_pool].min() >= np.sort(base)[-50]
+
+    rows = feeds.home_feed("u1", top_k = 10)
+    assert len(rows) == 10 and np.isin(rows, feeds.home_pool).all()
+    assert np.array_equal(rows, feeds.home_feed("u1", top_k = 10))
+
+    politik = feeds.category_feed("POLITIK", "u1", top_k = 10)
+    assert len(politik) == 10 and np.isin(politik, feeds.category_pools["politik"]).all()
+    assert (catalog.df["category"].iloc[politik] == "Politik").all()
+
+
+def test_patched_pools_match_a_full_rebuild(catalog):
+
+    import pandas as pd
+    from datetime import datetime, timezone
+    from app.feeds import FeedPools
+    from app.ingest import CatalogSnapshot, CatalogStore
+    from conftest import CATALOG_DIM
+    from test_ingest import article
+
+    now = datetime(2026, 10, 18, tzinfo = timezone.utc)
+    original = FeedPools(catalog, now = now, pool_size = 50)
+    store = CatalogStore(CatalogSnapshot(catalog, original))
+
+    # NEW ROWS (ONE OF THEM REPLACES AN EXISTING ID , ONE OPENS A NEW CATEGORY) , THEN RETRACT ROWS OF THE HOME POOL
+    rows = [article(920000 + i, confidence = 0.99 - i / 100, category = "Sains" if i == 0 else "Politik") for i in range(20)]
+    rows.append(article(int(catalog.ids[0]), confidence = 0.5))
+    vectors = np.random.default_rng(0).standard_normal((len(rows), CATALOG_DIM)).astype(np.float32)
+    store.append(pd.DataFrame(rows), vectors)
+    store.retract(store.current.catalog.ids[store.current.feeds.home_pool[:5]].tolist() + [920015])
+
+    patched, rebuilt = store.current.feeds, FeedPools(store.current.catalog, now = now, pool_size = 50)
+    assert len(original.all_rows) == len(catalog) and "sains" not in original.category_pools
+    assert "sains" in patched.category_pools and not np.isin(0, patched.all_rows)
+    assert len(store.current.feeds.home_pool) == 50 and len(patched.all_rows) == len(catalog) + 21 - 7
+
+    for name in ("all_rows", "latest_order", "confidence", "freshness", "home_pool"):
+        assert np.array_equal(np.nan_to_num(getattr(patched, name)), np.nan_to_num(getattr(rebuilt, name))), name
+    for name in ("by_category", "by_source", "category_pools", "source_pools"):
+        left, right = getattr(patched, name), getattr(rebuilt, name)
+        assert left.keys() == right.keys(), name
+        assert all(np.array_equal(np.sort(left[key]), np.sort(right[key])) for key in left), name
+
+
+@pytest.mark.parametrize("mode", [None, "interests", "neighbors"])
+def test_batch_matches_single_user_feeds(client, mode):
+
+    histories = [[1, 2, 3], [10, 11], [999999999]]
+    response = client.post("/feed/personalization/batch",
+                           json = {"users": [{"user_id": f"u{i}", "article_ids": ids} for i, ids in enumerate(histories)], "top_k": 30, "mode": mode})
+    assert response.status_code == 200
+    results = response.json()["results"]
+
+    for history, batch in zip(histories[:2], results):
+        single = client.post("/feed/personalization", json = {"article_ids": history, "top_k": 30, "mode": mode}).json()["results"]
+        assert [item["id"] for item in batch["results"]] == [item["id"] for item in single]
+        assert batch["top_k"] == len(single) and (mode == "neighbors" or len(single) == 30)
+
+    assert results[2]["results"] == [] and results[2]["unknown_ids"] == [999999999]
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 17, 1000, 4097])
+def test_feistel_permutation_is_a_bijection(n):
+
+    from app.feeds import FeistelPermutation
+
+    permutation = FeistelPermutation(n, seed = 7)
+    rows = permutation(np.arange(n))
+    assert np.array_equal(np.sort(rows), np.arange(n))
+    assert np.array_equal(rows, FeistelPermutation(n, seed = 7)(np.arange(n)))
+
+    # THE NETWORK PERMUTES A LARGER DOMAIN , A VALUE THAT LANDS OUTSIDE [0 , n) IS WALKED BACK IN
+    domain = 4 ** permutation.half_bits
+    with np.errstate(over = "ignore"):
+        assert np.array_equal(np.sort(permutation._encrypt(np.arange(domain, dtype = np.uint64))), np.arange(domain))
+        assert domain > n and (permutation._encrypt(np.arange(n, dtype = np.uint64)) >= n).any() or n < 3
+    if n >= 17:
+        assert not np.array_equal(rows, FeistelPermutation(n, seed = 8)(np.arange(n)))
+
+
+def test_random_pages_cover_every_row_once(catalog):
+
+    from app.feeds import FeedPools
+
+    feeds = FeedPools(catalog)
+    pages = [feeds.random_page(seed = 3, cursor = cursor, page_size = 300) for cursor in range(0, len(feeds.all_rows), 300)]
+    assert np.array_equal(np.sort(np.concatenate(pages)), feeds.all_rows)
+    assert len(feeds.random_page(seed = 3, cursor = len(feeds.all_rows))) == 0
@@ -0,0 +1,40 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.filters import ArticleFilter
+from app.ingest import CatalogSnapshot, CatalogStore
+from conftest import CATALOG_DIM
+from test_ingest import article
+
+
+@pytest.mark.parametrize("sources, top_k, cap", [([], 30, 5), (["Kompas"], 30, 30), (["a", "b"], 25, 13), (["a", "b", "c", "d"], 10, 5)])
+def test_source_cap_lets_the_allowed_sources_fill_top_k(sources, top_k, cap):
+    assert ArticleFilter(sources = sources).source_cap(top_k, 5) == cap
+
+
+def test_date_bounds_include_both_whole_days(catalog):
+
+    # ARTICLES ON BOTH SIDES OF EVERY MIDNIGHT AROUND 2026-10-10 .. 2026-10-11
+    dates = ["2026-10-09T23:59:59Z", "2026-10-10T00:00:00Z", "2026-10-10T12:00:00Z", "2026-10-11T23:59:59Z", "2026-10-12T00:00:00Z"]
+    articles = pd.DataFrame([article(940000 + i, date = day, category = "Sains", source = "Tempo") for i, day in enumerate(dates)])
+    vectors = np.random.default_rng(0).standard_normal((len(dates), CATALOG_DIM)).astype(np.float32)
+
+    store = CatalogStore(CatalogSnapshot(catalog))
+    store.append(articles, vectors)
+    feeds = store.current.feeds
+
+    def ids(**constraints):
+        return store.current.catalog.ids[ArticleFilter(categories = ["SAINS"], **constraints).rows(feeds)].tolist()
+
+    assert ids(date_from = date(2026, 10, 10), date_to = date(2026, 10, 11)) == [940001, 940002, 940003]
+    assert ids(date_from = date(2026, 10, 10), date_to = date(2026, 10, 10)) == [940001, 940002]
+    assert ids(date_to = date(2026, 10, 9)) == [940000]
+    assert ids(date_from = date(2026, 10, 12)) == [940004]
+
+    # EVERY CONSTRAINT TOGETHER , SOURCES AND CATEGORIES ARE CASE-INSENSITIVE
+    mixed = ArticleFilter(categories = ["sains"], sources = ["TEMPO"], date_from = date(2026, 10, 11))
+    assert store.current.catalog.ids[mixed.rows(feeds)].tolist() == [940003, 940004]
+    assert mixed.key() == "category=sains;source=tempo;from=2026-10-11;to=" and ArticleFilter().key() == ""
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.ingest import CatalogSnapshot, CatalogStore
+from conftest import CATALOG_DIM, INGEST_TOKEN
+
+
+HEADERS = {"X-Ingest-Token": INGEST_TOKEN}
+
+
+def article(article_id, **fields):
+    return {"id": article_id, "title": "Berita baru", "source": "Kompas", "url": f"https://news.example.com/new/{article_id}",
+            "category": "Politik", "date": "2026-10-18T08:00:00Z", "topic_id": 3, **fields}
+
+
+def vector(seed = 0):
+    return np.random.default_rng(seed).standard_normal(CATALOG_DIM).tolist()
+
+
+def test_partial_article_is_rejected_before_the_snapshot(client):
+
+    from app.main_HF import store
+    version = store.current.version
+
+    response = client.post("/admin/articles", headers = HEADERS,
+                           json = {"articles": [{"id": 900001, "title": "Berita baru", "date": "2026-10-18"}], "embeddings": [vector()]})
+
+    assert response.status_code == 422
+    assert store.current.version == version
+    assert client.get("/news/900001").json() == {"error": "News not found"}
+
+
+@pytest.mark.parametrize("embeddings", [[vector()[:-1]], [vector(), vector(1)], [[1e39] * CATALOG_DIM]])
+def test_bad_embeddings_are_rejected(client, embeddings):
+
+    from app.main_HF import store
+    version = store.current.version
+
+    response = client.post("/admin/articles", headers = HEADERS, json = {"articles": [article(900002)], "embeddings": embeddings})
+    assert response.status_code == 422
+    assert store.current.version == version
+
+
+def test_article_without_optional_fields_is_served(client):
+
+    response = client.post("/admin/articles", headers = HEADERS, json = {"articles": [article(900003)], "embeddings": [vector()]})
+    assert response.status_code == 200 and response.json()["article_ids"] == [900003]
+
+    try:
+        detail = client.get("/news/900003").json()
+        assert detail["title"] == "Berita baru" and detail["image"] is None and detail["source"] == "Kompas"
+
+        feed = client.post("/feed/personalization", json = {"article_ids": [900003], "top_k": 5})
+        assert feed.status_code == 200 and len(feed.json()["results"]) == 5
+    finally:
+        client.post("/admin/articles/retract", headers = HEADERS, json = {"article_ids": [900003]})
+
+
+def test_dropped_batch_is_validated_too(catalog):
+
+    store = CatalogStore(CatalogSnapshot(catalog))
+    partial = pd.DataFrame([{"id": 900004, "title": "Berita baru", "date": "2026-10-18"}])
+
+    with pytest.raises(ValueError, match = "url"):
+        store.append(partial, np.asarray([vector()], dtype = np.float32))
+    with pytest.raises(ValueError, match = "duplicate"):
+        store.append(pd.DataFrame([article(900005), article(900005)]), np.asarray([vector(), vector(1)], dtype = np.float32))
+
+    assert store.current.version == 0 and len(store.current.catalog) == len(catalog)
+
+
+def batch(first_id, n, seed = 0):
+    vectors = np.random.default_rng(seed).standard_normal((n, CATALOG_DIM)).astype(np.float32)
+    return pd.DataFrame([article(first_id + i) for i in range(n)]), vectors
+
+
+def test_append_goes_to_a_delta_segment(catalog):
+
+    store = CatalogStore(CatalogSnapshot(catalog))
+    store.append(*batch(910000, 5))
+    store.append(*batch(910005, 5, seed = 1))
+    appended = store.current.catalog
+
+    # THE BASE INDEX AND THE BASE EMBEDDINGS ARE SHARED , NOT COPIED
+    assert appended.faiss_index is catalog.faiss_index
+    assert np.shares_memory(appended.embeddings.segments[0], catalog.embeddings)
+    assert appended.base_rows == len(catalog) and appended.delta_index.ntotal == 10
+
+    # SEARCH OVER BASE + DELTA = EXACT SEARCH OVER EVERYTHING (FLAT BASE INDEX)
+    queries = appended.embeddings[[3, len(catalog) + 2, len(catalog) + 7]]
+    scores, found = appended.search(queries, 10)
+    exact_scores, exact_found = appended._exact_search(queries, 10, np.arange(len(appended)))
+    assert np.array_equal(found, exact_found)
+    assert np.allclose(scores, exact_scores, atol = 1e-5)
+
+    # FILTERED SEARCH OVER ROWS OF BOTH SEGMENTS
+    rows = np.r_[np.arange(0, len(catalog), 2), len(catalog) + 7]
+    _, found = appended.search_rows(queries[2:], 5, rows)
+    assert found[0, 0] == len(catalog) + 7 and np.isin(found, rows).all()
+
+
+def test_large_delta_is_folded_into_the_base_index(catalog, monkeypatch):
+
+    import app.ingest as ingest
+    monkeypatch.setattr(ingest, "DELTA_MAX_ROWS", 8)
+
+    store = CatalogStore(CatalogSnapshot(catalog))
+    store.append(*batch(920000, 5))
+    store.append(*batch(920005, 5, seed = 1))
+    folded = store.current.catalog
+
+    assert folded.delta_index is None and folded.base_rows == len(folded) == len(catalog) + 10
+    assert folded.faiss_index is not catalog.faiss_index and folded.faiss_index.ntotal == len(folded)
+    assert catalog.faiss_index.ntotal == len(catalog)
+    assert folded.search(folded.embeddings[[len(catalog) + 9]], 1)[1][0, 0] == len(catalog) + 9
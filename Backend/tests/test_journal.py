@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.body_store import ArticleBodyStore
+from app.ingest import CatalogSnapshot, CatalogStore, IngestJournal, JournalReplayError
+from app.recommender import CandidatePool
+from app.result_cache import MemoryCandidateCache, SQLiteCandidateCache
+from test_ingest import batch, vector
+
+
+# TWO WORKERS : SAME CATALOG , SAME JOURNAL DIRECTORY
+@pytest.fixture
+def workers(catalog, tmp_path):
+    return [IngestJournal(CatalogStore(CatalogSnapshot(catalog)), tmp_path) for _ in range(2)]
+
+
+def test_every_worker_replays_the_same_changes(workers):
+
+    first, second = workers
+    first.append(*batch(910000, 5))
+    second.retract([910002])
+
+    assert first.catch_up() == 1 and second.catch_up() == 0
+    for journal in workers:
+        catalog = journal.store.current.catalog
+        assert journal.store.current.version == 2 and len(catalog) == 2005
+        assert catalog.missing([910000, 910002]) == [910002]
+        assert np.allclose(catalog.embeddings[[2000, 2004]], first.store.current.catalog.embeddings[[2000, 2004]])
+
+
+def test_rejected_and_empty_changes_are_not_written(workers, tmp_path):
+
+    first, second = workers
+    with pytest.raises(ValueError, match = "url"):
+        first.append(pd.DataFrame([{"id": 910010, "title": "Berita baru", "date": "2026-10-18"}]), np.asarray([vector()]))
+    assert first.retract([123456789]) is None
+
+    assert second.catch_up() == 0 and first.applied == 0
+    assert not list(tmp_path.glob("*.json"))
+
+
+def test_one_leader_at_a_time(workers):
+
+    first, second = workers
+    assert first.try_lead() and first.try_lead()
+    assert not second.try_lead()
+
+    first._leader_file.close()        # THE LEADER'S PROCESS EXITED
+    assert second.try_lead()
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_cache_hides_pools_of_a_newer_catalog(backend, tmp_path):
+
+    cache = MemoryCandidateCache() if backend == "memory" else SQLiteCandidateCache(tmp_path / "cache.sqlite")
+    pool = CandidatePool([1, 2], [3, 4], [0.5, 0.25], 0.1)
+    cache.put(((1, 2), 16, "ann"), pool, version = 3)
+
+    assert cache.get(((1, 2), 16, "ann"), version = 2) is None
+    assert cache.get(((1, 2), 16, "ann"), version = 3).ids.tolist() == [3, 4]
+    assert cache.get(((1, 2), 16, "ann"), version = 7) is not None
+
+
+def test_failed_entry_is_retried_not_skipped(workers, monkeypatch):
+
+    first, second = workers
+    first.append(*batch(910020, 2))
+    first.retract([910020])
+
+    def broken(articles, embeddings):
+        raise OSError("disk hiccup")
+
+    store_append = second.store.append
+    monkeypatch.setattr(second.store, "append", broken)
+    with pytest.raises(JournalReplayError, match = "entry 1"):
+        second.catch_up()
+    assert second.applied == 0 and second.store.current.version == 0 and "disk hiccup" in second.error
+
+    # A WRITE WAITS FOR THE REPLAY TOO (IT WOULD OTHERWISE TAKE AN EXISTING SEQUENCE NUMBER)
+    with pytest.raises(JournalReplayError):
+        second.retract([910021])
+
+    monkeypatch.setattr(second.store, "append", store_append)
+    assert second.catch_up() == 2 and second.error is None
+    assert second.store.current.version == 2 and second.store.current.catalog.missing([910020, 910021]) == [910020]
+
+
+def test_bodies_are_written_once(catalog, tmp_path):
+
+    bodies = ArticleBodyStore.build(tmp_path / "bodies", catalog.ids[:10], ["isi"] * 10)
+    first, second = [IngestJournal(CatalogStore(CatalogSnapshot(catalog), bodies = ArticleBodyStore(tmp_path / "bodies")),
+                                   tmp_path / "journal") for _ in range(2)]
+
+    articles, vectors = batch(910030, 2)
+    articles["content"] = ["isi baru satu", "isi baru dua"]
+    first.append(articles, vectors)
+    second.catch_up()
+
+    assert "content" not in (tmp_path / "journal" / "000000000001.json").read_text()
+    assert (tmp_path / "bodies" / "bodies.log").stat().st_size == 2 * 24
+    assert second.store.bodies.get(910031) == "isi baru dua"
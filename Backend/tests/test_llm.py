@@ -0,0 +1,17 @@
+import asyncio
+
+import pytest
+
+from app import llm
+
+
+def test_explanation_client_is_abstract():
+    with pytest.raises(TypeError):
+        llm.ExplanationClient()
+
+
+def test_service_clients_implement_generate():
+
+    client = llm.FakeClient(latency = 0)
+    assert isinstance(asyncio.run(client.generate("Judul: Harga beras naik")), str)
+    assert isinstance(llm.GeminiClient(), llm.ExplanationClient)
@@ -0,0 +1,50 @@
+import numpy as np
+
+from app.catalog import ArticleCatalog
+from app.neighbors import NeighborGraph
+
+
+def test_app_loads_the_precomputed_graph(client):
+
+    import app.main_HF as main_HF
+
+    assert isinstance(main_HF.neighbors.rows, np.memmap)
+    assert not main_HF.NEIGHBOR_BUILD
+
+    response = client.get("/news/1/related?top_k=5")
+    assert response.status_code == 200 and len(response.json()["results"]) == 5
+    assert 1 not in [item["id"] for item in response.json()["results"]]
+
+
+def test_extend_keeps_the_base_and_writes_an_overlay(catalog):
+
+    old = ArticleCatalog(catalog.df.iloc[:1990], catalog.faiss_index, embeddings = catalog.embeddings[:1990])
+    graph = NeighborGraph.build(old, k = 10)
+    base_rows, base_scores = graph.rows.copy(), graph.scores.copy()
+
+    extended = graph.extend(catalog, np.arange(1990, 2000))
+
+    assert extended.rows is graph.rows and (graph.rows == base_rows).all() and (graph.scores == base_scores).all()
+    assert len(extended) == 2000 and 10 <= len(extended.overlay) < 100
+
+    # NEW ROWS HAVE THEIR SEARCHED LISTS , AN EXISTING ROW A NEW ARTICLE BEAT NOW LISTS IT IN ORDER
+    rows, scores = extended.lists(np.arange(1990, 2000))
+    assert (rows == NeighborGraph.search(catalog, np.arange(1990, 2000), 10)[0]).all()
+    changed = [row for row in extended.overlay if row < 1990]
+    hits, sims = extended.lists(changed)
+    assert (hits >= 1990).any(axis = 1).all() and (np.diff(sims.astype(np.float32), axis = 1) <= 0).all()
+
+    # FOLDED : SAME LISTS AS PLAIN ARRAYS
+    folded = extended.folded()
+    assert not folded.overlay and (folded.rows == extended.lists(np.arange(2000))[0]).all()
+    assert extended.related(catalog, 1995, top_k = 5)[0].tolist() == folded.related(catalog, 1995, top_k = 5)[0].tolist()
+
+
+def test_overlay_is_folded_past_its_limit(catalog):
+
+    old = ArticleCatalog(catalog.df.iloc[:1990], catalog.faiss_index, embeddings = catalog.embeddings[:1990])
+    graph = NeighborGraph.build(old, k = 10)
+    graph.max_overlay = 5
+
+    extended = graph.extend(catalog, np.arange(1990, 2000))
+    assert not extended.overlay and extended.rows.shape == (2000, 10) and extended.rows is not graph.rows
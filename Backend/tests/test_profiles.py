@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from app.catalog import now_epoch_days
+from app.profiles import MemoryProfileBackend, ProfileStore, UserProfile
+
+
+def test_lazy_decay_matches_eager_decay():
+
+    rng = np.random.default_rng(0)
+    days = [10.0, 10.5, 13.25, 20.0, 20.0, 31.75]
+    contributions = rng.standard_normal((len(days), 8))
+
+    profile = UserProfile("u1", np.zeros(8), days[0])
+    for day, contribution in zip(days, contributions):
+        profile = profile.advance(contribution, [int(day)], day, decay_lambda = 0.05)
+
+    # EAGER : EVERY READ DECAYED FROM ITS OWN DAY TO THE LAST ONE
+    eager = (np.exp(-0.05 * (days[-1] - np.asarray(days)))[:, None] * contributions).sum(axis = 0)
+    assert np.allclose(profile.vector, eager) and profile.as_of == days[-1] and profile.reads == len(days)
+
+    # MOVING AS_OF FORWARD WITHOUT A READ SCALES THE WHOLE SUM , A READ DATED BEFORE as_of IS NOT DECAYED BACKWARDS
+    later = profile.advance(np.zeros(8), [], days[-1] + 4)
+    assert np.allclose(later.vector, eager * np.exp(-0.0001 * 4)) and later.as_of == days[-1] + 4
+    earlier = later.advance(np.zeros(8), [], days[0])
+    assert np.array_equal(earlier.vector, later.vector) and earlier.as_of == later.as_of
+
+
+def test_recorded_reads_equal_the_decayed_sum_of_the_whole_history(catalog):
+
+    store = ProfileStore(MemoryProfileBackend(), decay_lambda = 0.05, min_weights = 0.0, max_seen = 4)
+    first = datetime(2026, 10, 18, 9, tzinfo = timezone.utc)
+    reads = [(first + timedelta(days = offset), catalog.ids[rows].tolist()) for offset, rows in [(0, [0, 1]), (2, [5]), (2, [7, 9]), (9, [11])]]
+
+    for now, article_ids in reads:
+        profile, unknown = store.record("u1", article_ids + [999999999], catalog, now = now)
+        assert unknown == [999999999]
+
+    # READ TIMES ARE WHOLE DAYS APART , SO THE PER-READ FLOORED AGES ADD UP TO THE FLOORED AGE AT THE LAST READ
+    rows = catalog.lookup([article_id for _, article_ids in reads for article_id in article_ids])
+    weights = np.exp(-0.05 * np.floor(now_epoch_days(reads[-1][0]) - catalog.epoch_days[rows]))
+    assert np.allclose(profile.vector, weights @ catalog.embeddings[rows].astype(np.float64))
+
+    assert profile.reads == 6 and profile.seen == tuple(catalog.ids[[5, 7, 9, 11]].tolist())
@@ -0,0 +1,26 @@
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/feed/home?user_id=u1", "/feed/latest?", "/feed/category/Politik?", "/feed/source/Kompas?user_id=u1",
+                                  "/feed/trending?", "/search?q=harga"])
+@pytest.mark.parametrize("top_k", [-1, 0, 10_000])
+def test_feed_top_k_out_of_range_is_422(client, path, top_k):
+    assert client.get(f"{path}&top_k={top_k}").status_code == 422
+
+
+@pytest.mark.parametrize("field, value", [("top_k", -1), ("top_k", 0), ("nprobe", 0), ("ef_search", -5), ("ef_search", 10**6)])
+def test_personalization_bounds_are_422(client, field, value):
+    assert client.post("/feed/personalization", json = {"article_ids": [1, 2], field: value}).status_code == 422
+
+
+def test_in_range_requests_succeed(client):
+    assert len(client.get("/feed/home?user_id=u1&top_k=5").json()["results"]) == 5
+    assert client.post("/feed/personalization", json = {"article_ids": [1, 2], "top_k": 3, "nprobe": 1}).status_code == 200
+    assert client.get("/search?q=harga&top_k=1").status_code == 200
+
+
+def test_text_segment_top_k_zero_is_empty(client):
+    from app.main_HF import store
+
+    rows, scores = store.current.text_index.search("harga", store.current.catalog, top_k = 0)
+    assert len(rows) == 0 and len(scores) == 0
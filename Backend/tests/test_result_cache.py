@@ -0,0 +1,58 @@
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app import result_cache
+from app.recommender import CandidatePool
+
+
+def pool(first_id, size = 10):
+    ids = np.arange(first_id, first_id + size)
+    return CandidatePool((first_id - 2, first_id - 1), ids, np.linspace(1.0, 0.5, size), candidate_floor = 0.25)
+
+
+@pytest.mark.parametrize("key", [((1, 2, 3), 16, 64),
+                                 ((), None, None, None, "", "ann"),
+                                 ((7,), 16, 64, 30, "c:politik|s:kompas,detik%", "interests")])
+def test_key_round_trip(key):
+    assert result_cache.decode_key(result_cache.encode_key(key)) == key
+
+
+def test_pool_round_trip():
+
+    original = pool(100)
+    decoded = result_cache.decode_pool(result_cache.encode_pool(original))
+
+    assert decoded.history == original.history and decoded.candidate_floor == original.candidate_floor
+    assert np.array_equal(decoded.ids, original.ids) and np.array_equal(decoded.final_score, original.final_score)
+    assert not decoded.ids.flags.writeable
+
+    empty = result_cache.decode_pool(result_cache.encode_pool(CandidatePool((), [], [], -np.inf)))
+    assert len(empty) == 0 and empty.history == () and empty.candidate_floor == -np.inf
+
+
+def test_sqlite_cache_evicts_least_recently_used_within_the_byte_budget(monkeypatch, tmp_path):
+
+    clock = itertools.count(1000.0)
+    monkeypatch.setattr(result_cache, "time", SimpleNamespace(time = lambda: next(clock)))
+
+    size = len(result_cache.encode_pool(pool(100)))
+    cache = result_cache.SQLiteCandidateCache(tmp_path / "cache.sqlite", max_bytes = 3 * size, ttl = 1e6)
+
+    keys = [((i,), 16, 64) for i in range(4)]
+    for i, key in enumerate(keys[:3]):
+        cache.put(key, pool(100 * (i + 1)))
+
+    # TOUCH THE OLDEST ENTRY , THE NEXT PUT EVICTS THE LEAST RECENTLY USED ONE INSTEAD
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[3], pool(400))
+
+    assert cache.get(keys[1]) is None and cache.stats.evictions == 1
+    assert [cache.get(key).ids[0] for key in (keys[0], keys[2], keys[3])] == [100, 300, 400]
+    assert sum(len(result_cache.encode_pool(value)) for _, value in cache.entries()) <= 3 * size
+
+    # A POOL LARGER THAN THE WHOLE BUDGET IS NOT STORED (AND EVICTS NOTHING)
+    cache.put(((9,), 16, 64), pool(900, size = 200))
+    assert cache.get(((9,), 16, 64)) is None and len(cache.entries()) == 3
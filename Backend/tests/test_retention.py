@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from app import catalog as catalog_module
+from app import recommender
+from app.catalog import now_epoch_days
+from app.ingest import CatalogSnapshot, CatalogStore
+from app.shards import ShardedIndex
+from benchmarks.synthetic import synthetic_catalog
+from conftest import CATALOG_DIM, CATALOG_ROWS
+
+
+@pytest.mark.parametrize("index_kind", ["flat", "hnsw"])
+@pytest.mark.parametrize("exact_filter_rows", [0, 10000])      # SELECTOR SEARCH OVER THE ACTIVE ROWS , OR EXACT SCORING
+def test_full_pool_after_expiring_most_rows(monkeypatch, index_kind, exact_filter_rows):
+
+    monkeypatch.setattr(catalog_module, "EXACT_FILTER_ROWS", exact_filter_rows)
+    catalog = synthetic_catalog(CATALOG_ROWS, dim = CATALOG_DIM, index_kind = index_kind)
+    catalog.shards = ShardedIndex.build(catalog, window = "week", live_days = 400)
+
+    store = CatalogStore(CatalogSnapshot(catalog))
+    change = store.expire(60)
+    expired = store.current.catalog
+
+    assert expired.retracted_count == len(change.article_ids) > 0.8 * CATALOG_ROWS
+    live_ids = expired.ids[expired.active]
+
+    for start in range(0, 50, 5):
+        pool = recommender.candidate_pool(live_ids[start:start + 5].tolist(), expired, pool_size = 100)
+        assert len(pool.ids) == 100
+        assert (expired.lookup(pool.ids) >= 0).all()
+
+
+def test_few_retractions_still_fill_the_pool(catalog):
+
+    store = CatalogStore(CatalogSnapshot(catalog))
+    history = catalog.ids[:3].tolist()
+
+    # RETRACT EXACTLY THE BEST CANDIDATES OF THE HISTORY
+    best = recommender.candidate_pool(history, catalog, pool_size = 100).ids[:40]
+    store.retract(best.tolist())
+    retracted = store.current.catalog
+
+    pool = recommender.candidate_pool(history, retracted, pool_size = 100)
+    assert len(pool.ids) == 100 and not np.isin(pool.ids, best).any()
+
+
+def test_search_never_returns_retracted_rows(catalog):
+
+    retracted = catalog.with_retracted(np.arange(0, len(catalog), 3))
+    scores, found = retracted.search(catalog.embeddings[:8], 20)
+
+    assert (found >= 0).all() and retracted.active[found].all()
+    assert (np.diff(scores, axis = 1) <= 1e-6).all()
+
+
+def test_sharded_search_fills_k_after_retracting_more_than_k_top_hits():
+
+    sharded = synthetic_catalog(CATALOG_ROWS, dim = CATALOG_DIM)
+    sharded.shards = ShardedIndex.build(sharded, window = "week", live_days = 400)
+    store = CatalogStore(CatalogSnapshot(sharded))
+
+    # RETRACT THE 3k BEST HITS OF THE QUERY INSIDE THE HORIZON , FEWER THAN 3k OTHER ROWS ARE RETRACTED
+    k, horizon_days = 10, 200
+    queries = sharded.embeddings[:1]
+    _, best = sharded.search(queries, 3 * k, horizon_days = horizon_days)
+    store.retract(sharded.ids[best[0]].tolist())
+    retracted = store.current.catalog
+
+    scores, found = retracted.search(queries, k, horizon_days = horizon_days)
+    assert (found >= 0).all() and retracted.active[found].all() and not np.isin(found, best).any()
+
+    # SAME HITS AS AN EXACT SEARCH OVER THE ACTIVE ROWS OF THE HORIZON
+    inside = np.flatnonzero(retracted.active & (sharded.epoch_days >= now_epoch_days() - horizon_days))
+    exact = inside[np.argsort(-(sharded.embeddings[inside] @ queries[0]), kind = "stable")[:k]]
+    assert np.array_equal(np.sort(found[0]), np.sort(exact))
+
+
+@pytest.mark.parametrize("index_kind", ["flat", "hnsw"])
+def test_compaction_drops_expired_vectors_from_the_full_index(monkeypatch, index_kind):
+
+    from app import ingest
+    from test_ingest import batch
+
+    monkeypatch.setattr(ingest, "INDEX_COMPACT_FRACTION", 2.0)     # NO BACKGROUND COMPACTION , IT IS RUN BY HAND BELOW
+    monkeypatch.setattr(ingest, "DELTA_MAX_ROWS", 2)
+    catalog = synthetic_catalog(CATALOG_ROWS, dim = CATALOG_DIM, index_kind = index_kind)
+    catalog.shards = ShardedIndex.build(catalog, window = "week", live_days = 400)
+
+    store = CatalogStore(CatalogSnapshot(catalog))
+    store.expire(60)
+    expired = store.current
+    history = expired.catalog.ids[expired.catalog.active][:5].tolist()
+    before = recommender.candidate_pool(history, expired.catalog, pool_size = 100)
+
+    assert store.compact_index() == expired.catalog.retracted_count
+    compacted = store.current.catalog
+    assert store.current.version == expired.version and store.current.feeds.catalog is compacted
+    assert compacted.faiss_index.ntotal == len(compacted) - compacted.retracted_count and compacted.index_retracted == 0
+
+    after = recommender.candidate_pool(history, compacted, pool_size = 100)
+    assert len(after.ids) == 100 and (compacted.lookup(after.ids) >= 0).all()
+    if index_kind == "flat":
+        assert np.array_equal(np.sort(before.ids), np.sort(after.ids))
+
+    # APPENDS FOLDED INTO THE COMPACTED INDEX KEEP THEIR ROW LABELS , LATER RETRACTIONS ARE MASKED AGAIN
+    articles, vectors = batch(930000, 5)
+    store.append(articles, vectors)
+    appended = store.current.catalog
+    assert appended.delta_index is None and appended.faiss_index.ntotal == compacted.faiss_index.ntotal + 5
+
+    _, found = appended.search(appended.embeddings[len(appended) - 5:], 1)
+    assert np.array_equal(found[:, 0], np.arange(len(appended) - 5, len(appended)))
+
+    store.retract([930000])
+    _, found = store.current.catalog.search(appended.embeddings[[len(appended) - 5]], 10)
+    assert len(appended) - 5 not in found and (found >= 0).all()
@@ -0,0 +1,59 @@
+import numpy as np
+
+from app.catalog import ArticleCatalog
+from app.text_search import TextIndex, stem, tokenize
+
+
+# A COPY OF THE SYNTHETIC CATALOG WHERE A FEW ROWS MENTION A WORD NO OTHER ROW USES
+def with_texts(catalog, texts, rows = None):
+
+    df = catalog.df.copy()
+    for row, (title, summary) in texts.items():
+        df.loc[row, "title"] = title
+        df.loc[row, "summary"] = summary
+
+    rows = len(df) if rows is None else rows
+    return ArticleCatalog(df.iloc[:rows], catalog.faiss_index, embeddings = catalog.embeddings[:rows])
+
+
+def test_stemmer_meets_word_forms():
+
+    assert stem("pertandingan") == stem("bertanding") == "tanding"
+    assert stem("kesehatan") == "sehat"
+    assert stem("berita") == "berita"
+    assert tokenize("Pertandingan yang Café") == ["tanding", "cafe"]
+
+
+def test_title_match_outranks_summary_match(catalog):
+
+    catalog = with_texts(catalog, {10: ("Kriptografi baru", "harga pasar"), 20: ("Pasar baru", "harga kriptografi")})
+    rows, scores = TextIndex.build(catalog).search("kriptografi", catalog, top_k = 10)
+
+    assert rows.tolist() == [10, 20]
+    assert scores[0] > scores[1] > 0
+
+
+def test_retracted_rows_are_skipped(catalog):
+
+    catalog = with_texts(catalog, {10: ("Kriptografi baru", ""), 20: ("Kriptografi lama", "")})
+    index = TextIndex.build(catalog)
+
+    rows, _ = index.search("kriptografi", catalog.with_retracted([10]), top_k = 10)
+    assert rows.tolist() == [20]
+
+
+def test_extend_indexes_new_rows_and_merges_segments(catalog):
+
+    texts = {1995: ("Kriptografi baru", ""), 1999: ("Kriptografi lama", "")}
+    index = TextIndex.build(with_texts(catalog, texts, rows = 1990))
+    index.max_segments = 3
+
+    for end in range(1992, 2001, 2):
+        index = index.extend(with_texts(catalog, texts, rows = end), np.arange(end - 2, end))
+
+    full = with_texts(catalog, texts)
+    rows, _ = index.search("kriptografi", full, top_k = 10)
+
+    assert sorted(rows.tolist()) == [1995, 1999]
+    assert len(index.segments) <= 3 and index.n_docs == len(full)
+    assert np.allclose(index.score_rows("kriptografi", rows), index.search("kriptografi", full, top_k = 10)[1])
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from app.ingest import CatalogSnapshot
+from app.trending import DecayedCountMinSketch, SharedTrendingState, TrendingTracker
+
+
+HALF_LIFE = 3600.0
+T0 = 1_700_000_000.0
+
+
+def test_counts_halve_every_half_life():
+
+    sketch = DecayedCountMinSketch(width = 1024, half_life = HALF_LIFE, now = T0)
+    sketch.add([7] * 8, [T0] * 8)
+
+    assert sketch.estimate([7], now = T0)[0] == pytest.approx(8)
+    assert sketch.estimate([7], now = T0 + HALF_LIFE)[0] == pytest.approx(4)
+    assert sketch.estimate([7], now = T0 + 3 * HALF_LIFE)[0] == pytest.approx(1)
+
+
+def test_rebase_keeps_estimates():
+
+    sketch = DecayedCountMinSketch(width = 1024, half_life = HALF_LIFE, now = T0)
+    sketch.add([1, 1, 2], [T0, T0 + 100, T0 + 200])
+    before = sketch.estimate([1, 2], now = T0 + 5000)
+
+    sketch.rebase(T0 + 4000)
+    assert np.allclose(sketch.estimate([1, 2], now = T0 + 5000), before)
+
+
+def test_recent_views_outrank_older_ones(catalog):
+
+    tracker = TrendingTracker(DecayedCountMinSketch(width = 4096, half_life = HALF_LIFE, now = T0), top_n = 20)
+    old, recent = int(catalog.ids[0]), int(catalog.ids[1])
+
+    # 10 VIEWS FOUR HALF-LIVES AGO (~0.6 NOW) LOSE TO 2 VIEWS NOW
+    tracker.record([old] * 10, now = T0)
+    tracker.record([recent] * 2, now = T0 + 4 * HALF_LIFE)
+    tracker.refresh(CatalogSnapshot(catalog), now = T0 + 4 * HALF_LIFE)
+
+    ids, views = tracker.feed(top_k = 20)
+    assert ids[:2].tolist() == [recent, old]
+    assert views[0] == pytest.approx(2) and views[1] == pytest.approx(10 / 16)
+    assert len(ids) == 20 and (views[2:] == 0).all()      # PADDED WITH THE CONFIDENCE + FRESHNESS BASELINE
+
+
+def test_workers_sharing_a_file_rank_the_same_counts(catalog, tmp_path):
+
+    snapshot = CatalogSnapshot(catalog)
+    workers = [TrendingTracker(DecayedCountMinSketch(width = 4096, half_life = HALF_LIFE, now = T0), top_n = 20, capacity = 2,
+                               shared = SharedTrendingState(tmp_path / "trending.sqlite")) for _ in range(2)]
+    first, second, third = (int(article_id) for article_id in catalog.ids[:3])
+
+    workers[0].record([first] * 3 + [second], now = T0)
+    workers[1].record([second] * 3 + [third] * 2, now = T0 + 60)
+    for worker in workers:
+        worker.refresh(snapshot, now = T0 + 60)
+    workers[0].refresh(snapshot, now = T0 + 60)        # PICKS UP THE SECOND WORKER'S VIEWS
+
+    feeds = [worker.feed(top_k = 3) for worker in workers]
+    assert feeds[0][0].tolist() == feeds[1][0].tolist() == [second, first, third]
+    assert np.allclose(feeds[0][1], feeds[1][1]) and feeds[0][1][0] == pytest.approx(4, rel = 0.01)
+    assert workers[0].views == workers[1].views == 9